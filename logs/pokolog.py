@@ -1,7 +1,8 @@
 import logging
-from logging.handlers import RotatingFileHandler
-import os
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import os, queue, atexit
 from enum import Enum
+from src.config import LoggingPars
 
 class ScriptIdentifier(Enum):
     SUMMARIZER = "AI_SUMMARIZER"
@@ -13,11 +14,27 @@ class ScriptIdentifier(Enum):
     AHSS = "AHSS_SEARCH_TOOL"
     SCIHUB = "SCIHUB_DOWNLOADER"
     TOKENCOUNTER ="TOKEN_COUNTER"
+    RATELIMITER = "RATE_LIMITER"
+    LLMCACHE = "LLM_CACHE"
+    APICLIENTS = "API_CLIENTS"
+    PDFEXTRACTOR = "PDF_EXTRACTOR"
+    RETRYPOLICY = "RETRY_POLICY"
+    TELEMETRY = "LLM_TELEMETRY"
     
 
 class PokoLogger:
+    """
+    Logger of all scripts. In queue_logging mode the calling thread only puts the record in a queue and
+    a QueueListener thread writes it to the log files, so the agents never wait for the disk.
+    Records under the level of their script are dropped before a record is built,
+    messages over max_message_length characters are cut.
+    """
     _instance = None
     _logger = None
+    _listener = None
+    _levels = {}
+    _default_level = logging.INFO
+    _max_length = 0
 
     def __new__(cls):
         if cls._instance is None:
@@ -32,9 +49,16 @@ class PokoLogger:
     @classmethod
     def _setup_logger(cls):
         try:
+            pars = LoggingPars()
             os.makedirs('logs', exist_ok=True)
+            cls._default_level = logging.getLevelName(pars.level.upper())
+            cls._levels = {ScriptIdentifier[name].value: logging.getLevelName(level.upper())
+                           for name, level in pars.script_levels.items()}
+            cls._max_length = pars.max_message_length
             cls._logger = logging.getLogger('PokoScribe')
-            cls._logger.setLevel(logging.INFO)
+            # the levels per script are checked in _log, the logger lets through the lowest of them
+            cls._logger.setLevel(min([cls._default_level] + list(cls._levels.values())))
+            cls._logger.propagate = False
 
             formatter = logging.Formatter(
                 '%(asctime)s - [%(script_id)s] - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
@@ -44,30 +68,51 @@ class PokoLogger:
             # Main log handler
             main_handler = RotatingFileHandler(
                 'logs/pokoscribe.log',
-                maxBytes=10000000,
-                backupCount=5
+                maxBytes=pars.max_bytes,
+                backupCount=pars.backup_count
             )
             main_handler.setFormatter(formatter)
-            cls._logger.addHandler(main_handler)
 
             # Error log handler
             error_handler = RotatingFileHandler(
                 'logs/pokoscribe_errors.log',
-                maxBytes=10000000,
-                backupCount=5
+                maxBytes=pars.max_bytes,
+                backupCount=pars.backup_count
             )
             error_handler.setFormatter(formatter)
             error_handler.setLevel(logging.WARNING)
-            cls._logger.addHandler(error_handler)
+
+            if pars.queue_logging:
+                log_queue = queue.SimpleQueue()
+                cls._logger.addHandler(QueueHandler(log_queue))
+                cls._listener = QueueListener(log_queue, main_handler, error_handler, respect_handler_level=True)
+                cls._listener.start()
+                atexit.register(cls.shutdown)
+            else:
+                cls._logger.addHandler(main_handler)
+                cls._logger.addHandler(error_handler)
         except Exception as e:
             print(f"Failed to setup logger: {e}")
             raise
 
+    @classmethod
+    def shutdown(cls):
+        """Write the records left in the queue and stop the listener thread"""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+
     def _log(self, level, script_id, message):
         if not self._logger:
             self._setup_logger()
+        if level < self._levels.get(script_id, self._default_level):
+            return
+        message = str(message)
+        if self._max_length and len(message) > self._max_length:
+            message = f"{message[:self._max_length]}... [{len(message) - self._max_length} characters cut]"
         extra = {'script_id': script_id}
-        self._logger.log(level, message, extra=extra)
+        # stacklevel 3 reports the file and line of the caller of info/error/..., not of this module
+        self._logger.log(level, message, extra=extra, stacklevel=3)
 
     def info(self, script_id: ScriptIdentifier, message: str):
         self._log(logging.INFO, script_id.value, message)
@@ -79,4 +124,4 @@ class PokoLogger:
         self._log(logging.WARNING, script_id.value, message)
 
     def debug(self, script_id: ScriptIdentifier, message: str):
-        self._log(logging.DEBUG, script_id.value, message)
\ No newline at end of file
+        self._log(logging.DEBUG, script_id.value, message)
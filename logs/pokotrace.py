@@ -0,0 +1,205 @@
+import os, json, time, uuid, queue, atexit, threading, functools, contextvars
+from contextlib import contextmanager
+from src.config import LoggingPars
+
+"""
+Lightweight tracing of the pipeline stages. A span measures one piece of work (a stage, a pdf, a batch,
+an API call, a db write, a file append) and can carry attributes like file, batch, bytes and tokens.
+Spans opened inside another span are its children, also in worker threads when the work is submitted with
+in_current_span(). Every finished span is one JSON line in trace_file (logs/pokoscribe_trace.jsonl),
+written by a background thread. All spans of a process share one run id. The trace file is rotated like the
+log files, at max_bytes to trace_file.1 ... trace_file.<backup_count>.
+python src/tools/trace_report.py prints the flame-style breakdown of a run.
+
+Usage:
+    with span('summarize_pdf', file=pdf_file) as s:
+        text = extract(pdf_file)
+        s.set(bytes=len(text))
+    pool.submit(in_current_span(work), batch)
+"""
+
+RUN_ID = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+_current = contextvars.ContextVar('pokotrace_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'attrs', 'start', 'wall_start')
+
+    def __init__(self, name: str, parent_id, attrs: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+
+    def set(self, **attrs) -> None:
+        """Add attributes known only at the end of the work (bytes, tokens, pages...)"""
+        self.attrs.update(attrs)
+
+    def add(self, **counts) -> None:
+        """Add to numeric attributes, for work done in several steps"""
+        for key, value in counts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + (value or 0)
+
+
+class _NoSpan:
+    """Stand-in when tracing is disabled"""
+    def set(self, **attrs) -> None:
+        pass
+
+    def add(self, **counts) -> None:
+        pass
+
+
+class TraceWriter:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(TraceWriter, cls).__new__(cls)
+                pars = LoggingPars()
+                cls._instance.enabled = pars.trace_enabled
+                cls._instance.path = pars.trace_file
+                cls._instance.max_bytes = pars.max_bytes
+                cls._instance.backup_count = pars.backup_count
+                cls._instance.queue = queue.SimpleQueue()
+                cls._instance.thread = None
+        return cls._instance
+
+    def write(self, record: dict) -> None:
+        self.queue.put(record)
+        if self.thread is None:
+            with self._lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="pokotrace", daemon=True)
+                    self.thread.start()
+                    atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            lines = [record]
+            # write everything that is already queued with one append
+            while True:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._append(lines)
+                    return
+                lines.append(record)
+            self._append(lines)
+
+    def _append(self, records: list) -> None:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            chunk = []
+            for record in records:
+                line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+                length = len(line.encode('utf-8'))
+                if self.max_bytes and size + length > self.max_bytes and (size or chunk):
+                    self._write(chunk)
+                    self._rotate()
+                    size, chunk = 0, []
+                chunk.append(line)
+                size += length
+            self._write(chunk)
+        except Exception as e:
+            print(f"Failed to write trace: {e}")
+
+    def _write(self, lines: list) -> None:
+        if lines:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+
+    def _rotate(self) -> None:
+        """Same rollover as RotatingFileHandler, only the writer thread calls it"""
+        if not os.path.exists(self.path):
+            return
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def close(self) -> None:
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    writer = TraceWriter()
+    if not writer.enabled:
+        yield _NoSpan()
+        return
+    parent = _current.get()
+    current = Span(name, parent.span_id if parent else None, attrs)
+    token = _current.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        record = {
+            'run_id': RUN_ID,
+            'span_id': current.span_id,
+            'parent_id': current.parent_id,
+            'name': name,
+            'start': round(current.wall_start, 6),
+            'duration_ms': round((time.perf_counter() - current.start) * 1000, 3),
+            'thread': threading.current_thread().name,
+            'pid': os.getpid(),
+        }
+        record.update(current.attrs)
+        if error:
+            record['error'] = error[:500]
+        writer.write(record)
+
+
+def traced(name: str = None, **attrs):
+    """Decorator that runs the function in a span named after it"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    return _current.get() or _NoSpan()
+
+
+def in_current_span(func):
+    """
+    func bound to the span that is open now, for work submitted to a thread pool:
+    the spans of the worker thread become children of this span
+    """
+    parent = _current.get()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
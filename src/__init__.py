@@ -0,0 +1,40 @@
+"""
+Library surface of PokoScribe. The agents and tools are loaded on first access (PEP 562),
+so `import src` or `from src import DeepSeekOutliner` only imports the modules that are used.
+
+Usage:
+    from src import DeepSeekChapterMaker
+    DeepSeekChapterMaker().make_chapter()
+"""
+import importlib
+
+_exports = {
+    'PDFSummarizer': 'src.agents.ai_summarizer',
+    'DeepSeekOutliner': 'src.agents.ai_outliner',
+    'ChatGPTOutliner': 'src.agents.ai_outliner',
+    'DeepSeekChapterMaker': 'src.agents.chapter_maker',
+    'ChatGPTChapterMaker': 'src.agents.chapter_maker',
+    'AHSSMain': 'src.tools.ahss',
+    'SciHubDler': 'src.tools.sci_hub_dler',
+    'TokenCounter': 'src.tools.token_counter',
+    'create_biblio': 'src.tools.create_biblio',
+    'GetSources': 'src.pokoscribe.automation_get_resources',
+    'AIBotSummarizer': 'src.pokoscribe.automation_agents',
+    'AIOutlinerAgent': 'src.pokoscribe.automation_agents',
+    'AIBotChapterMaker': 'src.pokoscribe.automation_agents',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f"module 'src' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,6 +1,5 @@
-import os, sys
-from openai import OpenAI
-import google.generativeai as genai
+import os, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict
 from dotenv import load_dotenv
 from pathlib import Path
@@ -9,13 +8,27 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 from logs.pokolog import PokoLogger, ScriptIdentifier
-from src.tools.token_counter import *
-from src.config import *
-from src.db_ai.ai_db_manager import *
+from logs.pokotrace import span, traced, current_span, in_current_span
+from src.tools.token_counter import TokenCounter
+from src.config import SystemPars, DeepSeekPars, ChatGPTPars
+from src.db_ai.ai_db_manager import OutlineDb, CheckpointDb
+from src.tools.rate_limiter import RateLimiter, estimate_tokens
+from src.tools.llm_cache import LLMCache
+from src.tools.api_clients import ApiClients
+from src.tools.tree_reduce import tree_reduce
+from src.tools.retry_policy import RetryPolicy
+from src.tools.llm_stream import stream_chat, part_file_path
+from src.tools.llm_telemetry import LLMTelemetry, usage_tokens
 
 logger = PokoLogger()
+rate_limiter = RateLimiter()
+llm_cache = LLMCache()
+api_clients = ApiClients()
+telemetry = LLMTelemetry()
 load_dotenv('.env')
 
+OUTLINE_FILE = 'resources/output_of_ai/outline.txt'
+
 
 class BatchOutliner:
     def __init__(self):
@@ -25,16 +38,21 @@ class BatchOutliner:
             self.summary_file = sys_params.big_text_file
             self.token_limit = sys_params.token_limit
             self.cached_responses = []
+            self.workers = sys_params.outline_workers
+            self.retry_policy = RetryPolicy()
+            self.synthesis_workers = sys_params.synthesis_workers
+            self.stream_responses = sys_params.stream_responses
 
             # Initialize token counter
-            self.token_count = TokenCounter().count_text(self.summary_file)['tokens']
+            token_counter = TokenCounter()
+            self.token_count = token_counter.count_text(self.summary_file)['tokens']
             
             # Load prompt content
             self._load_prompt_files(sys_params)
             
             # Split text into batches
-            full_text = TokenCounter().safe_read_text(self.summary_file)
-            self.batches = self._split_into_batches(full_text)
+            full_text = token_counter.safe_read_text(self.summary_file)
+            self.batches = self._split_into_batches(full_text, token_counter)
             
             logger.info(ScriptIdentifier.OUTLINER, 
                        f"Split text into {len(self.batches)} batches")
@@ -74,33 +92,23 @@ class BatchOutliner:
             logger.error(ScriptIdentifier.OUTLINER, f"Error reading {path}: {e}")
             raise
 
-    def _split_into_batches(self, text):
+    def _split_into_batches(self, text, token_counter):
         try:
             """Split text into token-limited batches"""
-            batches, current_batch, current_tokens = [], "", 0
-            for paragraph in text.split('\n\n'):
-                para_tokens = TokenCounter().count_tokens(paragraph)
-                if current_tokens + para_tokens > self.token_limit:
-                    batches.append(current_batch)
-                    current_batch, current_tokens = paragraph, para_tokens
-                else:
-                    current_batch += f"\n\n{paragraph}" if current_batch else paragraph
-                    current_tokens += para_tokens
-            if current_batch:
-                batches.append(current_batch)
-            return batches
+            return token_counter.split_into_batches(text, self.token_limit)
         except Exception as e:
             logger.error(ScriptIdentifier.OUTLINER, f"Error splitting text into batches: {e}")
             raise
 
     def _write_output(self, content, prefix, separator_length=20):
-        """Universal method for writing output"""
+        """Universal method for writing output, raises when the file could not be written"""
         try:
-            with open('resources/output_of_ai/outline.txt', 'a', encoding='utf-8') as f:
+            with span('file_append', file=OUTLINE_FILE, bytes=len(content)), open(OUTLINE_FILE, 'a', encoding='utf-8') as f:
                 f.write(f"\n\n{'-'*separator_length}\n\n{prefix}\n{content}")
             logger.info(ScriptIdentifier.OUTLINER, f"{prefix} written to file")
         except Exception as e:
             logger.error(ScriptIdentifier.OUTLINER, f"Error writing output: {e}")
+            raise
 
     def _create_messages(self, prompt_content: str) -> List[Dict[str, str]]:
         """Create standardized message format for API calls"""
@@ -112,8 +120,10 @@ class BatchOutliner:
         else:  # ChatGPTOutliner
             return [{"role": "user", "content": prompt_content}]
 
-    def _process_api_call(self, prompt: str):
-        """Handle API communication with error management"""
+    def _process_api_call(self, prompt: str, label: str = "call") -> str:
+        """Handle API communication with error management, returns the content of the answer"""
+        stage = 'outline_synthesis' if label == 'synthesis' else 'outline_batch'
+        started = None
         try:
             params = {
                 "messages": self._create_messages(prompt),
@@ -126,50 +136,147 @@ class BatchOutliner:
                 params["max_tokens"] = self.aiparameters.max_tokens
             else:  # ChatGPTOutliner
                 params["max_completion_tokens"] = self.aiparameters.max_tokens
-                
-            return self.client.chat.completions.create(**params)
+
+            # identical requests are answered from the local cache
+            cache_key = llm_cache.make_key(self.provider, params["model"],
+                                           {k: v for k, v in params.items() if k != "messages"}, params["messages"])
+            content = llm_cache.get(cache_key)
+            if content is not None:
+                logger.info(ScriptIdentifier.OUTLINER, "Answer served from LLM cache")
+                telemetry.record(stage, self.provider, params["model"], cache_hit=True)
+                return content
+
+            rate_limiter.acquire(self.provider, tokens=estimate_tokens(prompt, self.aiparameters.max_tokens))
+            started = time.perf_counter()
+            if self.stream_responses:
+                content, stats = stream_chat(self.client, params, part_file_path(OUTLINE_FILE, label, prompt),
+                                             ScriptIdentifier.OUTLINER)
+                telemetry.record(stage, self.provider, params["model"], started,
+                                 (stats['prompt_tokens'], stats['output_tokens']), stats['ttft'])
+            else:
+                response = self.client.chat.completions.create(**params)
+                content = response.choices[0].message.content
+                telemetry.record(stage, self.provider, params["model"], started, usage_tokens(response))
+            rate_limiter.report_success(self.provider)
+            llm_cache.put(cache_key, content, self.provider, params["model"])
+            return content
             
         except Exception as e:
+            rate_limiter.report_error(self.provider, e)
+            if started is not None:
+                telemetry.record(stage, self.provider, self.aiparameters.model, started, error=e)
             logger.error(ScriptIdentifier.OUTLINER, f"API call failed: {e}")
             raise
 
+    @traced('outline_batch')
+    def _outline_batch(self, idx: int, batch: str, modelparams: dict, checkpoints: CheckpointDb) -> tuple:
+        """
+        Outline of one batch, transient errors are retried by the retry policy. Runs in the worker threads.
+        Returns (content, input_hash), input_hash is None for a batch loaded from the checkpoints and content
+        is None on failure. The new outlines are saved by _save_batch in batch order.
+        """
+        prompt = f"{self.batch_prompt_text}\n{batch}"
+        current_span().set(batch=idx, bytes=len(prompt))
+        input_hash = checkpoints.input_hash(self.provider, modelparams, prompt)
+        content = checkpoints.load('outline_batch', input_hash, idx)
+        if content is not None:
+            current_span().set(checkpoint=True)
+            logger.info(ScriptIdentifier.OUTLINER, f"Batch {idx}/{len(self.batches)} already done, loaded from checkpoint")
+            return content, None
+
+        logger.info(ScriptIdentifier.OUTLINER, 
+                  f"Processing batch {idx}/{len(self.batches)}")
+        try:
+            content = self.retry_policy.call(self.provider, lambda: self._process_api_call(prompt, f"batch {idx}"),
+                                             ScriptIdentifier.OUTLINER, f"batch {idx}")
+        except Exception as e:
+            logger.error(ScriptIdentifier.OUTLINER, f"Batch {idx} failed: {e}")
+            return None, None
+        return content, input_hash
+
+    def _save_batch(self, content: str, input_hash, idx: int, modelparams: dict, checkpoints: CheckpointDb) -> None:
+        """
+        Save a new batch outline to the outlines table and outline.txt, then to the checkpoints, in batch order.
+        The checkpoint comes last, a batch that did not reach outline.txt is outlined again by the next run.
+        """
+        if input_hash is None:
+            return
+        try:
+            OutlineDb().insert_outline(content, 
+                                       SystemPars().project_name, 
+                                       modelparams["model"], 
+                                       modelparams["parameters"],
+                                       f"Batch Outline {idx}")
+            self._write_output(content, f"Batch Outline {idx}", 10)
+            checkpoints.save('outline_batch', input_hash, idx, content)
+        except Exception as e:
+            logger.error(ScriptIdentifier.OUTLINER, f"Batch {idx} could not be saved: {e}")
+
     def outline_it(self):
-        """Main processing pipeline"""
-        self.cached_responses = []
+        """
+        Main processing pipeline. The batches are outlined by outline_workers threads, the outlines are written
+        and synthesized in batch order. Batches finished in an earlier run are taken from the checkpoints.
+        """
         modelparams = self.model_info()
-        for idx, batch in enumerate(self.batches, 1):
-            try:
-                logger.info(ScriptIdentifier.OUTLINER, 
-                          f"Processing batch {idx}/{len(self.batches)}")
-                prompt = f"{self.batch_prompt_text}\n{batch}"
-                response = self._process_api_call(prompt)
-                content = response.choices[0].message.content
-                self.cached_responses.append(content)
-                OutlineDb().insert_outline(content, 
-                                           SystemPars().project_name, 
-                                           modelparams["model"], 
-                                           modelparams["parameters"],
-                                           f"Batch Outline {idx}")
-                
-                self._write_output(content, f"Batch Outline {idx}", 10)
-            except Exception as e:
-                logger.error(ScriptIdentifier.OUTLINER, f"Batch {idx} failed: {e}")
+        checkpoints = CheckpointDb()
+        results = [None] * len(self.batches)
+        hashes = [None] * len(self.batches)
+        done = [False] * len(self.batches)
+        next_to_write = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="outliner") as pool:
+            futures = {pool.submit(in_current_span(self._outline_batch), idx, batch, modelparams, checkpoints): idx - 1
+                       for idx, batch in enumerate(self.batches, 1)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i], hashes[i] = future.result()
+                except Exception as e:
+                    logger.error(ScriptIdentifier.OUTLINER, f"Batch {i + 1} failed: {e}")
+                done[i] = True
+                # save the finished outlines in batch order as soon as all earlier batches are done
+                while next_to_write < len(self.batches) and done[next_to_write]:
+                    if results[next_to_write] is not None:
+                        self._save_batch(results[next_to_write], hashes[next_to_write], next_to_write + 1,
+                                         modelparams, checkpoints)
+                    next_to_write += 1
+
+        self.cached_responses = [content for content in results if content is not None]
 
+        if len(self.cached_responses) < len(self.batches):
+            logger.warning(ScriptIdentifier.OUTLINER, f"{len(self.batches) - len(self.cached_responses)} batches failed, "
+                           "run again to process only the missing batches and the synthesis")
         if self.cached_responses:
             logger.info(ScriptIdentifier.OUTLINER, "Final synthesis in progress")
             try:
-                synthesis_prompt = f"{self.synthesis_prompt_text}\n{''.join(self.cached_responses)}"
-                response = self._process_api_call(synthesis_prompt)
-                OutlineDb().insert_outline(response.choices[0].message.content,
-                                           SystemPars().project_name, 
-                                           modelparams["model"], 
-                                           modelparams["parameters"], 
-                                           "Final Outline")
-                self._write_output(response.choices[0].message.content, "Final Outline")
-                logger.info(ScriptIdentifier.OUTLINER, "Final synthesis completed")
+                input_hash = checkpoints.input_hash(self.provider, modelparams, self.synthesis_prompt_text, self.cached_responses)
+                if checkpoints.load('outline_synthesis', input_hash) is not None:
+                    logger.info(ScriptIdentifier.OUTLINER, "Final outline already done, loaded from checkpoint")
+                else:
+                    # outlines that do not fit in one synthesis prompt are synthesized in groups first
+                    final_outline = tree_reduce(
+                        self.cached_responses,
+                        lambda parts: self.retry_policy.call(
+                            self.provider,
+                            lambda: self._process_api_call(f"{self.synthesis_prompt_text}\n{''.join(parts)}", "synthesis"),
+                            ScriptIdentifier.OUTLINER, "synthesis"),
+                        self.token_limit,
+                        TokenCounter().count_tokens(self.synthesis_prompt_text),
+                        self.synthesis_workers,
+                        ScriptIdentifier.OUTLINER
+                    )
+                    OutlineDb().insert_outline(final_outline,
+                                               SystemPars().project_name, 
+                                               modelparams["model"], 
+                                               modelparams["parameters"], 
+                                               "Final Outline")
+                    self._write_output(final_outline, "Final Outline")
+                    checkpoints.save('outline_synthesis', input_hash, 0, final_outline)
+                    logger.info(ScriptIdentifier.OUTLINER, "Final synthesis completed")
             except Exception as e:
                 logger.error(ScriptIdentifier.OUTLINER, f"Final synthesis failed: {e}")
 
+        llm_cache.log_stats(ScriptIdentifier.OUTLINER)
+
 
 class DeepSeekOutliner(BatchOutliner):
     def __init__(self):
@@ -178,10 +285,8 @@ class DeepSeekOutliner(BatchOutliner):
         try:
             super().__init__()
             self.aiparameters = DeepSeekPars()
-            self.client = OpenAI(
-                api_key=os.getenv('DEEPSEEK_API_KEY'),
-                base_url="https://api.deepseek.com"
-            )
+            self.provider = 'deepseek'
+            self.client = api_clients.openai_client(self.provider, os.getenv('DEEPSEEK_API_KEY'))
             logger.info(ScriptIdentifier.OUTLINER, "DeepSeekOutliner ready")
         except Exception as e:
             logger.error(ScriptIdentifier.OUTLINER, f"Initialization failed: {e}")
@@ -195,7 +300,8 @@ class ChatGPTOutliner(BatchOutliner):
         try:
             super().__init__()
             self.aiparameters = ChatGPTPars()
-            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+            self.provider = 'openai'
+            self.client = api_clients.openai_client(self.provider, os.getenv('OPENAI_API_KEY'))
             logger.info(ScriptIdentifier.OUTLINER, "ChatGPTOutliner ready")
         except Exception as e:
             logger.error(ScriptIdentifier.OUTLINER, f"Initialization failed: {e}")
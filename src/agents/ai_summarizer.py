@@ -1,4 +1,5 @@
-import os, shutil, PyPDF2, time, tiktoken, sys, re
+import os, shutil, time, sys, re, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add the parent directory to the sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -11,16 +12,27 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
 
-from openai import OpenAI
 from dotenv import load_dotenv
 from typing import List
-from src.config import *
-import google.generativeai as genai
-from src.db_ai.ai_db_manager import *
+from src.config import (SystemPars, ChatGPTPars, DeepSeekPars, GeminiPars,
+                        ChatGPTPdfSummerizerPars, DeepSeekSummerizerPars, GeminiSummerizerPars)
+from src.db_ai.ai_db_manager import SaveSummary
+from src.tools.rate_limiter import RateLimiter, estimate_tokens
+from src.tools.llm_cache import LLMCache
+from src.tools.api_clients import ApiClients
+from src.tools.token_counter import get_encoding
+from src.tools.pdf_extractor import PDFExtractor
+from src.tools.llm_stream import stream_chat, stream_gemini, part_file_path
+from src.tools.llm_telemetry import LLMTelemetry, usage_tokens
 
 from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import span, traced, current_span, in_current_span
 
 logger = PokoLogger()
+rate_limiter = RateLimiter()
+llm_cache = LLMCache()
+api_clients = ApiClients()
+telemetry = LLMTelemetry()
 
 model_lists = SystemPars().model_lists
 
@@ -72,14 +84,7 @@ class PDFReader:
     def read(self):
         try:
             logger.info(ScriptIdentifier.SUMMARIZER, f"Reading {self.file_path}...")
-            with open(self.file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ''
-                for page in reader.pages:
-                    extracted_text = page.extract_text()
-                    if extracted_text:
-                        # Clean and normalize text
-                        text += extracted_text.encode('utf-8', errors='ignore').decode('utf-8')
+            text = PDFExtractor().extract(self.file_path)['text']
             
             if not text.strip():
                 raise ValueError("No text extracted from PDF")
@@ -94,6 +99,7 @@ class AISummarizer:
     def __init__(self, api_key):
         try:
             self.api_key = api_key
+            self.stream_responses = summparameters.stream_responses
             
             # Convert to absolute paths
             prompt_path = os.path.abspath(summparameters.prompts_summarization)
@@ -162,7 +168,7 @@ class AISummarizer:
             raise
       
 
-    def summarize(self, text, worked_model):
+    def summarize(self, text, worked_model, stream_file=None, label='summary'):
         
         logger.info(ScriptIdentifier.SUMMARIZER, "SESSION INFO:")
         logger.info(ScriptIdentifier.SUMMARIZER, f"using source model: {worked_model}")
@@ -171,7 +177,7 @@ class AISummarizer:
         logger.info(ScriptIdentifier.SUMMARIZER, "temperature: {aiparameters.temperature}")
         logger.info(ScriptIdentifier.SUMMARIZER, f"role system: {aiparameters.role_system}")
         logger.info(ScriptIdentifier.SUMMARIZER, f"role user: {aiparameters.role_user}")
-        logger.info(ScriptIdentifier.SUMMARIZER, f"prompt: {self.prompt_draft}")
+        logger.debug(ScriptIdentifier.SUMMARIZER, f"prompt: {self.prompt_draft}")
 
         model_details = (
         f"Model: {aiparameters.model} | "
@@ -181,25 +187,38 @@ class AISummarizer:
         f"User role: {aiparameters.role_user}"
         )
         
-        self.prompt_draft = f"{self.prompt_draft} , {self.citation_sum}"
+        # built per call, appending the citation to self.prompt_draft would grow the prompt on every chunk
+        prompt_draft = f"{self.prompt_draft} , {self.citation_sum}"
 
         todbdic["projectname"] = summparameters.project_name
-        todbdic["prompt"] = self.prompt_draft
+        todbdic["prompt"] = prompt_draft
         todbdic["type_of_prompt"] = 'summarization'
         todbdic["model"] = worked_model
         todbdic["modeldetails"] = model_details
 
+        # identical requests (model, parameters, role, prompt and text) are answered from the local cache
+        cache_key = llm_cache.make_key(worked_model, aiparameters.model, vars(aiparameters),
+                                       [self.role_draft, f"{prompt_draft}: {text}"])
+        cached_summary = llm_cache.get(cache_key)
+        if cached_summary is not None:
+            logger.info(ScriptIdentifier.SUMMARIZER, f"Summary served from LLM cache")
+            telemetry.record('summary', worked_model, aiparameters.model, cache_hit=True)
+            return cached_summary
+        started = None
+
         # change the schema depending on the model
         if worked_model == 'openai':
             try:
-                prompt = f"{self.prompt_draft}: {text}"
+                prompt = f"{prompt_draft}: {text}"
                 logger.info(ScriptIdentifier.SUMMARIZER, f"Prompt created for OpenAI")
             except Exception as e:
                 logger.error(ScriptIdentifier.SUMMARIZER, f"Error creating prompt: {str(e)}")
                 return None
             try:
-                self.client = OpenAI(api_key=self.api_key)
-                response = self.client.chat.completions.create(
+                rate_limiter.acquire(worked_model, tokens=estimate_tokens(prompt, aiparameters.max_tokens))
+                client = api_clients.openai_client(worked_model, self.api_key)
+                started = time.perf_counter()
+                params = dict(
                     messages=[
                         {"role": f"{aiparameters.role_system}", "content": f"{self.role_draft}"},
                         {"role": f"{aiparameters.role_user}", "content": prompt}
@@ -208,13 +227,27 @@ class AISummarizer:
                     max_tokens=aiparameters.max_tokens,
                     temperature=aiparameters.temperature,
                 )
+                if self.stream_responses:
+                    streamed, stats = stream_chat(client, params,
+                                                  part_file_path(stream_file or summparameters.big_text_file, label, prompt),
+                                                  ScriptIdentifier.SUMMARIZER)
+                    telemetry.record('summary', worked_model, aiparameters.model, started,
+                                     (stats['prompt_tokens'], stats['output_tokens']), stats['ttft'])
+                else:
+                    response = client.chat.completions.create(**params)
+                    telemetry.record('summary', worked_model, aiparameters.model, started, usage_tokens(response))
+                rate_limiter.report_success(worked_model)
                 logger.info(ScriptIdentifier.SUMMARIZER, f"OpenAI response received without problems")
             except Exception as e:
+                rate_limiter.report_error(worked_model, e)
+                if started is not None:
+                    telemetry.record('summary', worked_model, aiparameters.model, started, error=e)
                 logger.error(ScriptIdentifier.SUMMARIZER, f"Error in OpenAI workflow: {str(e)}")
                 return None
             
             try:
-                summary = response.choices[0].message.content.strip()
+                summary = streamed.strip() if self.stream_responses else response.choices[0].message.content.strip()
+                llm_cache.put(cache_key, summary, worked_model, aiparameters.model)
                 return summary
                 
             except Exception as e:
@@ -223,14 +256,16 @@ class AISummarizer:
         
         elif worked_model == 'deepseek':
             try:
-                prompt = f"{self.prompt_draft}: {text}"
+                prompt = f"{prompt_draft}: {text}"
                 logger.info(ScriptIdentifier.SUMMARIZER, f"Prompt created for DeepSeek")
             except Exception as e:
                 logger.error(ScriptIdentifier.SUMMARIZER, f"Error creating prompt: {str(e)}")
                 return None
             try:
-                self.client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
-                response = self.client.chat.completions.create(
+                rate_limiter.acquire(worked_model, tokens=estimate_tokens(prompt, aiparameters.max_tokens))
+                client = api_clients.openai_client(worked_model, self.api_key)
+                started = time.perf_counter()
+                params = dict(
                     messages=[
                         {"role": f"{aiparameters.role_system}", "content": f"{self.role_draft}"},
                         {"role": f"{aiparameters.role_user}", "content": prompt}
@@ -239,12 +274,26 @@ class AISummarizer:
                     max_tokens=aiparameters.max_tokens,
                     temperature=aiparameters.temperature,
                 )
+                if self.stream_responses:
+                    streamed, stats = stream_chat(client, params,
+                                                  part_file_path(stream_file or summparameters.big_text_file, label, prompt),
+                                                  ScriptIdentifier.SUMMARIZER)
+                    telemetry.record('summary', worked_model, aiparameters.model, started,
+                                     (stats['prompt_tokens'], stats['output_tokens']), stats['ttft'])
+                else:
+                    response = client.chat.completions.create(**params)
+                    telemetry.record('summary', worked_model, aiparameters.model, started, usage_tokens(response))
+                rate_limiter.report_success(worked_model)
                 logger.info(ScriptIdentifier.SUMMARIZER, f"DeepSeek response received without problems")
             except Exception as e:
+                rate_limiter.report_error(worked_model, e)
+                if started is not None:
+                    telemetry.record('summary', worked_model, aiparameters.model, started, error=e)
                 logger.error(ScriptIdentifier.SUMMARIZER, f"Error in DeepSeek workflow: {str(e)}")
                 return None
             try:
-                summary = response.choices[0].message.content.strip()
+                summary = streamed.strip() if self.stream_responses else response.choices[0].message.content.strip()
+                llm_cache.put(cache_key, summary, worked_model, aiparameters.model)
                 return summary
             except Exception as e:
                 logger.error(ScriptIdentifier.SUMMARIZER, f"Error in DeepSeek response: {str(e)}")
@@ -266,7 +315,6 @@ class AISummarizer:
                 return "Error: Invalid top_p or top_k values."
             
             try:
-                genai.configure(api_key=self.api_key)
                 generation_config = {
                     "temperature": ttemperature,
                     "top_p": top_p,
@@ -274,30 +322,45 @@ class AISummarizer:
                     "max_output_tokens": aiparameters.max_tokens,
                     "response_mime_type": aiparameters.response_mime_type,
                 }
-                mod = genai.GenerativeModel(
-                    model_name=str(aiparameters.model),
-                    generation_config=generation_config,
-                )
-                prompt = f"{self.prompt_draft}: {text}"
+                mod = api_clients.gemini_model(self.api_key, str(aiparameters.model), generation_config)
+                prompt = f"{prompt_draft}: {text}"
                 chat_session = mod.start_chat(history=[])
                 logger.info(ScriptIdentifier.SUMMARIZER, f"Prompt created for Gemini")
                 try:
-                    response = chat_session.send_message(prompt)
+                    rate_limiter.acquire(worked_model, tokens=estimate_tokens(prompt, aiparameters.max_tokens))
+                    started = time.perf_counter()
+                    if self.stream_responses:
+                        streamed, stats = stream_gemini(chat_session, prompt,
+                                                        part_file_path(stream_file or summparameters.big_text_file, label, prompt),
+                                                        ScriptIdentifier.SUMMARIZER)
+                        telemetry.record('summary', worked_model, aiparameters.model, started,
+                                         (stats['prompt_tokens'], stats['output_tokens']), stats['ttft'])
+                    else:
+                        response = chat_session.send_message(prompt)
+                        telemetry.record('summary', worked_model, aiparameters.model, started, usage_tokens(response))
+                    rate_limiter.report_success(worked_model)
                     logger.info(ScriptIdentifier.SUMMARIZER, f"Message sent to Gemini")
                 except Exception as e:
-                    logger.error(f"Error during send_message: {str(e)}")
+                    rate_limiter.report_error(worked_model, e)
+                    if started is not None:
+                        telemetry.record('summary', worked_model, aiparameters.model, started, error=e)
+                    logger.error(ScriptIdentifier.SUMMARIZER, f"Error during send_message: {str(e)}")
                     raise
                 
-                if not response or not hasattr(response, 'text'):
-                    logger.error(ScriptIdentifier.SUMMARIZER, "No valid response text.")
-                    raise ValueError("No valid response text.")
-                
-                summary = response.text.strip()
+                if self.stream_responses:
+                    summary = streamed.strip()
+                else:
+                    if not response or not hasattr(response, 'text'):
+                        logger.error(ScriptIdentifier.SUMMARIZER, "No valid response text.")
+                        raise ValueError("No valid response text.")
+                    summary = response.text.strip()
                 if not summary:
                     logger.error(ScriptIdentifier.SUMMARIZER, "Empty summary.")
                     raise ValueError("Empty summary.")
                 
-                logger.info(ScriptIdentifier.SUMMARIZER, f"Summary received from Gemini: {summary}")
+                logger.info(ScriptIdentifier.SUMMARIZER, f"Summary received from Gemini ({len(summary)} characters)")
+                logger.debug(ScriptIdentifier.SUMMARIZER, f"Summary received from Gemini: {summary}")
+                llm_cache.put(cache_key, summary, worked_model, aiparameters.model)
                 return summary
 
             except Exception as e:
@@ -334,6 +397,13 @@ class PDFSummarizer:
             os.makedirs(self.to_be_completed_folder, exist_ok=True)
             self.totalfilesprocessed = 0
             self.completedfiles = 0
+            # number of model calls made for every document, chunked documents make one call per chunk
+            self.calls_per_document = {}
+            self.reduce_chunk_summaries = summparameters.reduce_chunk_summaries
+            # number of documents in flight, 1 keeps the sequential processing
+            self.workers = max(1, int(summparameters.summarizer_workers))
+            self._counter_lock = threading.Lock()
+            self._output_lock = threading.Lock()
             logger.info(ScriptIdentifier.SUMMARIZER, "PDFSummarizer initialized successfully.")
 
         except Exception as e:
@@ -341,6 +411,41 @@ class PDFSummarizer:
             raise
 
 
+    def _summarize(self, text, worked_model, pdf_file):
+        """Single model call for a document or a chunk of it, counted per document"""
+        self.calls_per_document[pdf_file] = self.calls_per_document.get(pdf_file, 0) + 1
+        with span('llm_call', provider=worked_model, call='summary'):
+            return self.summarizer.summarize(text, worked_model, self.output_file, os.path.basename(pdf_file))
+
+    def _summarize_chunks(self, tokens, encoding, worked_model, pdf_file):
+        """
+        Map stage for documents over the token limit. Every chunk is summarized exactly once
+        and the chunk summaries keep the order of the document. If reduce_chunk_summaries is
+        enabled the chunk summaries are merged with one more call (reduce stage).
+        """
+        chunksize = self.limittokens
+        chunks = [encoding.decode(tokens[i:i + chunksize]) for i in range(0, len(tokens), chunksize)]
+        chunk_summaries = []
+        for chunknum, chunk in enumerate(chunks, 1):
+            chunksummary = self._summarize(chunk, worked_model, pdf_file)
+            if not chunksummary:
+                logger.error(ScriptIdentifier.SUMMARIZER, f"Error summarizing chunk {chunknum}/{len(chunks)} of {pdf_file}")
+                raise ValueError(f"Chunk {chunknum} of {pdf_file} could not be summarized")
+            chunk_summaries.append(chunksummary)
+        logger.info(ScriptIdentifier.SUMMARIZER, f"Chunk of {len(chunks)} parts of initial file summarized in total.")
+
+        summary = ' '.join(chunk_summaries)
+        if self.reduce_chunk_summaries and len(chunk_summaries) > 1:
+            logger.info(ScriptIdentifier.SUMMARIZER, f"Merging {len(chunk_summaries)} chunk summaries of {pdf_file}...")
+            merged = self._summarize('\n\n'.join(chunk_summaries), worked_model, pdf_file)
+            if merged:
+                summary = merged
+            else:
+                logger.warning(ScriptIdentifier.SUMMARIZER, f"Merging chunk summaries of {pdf_file} failed, using joined chunk summaries")
+        logger.info(ScriptIdentifier.SUMMARIZER, f"Summary of {pdf_file} ready ({len(summary)} characters)")
+        logger.debug(ScriptIdentifier.SUMMARIZER, f"Summary of {pdf_file}:\n{summary}")
+        return summary
+
     def process_pdfs(self, worked_model):
         try:
             pdf_files = [os.path.join(self.input_folder, f) for f in os.listdir(self.input_folder) if f.endswith('.pdf')]
@@ -351,7 +456,7 @@ class PDFSummarizer:
         
         try:
             sess = SaveSummary()
-            sessionid = sess.get_last_session() + 1
+            sessionid = sess.new_session(summparameters.project_name)
             sess.close()
             todbdic["sessionid"] = sessionid
             logger.info(ScriptIdentifier.SUMMARIZER, f"Session ID recieved: {sessionid}")
@@ -359,111 +464,113 @@ class PDFSummarizer:
             logger.error(ScriptIdentifier.SUMMARIZER, f"Error getting session ID: {e}")
             return
 
-        for pdf_file in pdf_files:
-            self.totalfilesprocessed += 1
-            try:
-                logger.info(ScriptIdentifier.SUMMARIZER, f"Processing {pdf_file}...")
-                reader = PDFReader(pdf_file)
-                pdf_text = reader.read()
-
-                # count tokens in the pdf file to determine if it needs to be chunked
-                encoding1 = tiktoken.get_encoding("cl100k_base")
-                tokeninputcount = len(encoding1.encode(pdf_text))
-                logger.info(ScriptIdentifier.SUMMARIZER, f"Token count of {pdf_file}: {tokeninputcount}")
-                if tokeninputcount < self.limittokens: # adjust the limit of tokens per document in parameters of ai
-                   logger.info(ScriptIdentifier.SUMMARIZER, f"Summarizing {pdf_file} (less than {self.limittokens} tokens)...")
-
-                    # Summarize the text using the AI model
-                   summary = self.summarizer.summarize(pdf_text, worked_model)
-                   
-                   #check for output token count
-                   encoding2 = tiktoken.get_encoding("cl100k_base")
-                   tokenoutputcount = len(encoding2.encode(summary))
-                   logger.info(ScriptIdentifier.SUMMARIZER, f"Token count of summary of {pdf_file}: {tokenoutputcount}")
-                   
-                   todbdic["fileeditedname"] = pdf_file
-                   todbdic["tokencountprompt"] = tokeninputcount
-                   todbdic["answer"] = summary
-                   todbdic["tokencountanswer"] = tokenoutputcount
-
-                else:
-                    logger.info(ScriptIdentifier.SUMMARIZER, f"Summarizing {pdf_file} (more than {self.limittokens} tokens, chunking method initiated)...")
-                    tokens = encoding1.encode(pdf_text)
-                    chunks = []
-                    chunk_summaries = []
-                    chunksize = self.limittokens
-                    for i in range(0, len(tokens), chunksize):
-                        try:
-                            chunk = encoding1.decode(tokens[i:i + chunksize])
-                            chunks.append(chunk)
-                            chunknums = 0
-                            for chunk in chunks:
-                                chunksummary = self.summarizer.summarize(chunk, worked_model)
-                                chunk_summaries.append(chunksummary)
-                                chunknums += 1
-                        except Exception as e:
-                            logger.error(ScriptIdentifier.SUMMARIZER, f"Error summarizing using chunk in {chunknums} chunk: {e}")
-                    logger.info(ScriptIdentifier.SUMMARIZER, f"Chunk of{chunknums} parts of initial file summarized in total.")
-                    summary = ' '.join(chunk_summaries)
-                    logger.info(ScriptIdentifier.SUMMARIZER, f"Summary of {pdf_file}:\n{summary}")
-                    encoding2 = tiktoken.get_encoding("cl100k_base")
-                    tokenoutputcount = len(encoding2.encode(summary))
-
-                # Extract text between special markers with regex
-                try:
-                    markers = re.search(r'-?!(.*?)-?!', summary)
-                    if markers:
-                        citation_to_db = markers.group(1)
-                        
-                        logger.info(ScriptIdentifier.SUMMARIZER, f"Citation extracted from summary: {citation_to_db}")
-                except Exception as e:
-                    logger.warning(ScriptIdentifier.SUMMARIZER, f"Error extracting citation from summary: {e}")
-                    citation_to_db = None
-
-
-                todbdic["fileeditedname"] = pdf_file
-                todbdic["tokencountprompt"] = tokeninputcount
-                todbdic["answer"] = summary
-                todbdic["tokencountanswer"] = tokenoutputcount
-                todbdic["citation"] = citation_to_db
-                
-                todatabase = SaveSummary()
-                todatabase.insert_row(todbdic["projectname"], 
-                                      todbdic["sessionid"], 
-                                      todbdic["prompt"], 
-                                      todbdic["fileeditedname"], 
-                                      todbdic["tokencountprompt"], 
-                                      todbdic["answer"], 
-                                      todbdic["tokencountanswer"], 
-                                      todbdic["model"], 
-                                      todbdic["modeldetails"], 
-                                      todbdic["type_of_prompt"],
-                                      todbdic["citation"]
-                                      )
-                todatabase.close()
-
-                with open(self.output_file, 'a', encoding='utf-8') as file:
+        if self.workers <= 1:
+            for pdf_file in pdf_files:
+                self._process_pdf(pdf_file, worked_model)
+        else:
+            # concurrent mode, every worker takes a whole document through extract, tokenize,
+            # summarize, persist and move so the stages of different documents overlap
+            logger.info(ScriptIdentifier.SUMMARIZER, f"Processing PDF files with {self.workers} workers...")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(in_current_span(self._process_pdf), pdf_file, worked_model): pdf_file for pdf_file in pdf_files}
+                for future in as_completed(futures):
                     try:
-                        file.write(f"Summary of {pdf_file}:\n")
-                        clean_summary = summary.encode('utf-8', errors='ignore').decode('utf-8')
-                        # Replace specific problematic characters
-                        clean_summary = clean_summary.replace('\u2192', '->')
-                        file.write(clean_summary + '\n\n')
-                        file.write('----------------------------------------\n\n')
-                        logger.info(ScriptIdentifier.SUMMARIZER, f"Summary of {pdf_file} saved to {self.output_file}")
-                        self.completedfiles += 1
+                        future.result()
                     except Exception as e:
-                        logger.error(ScriptIdentifier.SUMMARIZER, f"Error saving summary of {pdf_file} to {self.output_file}: {e}")
-                
+                        logger.error(ScriptIdentifier.SUMMARIZER, f"Worker failed for {futures[future]}: {e}")
+
+        llm_cache.log_stats(ScriptIdentifier.SUMMARIZER)
 
-                # Move the file to the completed folder
-                shutil.move(pdf_file, os.path.join(self.completed_folder, os.path.basename(pdf_file)))
-                logger.info(ScriptIdentifier.SUMMARIZER, f"{pdf_file} moved to {self.completed_folder} waiting 3 seconds for next file...")
-                time.sleep(5)
+    @traced('summarize_pdf')
+    def _process_pdf(self, pdf_file, worked_model):
+        """Summarize a single PDF, persist the result and move the file to completed or to be completed folder"""
+        current_span().set(file=os.path.basename(pdf_file))
+        with self._counter_lock:
+            self.totalfilesprocessed += 1
+        try:
+            logger.info(ScriptIdentifier.SUMMARIZER, f"Processing {pdf_file}...")
+            reader = PDFReader(pdf_file)
+            pdf_text = reader.read()
+
+            # count tokens in the pdf file to determine if it needs to be chunked
+            encoding = get_encoding()
+            with span('tokenize', bytes=len(pdf_text)) as trace:
+                tokens = encoding.encode(pdf_text)
+                trace.set(tokens=len(tokens))
+            tokeninputcount = len(tokens)
+            logger.info(ScriptIdentifier.SUMMARIZER, f"Token count of {pdf_file}: {tokeninputcount}")
+            if tokeninputcount < self.limittokens: # adjust the limit of tokens per document in parameters of ai
+                logger.info(ScriptIdentifier.SUMMARIZER, f"Summarizing {pdf_file} (less than {self.limittokens} tokens)...")
+
+                # Summarize the text using the AI model
+                summary = self._summarize(pdf_text, worked_model, pdf_file)
+
+                #check for output token count
+                tokenoutputcount = len(encoding.encode(summary))
+                logger.info(ScriptIdentifier.SUMMARIZER, f"Token count of summary of {pdf_file}: {tokenoutputcount}")
+
+            else:
+                logger.info(ScriptIdentifier.SUMMARIZER, f"Summarizing {pdf_file} (more than {self.limittokens} tokens, chunking method initiated)...")
+                summary = self._summarize_chunks(tokens, encoding, worked_model, pdf_file)
+                tokenoutputcount = len(encoding.encode(summary))
+                logger.info(ScriptIdentifier.SUMMARIZER, f"{pdf_file} summarized with {self.calls_per_document[pdf_file]} model calls")
 
+            # Extract text between special markers with regex
+            citation_to_db = None
+            try:
+                markers = re.search(r'-?!(.*?)-?!', summary)
+                if markers:
+                    citation_to_db = markers.group(1)
+                    
+                    logger.info(ScriptIdentifier.SUMMARIZER, f"Citation extracted from summary: {citation_to_db}")
             except Exception as e:
-                logger.error(ScriptIdentifier.SUMMARIZER, f"Error processing {pdf_file}: {e}")
-                # Move the file to the to be completed folder
-                shutil.move(pdf_file, os.path.join(self.to_be_completed_folder, os.path.basename(pdf_file)))
-                logger.warning(ScriptIdentifier.SUMMARIZER, f"{pdf_file} moved to {self.to_be_completed_folder}")
+                logger.warning(ScriptIdentifier.SUMMARIZER, f"Error extracting citation from summary: {e}")
+
+            # per file copy so concurrent workers do not overwrite each other's row
+            row = dict(todbdic)
+            row["fileeditedname"] = pdf_file
+            row["tokencountprompt"] = tokeninputcount
+            row["answer"] = summary
+            row["tokencountanswer"] = tokenoutputcount
+            row["citation"] = citation_to_db
+            
+            todatabase = SaveSummary()
+            todatabase.insert_row(row["projectname"], 
+                                  row["sessionid"], 
+                                  row["prompt"], 
+                                  row["fileeditedname"], 
+                                  row["tokencountprompt"], 
+                                  row["answer"], 
+                                  row["tokencountanswer"], 
+                                  row["model"], 
+                                  row["modeldetails"], 
+                                  row["type_of_prompt"],
+                                  row["citation"]
+                                  )
+            todatabase.close()
+
+            with span('file_append', file=os.path.basename(self.output_file), bytes=len(summary)), \
+                    self._output_lock, open(self.output_file, 'a', encoding='utf-8') as file:
+                try:
+                    file.write(f"Summary of {pdf_file}:\n")
+                    clean_summary = summary.encode('utf-8', errors='ignore').decode('utf-8')
+                    # Replace specific problematic characters
+                    clean_summary = clean_summary.replace('\u2192', '->')
+                    file.write(clean_summary + '\n\n')
+                    file.write('----------------------------------------\n\n')
+                    logger.info(ScriptIdentifier.SUMMARIZER, f"Summary of {pdf_file} saved to {self.output_file}")
+                    with self._counter_lock:
+                        self.completedfiles += 1
+                except Exception as e:
+                    logger.error(ScriptIdentifier.SUMMARIZER, f"Error saving summary of {pdf_file} to {self.output_file}: {e}")
+            
 
+            # Move the file to the completed folder
+            shutil.move(pdf_file, os.path.join(self.completed_folder, os.path.basename(pdf_file)))
+            logger.info(ScriptIdentifier.SUMMARIZER, f"{pdf_file} moved to {self.completed_folder}")
+
+        except Exception as e:
+            logger.error(ScriptIdentifier.SUMMARIZER, f"Error processing {pdf_file}: {e}")
+            # Move the file to the to be completed folder
+            shutil.move(pdf_file, os.path.join(self.to_be_completed_folder, os.path.basename(pdf_file)))
+            logger.warning(ScriptIdentifier.SUMMARIZER, f"{pdf_file} moved to {self.to_be_completed_folder}")
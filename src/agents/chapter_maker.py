@@ -1,8 +1,7 @@
-import os, sys, json
+import os, sys, json, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict
-from openai import OpenAI
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 # Add project root to Python path
@@ -10,13 +9,27 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
 from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import span, traced, current_span, in_current_span
 from src.tools.token_counter import TokenCounter
 from src.config import SystemPars, DeepSeekPars, ChatGPTPars
-from src.db_ai.ai_db_manager import *
+from src.db_ai.ai_db_manager import ChapterDb, CheckpointDb
+from src.tools.rate_limiter import RateLimiter, estimate_tokens
+from src.tools.llm_cache import LLMCache
+from src.tools.api_clients import ApiClients
+from src.tools.tree_reduce import tree_reduce
+from src.tools.retry_policy import RetryPolicy
+from src.tools.llm_stream import stream_chat, part_file_path
+from src.tools.llm_telemetry import LLMTelemetry, usage_tokens
 
 logger = PokoLogger()
+rate_limiter = RateLimiter()
+llm_cache = LLMCache()
+api_clients = ApiClients()
+telemetry = LLMTelemetry()
 load_dotenv('.env')
 
+CHAPTERS_FILE = 'resources/output_of_ai/chapters.txt'
+
 class BatchChapterMaker:
     def __init__(self):
         logger.info(ScriptIdentifier.CHAPTER, "Initializing BatchChapterMaker")
@@ -24,6 +37,9 @@ class BatchChapterMaker:
         self.token_limit = SystemPars().token_limit
         self.batches = []
         self.cached_responses = []
+        self.workers = SystemPars().chapter_workers
+        self.retry_policy = RetryPolicy()
+        self.stream_responses = SystemPars().stream_responses
 
         try:
             self.role_text = self._read_file(SystemPars().role_of_bot_chapter)
@@ -40,73 +56,97 @@ class BatchChapterMaker:
             return f.read()
 
     def _split_text_into_batches(self) -> None:
-        full_text = TokenCounter().safe_read_text(self.summary_file)
-        current_batch = ""
-        current_tokens = 0
-        total_tokens = 0
-
-        for paragraph in full_text.split('\n\n'):
-            paragraph_tokens = TokenCounter().count_tokens(paragraph)
-            total_tokens += paragraph_tokens
-
-            if current_tokens + paragraph_tokens > self.token_limit:
-                self.batches.append(current_batch)
-                current_batch = paragraph
-                current_tokens = paragraph_tokens
-            else:
-                current_batch += "\n\n" + paragraph if current_batch else paragraph
-                current_tokens += paragraph_tokens
-
-        if current_batch:
-            self.batches.append(current_batch)
+        token_counter = TokenCounter()
+        full_text = token_counter.safe_read_text(self.summary_file)
+        batches = token_counter.split_with_counts(full_text, self.token_limit)
+        self.batches = [batch for batch, _ in batches]
+        total_tokens = sum(tokens for _, tokens in batches)
 
         logger.info(ScriptIdentifier.CHAPTER, f"Split text into {len(self.batches)} batches")
         logger.info(ScriptIdentifier.CHAPTER, f"Total tokens in summary text: {total_tokens}")
 
     def make_chapter(self) -> None:
-        self.cached_responses = []
-        for i, batch in enumerate(self.batches, 1):
-            logger.info(ScriptIdentifier.CHAPTER, f"Processing batch {i} out of {len(self.batches)}")
-            batch_content = self._process_batch(batch, i)
-            if batch_content:
-                self.cached_responses.append(batch_content)
+        """
+        Batches are turned into chapters by chapter_workers threads, the chapters are saved to the chapters table
+        and chapters.txt in batch order as soon as all earlier batches are done, then synthesized.
+        """
+        self.checkpoints = CheckpointDb()
+        results = [None] * len(self.batches)
+        done = [False] * len(self.batches)
+        next_to_write = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="chapter") as pool:
+            futures = {pool.submit(in_current_span(self._process_batch), batch, i): i - 1 for i, batch in enumerate(self.batches, 1)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    # a failed batch does not stop the batches still running or the synthesis
+                    logger.error(ScriptIdentifier.CHAPTER, f"Failed processing batch {i + 1}: {e}")
+                done[i] = True
+                while next_to_write < len(self.batches) and done[next_to_write]:
+                    if results[next_to_write] is not None:
+                        self._save_batch(*results[next_to_write], next_to_write + 1)
+                    next_to_write += 1
+
+        self.cached_responses = [result[0] for result in results if result is not None]
+        if len(self.cached_responses) < len(self.batches):
+            logger.warning(ScriptIdentifier.CHAPTER, f"{len(self.batches) - len(self.cached_responses)} batches failed, "
+                           "run again to process only the missing batches and the synthesis")
         if self.cached_responses:
             self._process_synthesis()
+        llm_cache.log_stats(ScriptIdentifier.CHAPTER)
+
+    def _checkpoint_hash(self, *parts) -> str:
+        return self.checkpoints.input_hash(self.provider, self.model_info(), *parts)
+
+    @traced('chapter_batch')
+    def _process_batch(self, batch: str, batch_number: int):
+        """
+        Chapter of one batch, runs in the worker threads. Returns (content, input_hash) or None on failure,
+        input_hash is None for a batch loaded from the checkpoints
+        """
+        prompt = f"{self.batch_prompt_text}\n\n{batch}"
+        current_span().set(batch=batch_number, bytes=len(prompt))
+        input_hash = self._checkpoint_hash(prompt)
+        content = self.checkpoints.load('chapter_batch', input_hash, batch_number)
+        if content is not None:
+            current_span().set(checkpoint=True)
+            logger.info(ScriptIdentifier.CHAPTER, f"Batch {batch_number} already done, loaded from checkpoint")
+            return content, None
 
-    def _process_batch(self, batch: str, batch_number: int) -> str:
-        retries = self._get_retry_count()
-        for attempt in range(retries + 1):
-            try:
-                logger.info(ScriptIdentifier.CHAPTER, f"Sending batch and prompt to AI model...")
-                prompt = f"{self.batch_prompt_text}\n\n{batch}"
-                client = self._get_client()
-                messages = self._build_messages(prompt)
-                parameters = self._get_api_parameters()
-                response = client.chat.completions.create(messages=messages, **parameters)
-                logger.info(ScriptIdentifier.CHAPTER, f"Received response for batch {batch_number}")
-                content = response.choices[0].message.content
-                cleaned_content = self._clean_response(content)
-                logger.info(ScriptIdentifier.CHAPTER, f"Cleaned response for batch {batch_number}")
-                
-                ChapterDb().insert_chapter(str(self.batch_prompt_text),
-                                           cleaned_content,
-                                           SystemPars().project_name,
-                                           self.model_info()["model"],
-                                           self.model_info()["parameters"],
-                                           f"Batch Chapter num {batch_number}")
-                self._write_batch_response(cleaned_content, batch_number)
-                logger.info(ScriptIdentifier.CHAPTER, f"Batch {batch_number} processed successfully")
-                return cleaned_content
-            except Exception as e:
-                if attempt < retries and isinstance(e, self._get_retry_exceptions()):
-                    logger.warning(ScriptIdentifier.CHAPTER, 
-                                 f"Retry {attempt+1}/{retries} for batch {batch_number}: {str(e)}")
-                else:
-                    logger.error(ScriptIdentifier.CHAPTER, 
-                               f"Failed processing batch {batch_number}: {str(e)}")
-                    return ""
-
-        return ""
+        try:
+            logger.info(ScriptIdentifier.CHAPTER, f"Processing batch {batch_number} out of {len(self.batches)}")
+            client = self._get_client()
+            messages = self._build_messages(prompt)
+            parameters = self._get_api_parameters()
+            content = self.retry_policy.call(self.provider,
+                                             lambda: self._create_completion(client, messages, parameters, prompt,
+                                                                             f"batch {batch_number}"),
+                                             ScriptIdentifier.CHAPTER, f"batch {batch_number}")
+            logger.info(ScriptIdentifier.CHAPTER, f"Received response for batch {batch_number}")
+            return self._clean_response(content), input_hash
+        except Exception as e:
+            logger.error(ScriptIdentifier.CHAPTER, 
+                       f"Failed processing batch {batch_number}: {str(e)}")
+            return None
+
+    def _save_batch(self, content: str, input_hash, batch_number: int) -> None:
+        """Save a new batch chapter to the chapters table, chapters.txt and the checkpoints"""
+        if input_hash is None:
+            return
+        try:
+            ChapterDb().insert_chapter(str(self.batch_prompt_text),
+                                       content,
+                                       SystemPars().project_name,
+                                       self.model_info()["model"],
+                                       self.model_info()["parameters"],
+                                       f"Batch Chapter num {batch_number}")
+            self._write_batch_response(content, batch_number)
+            self.checkpoints.save('chapter_batch', input_hash, batch_number, content)
+            logger.info(ScriptIdentifier.CHAPTER, f"Batch {batch_number} processed successfully")
+        except Exception as e:
+            logger.error(ScriptIdentifier.CHAPTER, f"Failed saving batch {batch_number}: {str(e)}")
     
     def model_info(self) -> Dict:
         if isinstance(self, DeepSeekChapterMaker):
@@ -119,16 +159,31 @@ class BatchChapterMaker:
             return {"model": "Unknown", 
                     "parameters": "Unknown"}
 
+    def _synthesize(self, parts: List[str]) -> str:
+        synthesis_prompt = f"{self.synthesis_prompt_text}\n\n{' '.join(parts)}"
+        client = self._get_client()
+        messages = self._build_messages(synthesis_prompt)
+        parameters = self._get_api_parameters()
+        return self.retry_policy.call(self.provider,
+                                      lambda: self._create_completion(client, messages, parameters, synthesis_prompt,
+                                                                      "synthesis"),
+                                      ScriptIdentifier.CHAPTER, "synthesis")
+
     def _process_synthesis(self) -> None:
         try:
             logger.info(ScriptIdentifier.CHAPTER, "Processing synthesis of all batches...")
-            synthesis_prompt = f"{self.synthesis_prompt_text}\n\n{' '.join(self.cached_responses)}"
-            client = self._get_client()
-            messages = self._build_messages(synthesis_prompt)
-            parameters = self._get_api_parameters()
+            input_hash = self._checkpoint_hash(self.synthesis_prompt_text, self.cached_responses)
+            if self.checkpoints.load('chapter_synthesis', input_hash) is not None:
+                logger.info(ScriptIdentifier.CHAPTER, "Final chapter already done, loaded from checkpoint")
+                return
             modelparams = self.model_info()
-            response = client.chat.completions.create(messages=messages, **parameters)
-            final_content = response.choices[0].message.content
+            # chapters that do not fit in one synthesis prompt are synthesized in groups first
+            final_content = tree_reduce(self.cached_responses,
+                                        self._synthesize,
+                                        self.token_limit,
+                                        TokenCounter().count_tokens(self.synthesis_prompt_text),
+                                        SystemPars().synthesis_workers,
+                                        ScriptIdentifier.CHAPTER)
             ChapterDb().insert_chapter(str(self.synthesis_prompt_text),
                                        final_content, 
                                        SystemPars().project_name,
@@ -136,15 +191,45 @@ class BatchChapterMaker:
                                        modelparams["parameters"],
                                        "Final Edition Chapter")
             self._write_final_response(final_content)
+            self.checkpoints.save('chapter_synthesis', input_hash, 0, final_content)
             logger.info(ScriptIdentifier.CHAPTER, "Synthesis processing completed and written to file")
         except Exception as e:
             logger.error(ScriptIdentifier.CHAPTER, f"Synthesis processing failed: {str(e)}")
 
-    def _get_retry_count(self) -> int:
-        return 0
-
-    def _get_retry_exceptions(self) -> tuple:
-        return ()
+    def _create_completion(self, client, messages: List[Dict], parameters: Dict, prompt: str,
+                           label: str = "call") -> str:
+        """
+        Chat completion call that goes through the LLM cache and the shared rate limiter of the provider,
+        returns the content of the answer
+        """
+        stage = 'chapter_synthesis' if label == 'synthesis' else 'chapter_batch'
+        model = parameters.get("model")
+        cache_key = llm_cache.make_key(self.provider, model, parameters, messages)
+        content = llm_cache.get(cache_key)
+        if content is not None:
+            logger.info(ScriptIdentifier.CHAPTER, "Answer served from LLM cache")
+            telemetry.record(stage, self.provider, model, cache_hit=True)
+            return content
+
+        rate_limiter.acquire(self.provider, tokens=estimate_tokens(prompt, self.aiparameters.max_tokens))
+        started = time.perf_counter()
+        try:
+            if self.stream_responses:
+                content, stats = stream_chat(client, dict(messages=messages, **parameters),
+                                             part_file_path(CHAPTERS_FILE, label, prompt), ScriptIdentifier.CHAPTER)
+                telemetry.record(stage, self.provider, model, started,
+                                 (stats['prompt_tokens'], stats['output_tokens']), stats['ttft'])
+            else:
+                response = client.chat.completions.create(messages=messages, **parameters)
+                content = response.choices[0].message.content
+                telemetry.record(stage, self.provider, model, started, usage_tokens(response))
+        except Exception as e:
+            rate_limiter.report_error(self.provider, e)
+            telemetry.record(stage, self.provider, model, started, error=e)
+            raise
+        rate_limiter.report_success(self.provider)
+        llm_cache.put(cache_key, content, self.provider, model)
+        return content
 
     def _get_client(self):
         raise NotImplementedError
@@ -166,11 +251,11 @@ class BatchChapterMaker:
         return cleaned
 
     def _write_batch_response(self, content: str, batch_number: int) -> None:
-        with open('resources/output_of_ai/chapters.txt', 'a', encoding='utf-8') as f:
+        with span('file_append', file=CHAPTERS_FILE, bytes=len(content)), open(CHAPTERS_FILE, 'a', encoding='utf-8') as f:
             f.write(f"\n\n{'='*20}\nBatch {batch_number} Response\n{'='*20}\n{content}")
 
     def _write_final_response(self, content: str) -> None:
-        with open('resources/output_of_ai/chapters.txt', 'a', encoding='utf-8') as f:
+        with span('file_append', file=CHAPTERS_FILE, bytes=len(content)), open(CHAPTERS_FILE, 'a', encoding='utf-8') as f:
             f.write(f"\n\n{'#'*20}\nFinal Chapter Response\n{'#'*20}\n{content}")
 
 
@@ -179,6 +264,7 @@ class DeepSeekChapterMaker(BatchChapterMaker):
         super().__init__()
         logger.info(ScriptIdentifier.CHAPTER, "Initializing DeepSeekChapterMaker")
         self.aiparameters = DeepSeekPars()
+        self.provider = 'deepseek'
         self.api_key = os.getenv('DEEPSEEK_API_KEY')
         self._log_parameters()
 
@@ -189,7 +275,7 @@ class DeepSeekChapterMaker(BatchChapterMaker):
         logger.info(ScriptIdentifier.CHAPTER, f"Temperature: {self.aiparameters.temperature}")
 
     def _get_client(self):
-        return OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
+        return api_clients.openai_client(self.provider, self.api_key)
 
     def _build_messages(self, prompt: str) -> List[Dict]:
         return [
@@ -204,18 +290,13 @@ class DeepSeekChapterMaker(BatchChapterMaker):
             "temperature": self.aiparameters.temperature
         }
 
-    def _get_retry_count(self) -> int:
-        return 3
-
-    def _get_retry_exceptions(self) -> tuple:
-        return (json.JSONDecodeError,)
-
 
 class ChatGPTChapterMaker(BatchChapterMaker):
     def __init__(self):
         super().__init__()
         logger.info(ScriptIdentifier.CHAPTER, "Initializing ChatGPTChapterMaker")
         self.aiparameters = ChatGPTPars()
+        self.provider = 'openai'
         self.api_key = os.getenv('OPENAI_API_KEY')
         self._log_parameters()
 
@@ -226,7 +307,7 @@ class ChatGPTChapterMaker(BatchChapterMaker):
         logger.info(ScriptIdentifier.CHAPTER, f"Temperature: {self.aiparameters.temperature}")
 
     def _get_client(self):
-        return OpenAI(api_key=self.api_key)
+        return api_clients.openai_client(self.provider, self.api_key)
 
     def _build_messages(self, prompt: str) -> List[Dict]:
         return [{"role": "user", "content": prompt}]
@@ -18,6 +18,48 @@ class SystemPars:
 
         # limit of tokens per prompt for creating outline or chapter, if the model is more powerful it can be increased
         self.token_limit = 25000
+
+        # threads used by the tokenizer when many texts are counted at once (splitting the summary file in batches)
+        self.tokenizer_threads = 8
+
+        # finished batches of the pipeline stages are saved as checkpoints in the db, a rerun skips them
+        # and only does the missing batches and the synthesis. False runs every stage from the beginning
+        self.resume_from_checkpoints = True
+
+        # when the batch outputs do not fit in one synthesis prompt (token_limit) they are synthesized in groups,
+        # level by level, synthesis_workers groups at the same time
+        self.synthesis_workers = 4
+
+        # stream the answers of the AI models: the tokens are written to a .part file next to the output file
+        # (outline.txt, chapters.txt, summary_total.txt) as they arrive, time to first token and tokens/s are logged.
+        # The output files are still written in order when every answer is complete
+        self.stream_responses = False
+
+        # persistent cache of AI answers, identical prompts, model and parameters are not sent again to the API
+        # set to False for prompt experiments that need a fresh answer every time
+        self.llm_cache_enabled = True
+        self.llm_cache_path = 'resources/cache/llm_cache.sqlite'
+        self.llm_cache_max_entries = 20000
+        self.llm_cache_max_age_days = 90
+
+        # base urls of the OpenAI compatible APIs, None uses the default url of the client
+        self.api_base_urls = {
+            'openai': None,
+            'deepseek': 'https://api.deepseek.com',
+        }
+        # connection pool of the shared API clients (one keep-alive client per provider and key)
+        self.http_max_connections = 20
+        self.http_max_keepalive_connections = 10
+        self.http_timeout = 600
+
+        # connection pool of the database managers, shared by all threads of the process
+        # db_pool_maxconn should be at least the number of workers that write to the db at the same time
+        self.db_pool_minconn = 1
+        self.db_pool_maxconn = 10
+        # rows per INSERT statement of the bulk inserts (metadata of the sources), all batches run in one transaction
+        self.db_bulk_batch_size = 500
+        # rows per round trip of the streaming reads (server side cursors), only one chunk of rows is in memory
+        self.db_stream_itersize = 500
         # ---------------------------------------------------------
 
         # CONFIGURATION OF GETTING RESOURCES
@@ -27,6 +69,27 @@ class SystemPars:
         # prompt that filters the crude sources of the AHSS tool to relevant sources of paper so they can be downloaded
         self.filter_sources_for_dl = 'prompt-engineering\main_for_filtering_resources.txt'
 
+        # number of requests sent at the same time to each source of the AHSS tool,
+        # the requests per second of each source are limited in RateLimitPars
+        self.ahss_concurrency = {
+            'crossref': 4,
+            'openalex': 4,
+            'core': 1,
+        }
+        # urls of the search APIs of the AHSS tool, changed only to run against a local mock (pipeline benchmark)
+        self.search_api_urls = {
+            'crossref': 'https://api.crossref.org/works',
+            'openalex': 'https://api.openalex.org/works',
+            'core': 'https://api.core.ac.uk/v3/search/works',
+        }
+
+        # Sci-Hub downloads: papers downloaded at the same time, size of the chunks written to the .part files,
+        # times a broken download is continued with a Range request and papers marked as downloaded per db update
+        self.scihub_workers = 3
+        self.scihub_chunk_size = 64 * 1024
+        self.scihub_resume_attempts = 3
+        self.scihub_db_batch_size = 20
+
         # ---------------------------------------------------------
         # SUMMARIZATION CONFIGURATION
 
@@ -45,17 +108,37 @@ class SystemPars:
         # be sure there are no other summeries and get wrong results
         self.big_text_file = 'resources\output_of_ai\summary_total.txt'
 
+        # documents over the token limit are split in chunks and each chunk is summarized once,
+        # if True the chunk summaries are merged with one more call instead of just joined
+        self.reduce_chunk_summaries = False
+
+        # number of PDF files summarized at the same time, 1 processes the files one by one
+        self.summarizer_workers = 4
+
+        # text extraction of the PDF files, documents with at least pdf_parallel_min_pages pages are split
+        # in ranges of pdf_pages_per_task pages that are extracted by pdf_extract_workers processes
+        self.pdf_extract_workers = 4
+        self.pdf_pages_per_task = 50
+        self.pdf_parallel_min_pages = 100
+        # extracted text is cached per file (path, size, mtime and sha256), reruns do not parse the PDF again
+        self.pdf_cache_enabled = True
+        self.pdf_cache_path = 'resources/cache/pdf_text.sqlite'
+
         # ---------------------------------------------------------
         # CHAPTER OUTLINER CONFIGURATION
 
         self.role_of_bot_outliner = 'prompt-engineering\outline_role.txt'
         self.prompts_single_batch = 'prompt-engineering\outline_single_batch_prompt.txt'
         self.prompts_final_synthesis = 'prompt-engineering\outline_synthesis_prompt.txt'
+        # batches outlined at the same time, the outlines are still written and synthesized in batch order
+        self.outline_workers = 4
         # ---------------------------------------------------------
         # CHAPTER MAKER CONFIGURATION
         self.prompts_chapter = 'prompt-engineering\chapter_maker_prompt.txt'
         self.role_of_bot_chapter = 'prompt-engineering\chapter_maker_role.txt'
         self.prompts_synthesis_chapter = 'prompt-engineering\chapter_maker_synthesis_prompt.txt'
+        # batches turned into chapters at the same time, chapters are still written and saved in batch order
+        self.chapter_workers = 4
 
         # file with the text to be used as a source, propably produced by the summarizer
         self.paper_file = 'prompts-roles\prompts-roles\paper.txt' 
@@ -144,4 +227,88 @@ class GeminiSummerizerPars(SystemPars):
 
 class GeminiChapterMakerPars(SystemPars):
     def __init__(self):
-        super().__init__()
\ No newline at end of file
+        super().__init__()
+
+
+class RateLimitPars:
+    def __init__(self):
+        # budgets of the shared rate limiter per provider, adjust them to the real limits of your account
+        # requests_per_second: max requests per second, tokens_per_minute: max tokens per minute (None = no token budget)
+        self.limits = {
+            'openai': {'requests_per_second': 5.0, 'tokens_per_minute': 200000},
+            'deepseek': {'requests_per_second': 5.0, 'tokens_per_minute': None},
+            'gemini': {'requests_per_second': 1.0, 'tokens_per_minute': 2000000},
+            'crossref': {'requests_per_second': 5.0, 'tokens_per_minute': None},
+            'openalex': {'requests_per_second': 10.0, 'tokens_per_minute': None},
+            'core': {'requests_per_second': 0.5, 'tokens_per_minute': None},
+            'scihub': {'requests_per_second': 0.33, 'tokens_per_minute': None},
+        }
+        # budget of providers that are not in the list above
+        self.default_limit = {'requests_per_second': 1.0, 'tokens_per_minute': None}
+
+        # on a 429 response the rates are multiplied with backoff_factor (never below min_rate_factor)
+        # and every successful call gives back recovery_step of the configured rate
+        self.backoff_factor = 0.5
+        self.min_rate_factor = 0.1
+        self.recovery_step = 0.05
+
+
+class RetryPars:
+    def __init__(self):
+        # retry policy of the calls to the AI providers, only transient errors are retried
+        # delay before retry n is random between 0 and min(max_delay, base_delay * 2^n) seconds,
+        # or the Retry-After of the answer of the provider
+        self.max_retries = 3
+        self.base_delay = 2.0
+        self.max_delay = 60.0
+        self.retryable_status_codes = [408, 409, 425, 429, 500, 502, 503, 504]
+
+        # circuit breaker per provider: after circuit_failure_threshold transient failures in a row
+        # the provider is not called for circuit_reset_timeout seconds
+        self.circuit_failure_threshold = 5
+        self.circuit_reset_timeout = 60.0
+
+
+class TelemetryPars:
+    def __init__(self):
+        # every model call of the agents is recorded in ai_schema.llm_calls (tokens, latency, retries, cache hits, cost)
+        # the rows are written by a background thread in batches of batch_size or every flush_seconds
+        self.enabled = True
+        self.batch_size = 50
+        self.flush_seconds = 5.0
+
+        # prices in USD per 1M tokens used for the estimated cost of the calls, update them to the prices of your account
+        # models that are not in the list get no cost estimate
+        self.prices = {
+            'o1-mini': {'input': 3.00, 'output': 12.00},
+            'gpt-4o': {'input': 2.50, 'output': 10.00},
+            'gpt-4o-mini': {'input': 0.15, 'output': 0.60},
+            'deepseek-chat': {'input': 0.27, 'output': 1.10},
+            'deepseek-reasoner': {'input': 0.55, 'output': 2.19},
+            'gemini-1.5-pro': {'input': 1.25, 'output': 5.00},
+            'gemini-1.5-flash': {'input': 0.075, 'output': 0.30},
+        }
+
+
+class LoggingPars:
+    def __init__(self):
+        # log records are put in a queue and written to the log files by a background thread,
+        # False writes them on the calling thread
+        self.queue_logging = True
+
+        # messages longer than max_message_length characters are cut (prompts, summaries), 0 keeps them whole
+        self.max_message_length = 4000
+
+        # level of all scripts and the levels of single scripts, the keys are names of ScriptIdentifier
+        # e.g. {'RATELIMITER': 'WARNING', 'SUMMARIZER': 'DEBUG'}
+        self.level = 'INFO'
+        self.script_levels = {}
+
+        # size and number of the rotated log files, also of the rotated trace files
+        self.max_bytes = 10000000
+        self.backup_count = 5
+
+        # spans of the pipeline stages (extraction, tokenization, API calls, db writes, file appends) are written
+        # as JSON lines to trace_file, print the breakdown of a run with: python src/tools/trace_report.py
+        self.trace_enabled = True
+        self.trace_file = 'logs/pokoscribe_trace.jsonl'
@@ -1,57 +1,222 @@
-import psycopg2
-from psycopg2 import sql
+from __future__ import annotations
+from contextlib import contextmanager
 from dotenv import load_dotenv
-import os
+import os, time, json, hashlib, itertools, threading
 from logs.pokolog import PokoLogger, ScriptIdentifier
-import pandas as pd
+from logs.pokotrace import span
 from src.config import SystemPars
+from src.tools.dedup import dedup_frame
+from src.tools.lazy_imports import lazy_module
+from src.db_ai.migrations import MIGRATIONS, MIGRATION_LOCK_KEY
+
+# psycopg2 and pandas are loaded by the first database operation, not by the import of the managers
+pd = lazy_module('pandas')
+sql = lazy_module('psycopg2.sql')
+extras = lazy_module('psycopg2.extras')
+pg_pool = lazy_module('psycopg2.pool')
 
 load_dotenv('.env')
 logger = PokoLogger()
 
 class AIDbManager:
-    def __init__(self):
-        self.conn = None
+    """
+    Base class of the database managers. All subclasses share one connection pool per process,
+    a connection is checked out for every operation and returned right after it.
+    The first manager of the process applies the pending schema migrations (src/db_ai/migrations.py).
+    """
+    _pool = None
+    _pool_lock = threading.Lock()
+    _schema_lock = threading.Lock()
+    _schema_ready = False
+    # names of the server side cursors, unique in the process
+    _cursor_ids = itertools.count(1)
+
+    def __init__(self, migrate: bool = True):
+        self.project_name = SystemPars().project_name
+        if migrate:
+            try:
+                self._migrate()
+            except Exception as e:
+                logger.error(ScriptIdentifier.DATABASE, f"Error connecting to the database: {e}")
+
+    @classmethod
+    def _get_pool(cls) -> pg_pool.ThreadedConnectionPool:
+        if AIDbManager._pool is None:
+            with AIDbManager._pool_lock:
+                if AIDbManager._pool is None:
+                    sys_params = SystemPars()
+                    AIDbManager._pool = pg_pool.ThreadedConnectionPool(
+                        sys_params.db_pool_minconn,
+                        sys_params.db_pool_maxconn,
+                        dbname=os.getenv('postgresdb'),
+                        user=os.getenv('postgresusername'),
+                        password=os.getenv('postgrespassword'),
+                        host=os.getenv('postgreshost'),
+                        port=os.getenv('postgresport')
+                    )
+                    logger.info(ScriptIdentifier.DATABASE, "Connected to the database, connection pool created.")
+        return AIDbManager._pool
+
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection for one operation, commit on success and rollback on error"""
+        with span('db', manager=type(self).__name__):
+            pool = self._get_pool()
+            conn = pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                # broken connections are dropped so the pool opens a new one next time
+                pool.putconn(conn, close=bool(conn.closed))
+
+    def _migrate(self) -> None:
+        """Bring the schema to the last migration, only the first time in the process"""
+        if AIDbManager._schema_ready:
+            return
+        with AIDbManager._schema_lock:
+            if AIDbManager._schema_ready:
+                return
+            SchemaMigrations().apply()
+            AIDbManager._schema_ready = True
+
+    @staticmethod
+    def _df_rows(df: pd.DataFrame, columns: list) -> list:
+        """Rows of the DataFrame as tuples of plain python values, missing columns and NaN become NULL"""
+        frame = df.reindex(columns=columns).astype(object)
+        frame = frame.where(pd.notna(frame), None)
+        return list(frame.itertuples(index=False, name=None))
+
+    def _bulk_insert(self, cursor, table: str, columns: list, rows: list, suffix: str = '', fetch: bool = False):
+        """
+        Insert the rows with multi row INSERT statements of db_bulk_batch_size rows each.
+        suffix is added after VALUES (ON CONFLICT / RETURNING), with fetch the returned rows are given back
+        instead of the number of rows.
+        """
+        if not rows:
+            return [] if fetch else 0
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+            sql.SQL(table),
+            sql.SQL(', ').join(map(sql.Identifier, columns))
+        ).as_string(cursor)
+        result = extras.execute_values(cursor, f"{query} {suffix}", rows,
+                                page_size=SystemPars().db_bulk_batch_size, fetch=fetch)
+        return result if fetch else len(rows)
+
+    def _stream_chunks(self, query: str, params: tuple, chunk_rows: int = None):
+        """
+        Rows of the query in lists of chunk_rows rows (db_stream_itersize), with the column names.
+        The rows are read with a server side cursor, only one chunk is in memory at a time whatever the
+        number of rows. The connection stays checked out until the generator is exhausted or closed.
+        """
+        chunk_rows = chunk_rows or SystemPars().db_stream_itersize
+        pool = self._get_pool()
+        conn = pool.getconn()
         try:
-            self.conn = psycopg2.connect(
-                dbname=os.getenv('postgresdb'),
-                user=os.getenv('postgresusername'),
-                password=os.getenv('postgrespassword'),
-                host=os.getenv('postgreshost'),
-                port=os.getenv('postgresport')
+            with conn.cursor(name=f"pokoscribe_stream_{next(AIDbManager._cursor_ids)}") as cursor:
+                cursor.itersize = chunk_rows
+                cursor.execute(query, params)
+                while True:
+                    # the span covers only the round trip, not the time the consumer spends on the chunk
+                    with span('db_fetch', manager=type(self).__name__) as s:
+                        rows = cursor.fetchmany(chunk_rows)
+                        s.set(rows=len(rows))
+                    if not rows:
+                        break
+                    yield [desc[0] for desc in cursor.description], rows
+            conn.commit()
+        except BaseException:
+            # also when the consumer stops early (GeneratorExit), the read transaction is ended
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def _stream_frames(self, query: str, params: tuple, chunk_rows: int = None):
+        """DataFrames of at most chunk_rows rows of the query, see _stream_chunks"""
+        for columns, rows in self._stream_chunks(query, params, chunk_rows):
+            yield pd.DataFrame(rows, columns=columns)
+
+    @staticmethod
+    def _concat_frames(frames) -> pd.DataFrame:
+        frames = list(frames)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def close(self):
+        """Connections return to the pool after every operation, nothing to close per manager"""
+        pass
+
+    @classmethod
+    def close_pool(cls):
+        """Close all pooled connections, call it once when the process finishes"""
+        with AIDbManager._pool_lock:
+            if AIDbManager._pool is not None:
+                AIDbManager._pool.closeall()
+                AIDbManager._pool = None
+                logger.info(ScriptIdentifier.DATABASE, "Connection pool closed.")
+
+
+class SchemaMigrations(AIDbManager):
+    """Applies the migrations of src/db_ai/migrations.py and records them in ai_schema.schema_migrations"""
+    def __init__(self):
+        super().__init__(migrate=False)
+
+    @staticmethod
+    def _create_table(cursor) -> None:
+        cursor.execute("CREATE SCHEMA IF NOT EXISTS ai_schema")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ai_schema.schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
             )
-            self.project_name = SystemPars().project_name
-            self.conn.autocommit = True
-            logger.info(ScriptIdentifier.DATABASE, "Connected to the database.")
-            
-        except Exception as e:
-            logger.error(ScriptIdentifier.DATABASE, f"Error connecting to the database: {e}")
+        """)
+
+    def applied(self) -> dict:
+        """{version: applied_at} of the applied migrations"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            self._create_table(cursor)
+            cursor.execute("SELECT version, applied_at FROM ai_schema.schema_migrations")
+            return dict(cursor.fetchall())
+
+    def apply(self) -> list:
+        """Apply the pending migrations in order, each in its own transaction. Returns the applied versions"""
+        applied = self.applied()
+        done = []
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            start_time = time.perf_counter()
+            with self.connection() as conn, conn.cursor() as cursor:
+                # another process can migrate at the same time, the lock waits for it and the check skips its work
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+                cursor.execute("SELECT 1 FROM ai_schema.schema_migrations WHERE version = %s", (migration.version,))
+                if cursor.fetchone():
+                    continue
+                for statement in migration.statements:
+                    if callable(statement):
+                        statement(cursor)
+                    else:
+                        cursor.execute(statement)
+                elapsed_ms = int((time.perf_counter() - start_time) * 1000)
+                cursor.execute("""
+                    INSERT INTO ai_schema.schema_migrations (version, description, duration_ms) VALUES (%s, %s, %s)
+                """, (migration.version, migration.description, elapsed_ms))
+            done.append(migration.version)
+            logger.info(ScriptIdentifier.DATABASE, f"Migration {migration.version} ({migration.description}) "
+                        f"applied in {elapsed_ms} ms")
+        return done
 
 
 class SaveSummary(AIDbManager):
     def __init__(self):
         super().__init__()
-        
-        cursor = self.conn.cursor()
-        cursor.execute("""CREATE SCHEMA IF NOT EXISTS ai_schema""")
-        cursor.execute("""CREATE TABLE IF NOT EXISTS ai_schema.summaries_history (
-                        id SERIAL PRIMARY KEY,
-                        projectname VARCHAR(255),
-                        sessionid INTEGER,
-                        prompt TEXT,
-                        fileeditedname TEXT,
-                        tokencountprompt INTEGER,
-                        answer TEXT,
-                        tokencountanswer INTEGER,
-                        timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                        model VARCHAR(255),
-                        modeldetails TEXT,
-                        type_of_prompt VARCHAR(255),
-                        citation TEXT
-                        )
-                       """)
-        self.conn.commit()
-        cursor.close()
 
     def insert_row(self, 
                         projectname, sessionid, prompt, 
@@ -59,7 +224,7 @@ class SaveSummary(AIDbManager):
                         tokencountanswer, model, modeldetails, type_of_prompt, citation):
         
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 insert_query = sql.SQL("""
                     INSERT INTO ai_schema.summaries_history (
                         projectname, sessionid, prompt, fileeditedname, tokencountprompt, answer, tokencountanswer, model, modeldetails, type_of_prompt, citation
@@ -72,20 +237,45 @@ class SaveSummary(AIDbManager):
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error inserting row {fileeditedname}: {e}")
 
-    def close(self):
-        if self.conn:
-            self.conn.close()
+    def new_session(self, project_name: str, purpose: str = 'summarization') -> int:
+        """Id of a new session from the session sequence, runs started at the same time get different ids"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO ai_schema.sessions (project_name, purpose) VALUES (%s, %s) RETURNING sessionid
+            """, (project_name, purpose))
+            return cursor.fetchone()[0]
 
     def get_last_session(self):
         try:
-            with self.conn.cursor() as cursor:
-                cursor.execute("SELECT MAX(sessionid) FROM ai_schema.summaries_history")
+            with self.connection() as conn, conn.cursor() as cursor:
+                # read from the end of the primary key index, not from the whole history
+                cursor.execute("SELECT MAX(sessionid) FROM ai_schema.sessions")
                 last_session = cursor.fetchone()
-                return last_session[0]
+                return last_session[0] or 0
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error getting last session: {e}")
             return None
         
+    def iter_paper_sources(self, project_name: str, session_ids: list[int] = None, chunk_rows: int = None):
+        """
+        Stream the summaries of a project as (fileeditedname, answer) rows, in the order they were saved,
+        without loading the whole history. Without session_ids all sessions of the project are read.
+        """
+        if session_ids is None:
+            query, params = """
+                SELECT fileeditedname, answer FROM ai_schema.summaries_history
+                WHERE projectname = %s
+                ORDER BY sessionid, id
+            """, (project_name,)
+        else:
+            query, params = """
+                SELECT fileeditedname, answer FROM ai_schema.summaries_history
+                WHERE projectname = %s AND sessionid = ANY(%s)
+                ORDER BY sessionid, id
+            """, (project_name, [int(session_id) for session_id in session_ids])
+        for _, rows in self._stream_chunks(query, params, chunk_rows):
+            yield from rows
+
     def get_paper_sources(self, project_name: str, session_ids: list[int]) -> list:
         """
         Get paper sources for a given project and session IDs
@@ -95,224 +285,159 @@ class SaveSummary(AIDbManager):
             session_ids (list[int]): List of session IDs"""
         
         try:
-            with self.conn.cursor() as cursor:
-                # Convert session_ids to tuple for SQL IN clause
-                session_ids_tuple = tuple(session_ids)
-                
-                # Adjust query based on number of session IDs
-                if len(session_ids) == 1:
-                    cursor.execute("""
-                        SELECT sh.answer FROM ai_schema.summaries_history sh
-                        WHERE projectname = %s 
-                        AND sessionid = %s
-                    """, (project_name, session_ids[0]))
-                else:
-                    cursor.execute("""
-                        SELECT sh.answer FROM ai_schema.summaries_history sh
-                        WHERE projectname = %s 
-                        AND sessionid IN %s
-                    """, (project_name, session_ids_tuple))
-                    
-                paper_sources = cursor.fetchall()
-                logger.info(ScriptIdentifier.DATABASE, 
-                        f"Retrieved {len(paper_sources)} records for project {project_name}")
-                cursor.close()
-                logger.info(ScriptIdentifier.DATABASE, f"Connection Closed.")
-                return paper_sources
+            paper_sources = [(answer,) for _, answer in self.iter_paper_sources(project_name, session_ids)]
+            logger.info(ScriptIdentifier.DATABASE, 
+                    f"Retrieved {len(paper_sources)} records for project {project_name}")
+            return paper_sources
             
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, 
                         f"Error getting paper sources for project {project_name}: {e}")
-            cursor.close()
-            logger.info(ScriptIdentifier.DATABASE, f"Connection Closed.")
 
 
 class SaveMetaData(AIDbManager):
     def __init__(self):
         super().__init__()
-        
-        """Create metadata table if it doesn't exist"""
-        try:
-            with self.conn.cursor() as cursor:
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ai_schema.papers_metadata (
-                        id SERIAL PRIMARY KEY,
-                        title TEXT NOT NULL,
-                        doi VARCHAR(255),
-                        year TEXT,
-                        authors TEXT,
-                        abstract TEXT,
-                        keywords TEXT,
-                        relevance_score FLOAT,
-                        pdf_url TEXT,
-                        publisher TEXT,
-                        journal TEXT,
-                        type VARCHAR(50),
-                        cited_by_count INTEGER,
-                        apicalled VARCHAR(50),
-                        project_name VARCHAR(50),
-                        insert_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                self.conn.commit()
-                logger.info(ScriptIdentifier.DATABASE, "Created or Confirmed existance: papers_metadata table")
-        except Exception as e:
-            logger.error(ScriptIdentifier.DATABASE, f"Error creating metadata_table: {e}")
-            self.conn.rollback()
 
-    def save_papers_metadata(self, df: pd.DataFrame, apicalled: str, project_name: str) -> None:
-        """Save papers metadata to database"""
+    def save_papers_metadata(self, df: pd.DataFrame, apicalled: str, project_name: str) -> int:
+        """
+        Save papers metadata to database in one transaction, returns the number of new records.
+        A failed write is logged and raised, the caller must not take the papers as saved.
+        Papers that are already saved for the project (same DOI, or same title without DOI) are merged:
+        union of keywords and sources, highest citation count and relevance score, missing fields filled.
+        """
+        columns = ['title', 'doi', 'year', 'authors', 'abstract', 'keywords', 'relevance_score', 'pdf_url',
+                   'publisher', 'journal', 'type', 'cited_by_count']
         try:
-            with self.conn.cursor() as cursor:
-                inserted = 0
-                for _, row in df.iterrows():
-                    cursor.execute("""
-                        INSERT INTO ai_schema.papers_metadata (
-                            title, 
-                            doi, 
-                            year, 
-                            authors, 
-                            abstract,
-                            keywords, 
-                            relevance_score, 
-                            pdf_url,
-                            publisher, 
-                            journal, type, 
-                            cited_by_count,
-                            apicalled, 
-                            project_name
-                        ) VALUES (
-                            %s, %s, %s, %s, %s, 
-                            %s, %s, %s, %s, %s, 
-                            %s, %s, %s, %s
-                        )
-                    """, (
-                        row.get('title'),
-                        row.get('doi'),
-                        row.get('year'),
-                        row.get('authors'),
-                        row.get('abstract'),
-                        row.get('keywords'),
-                        row.get('relevance_score'),
-                        row.get('pdf_url'),
-                        row.get('publisher'),
-                        row.get('journal'),
-                        row.get('type'),
-                        row.get('cited_by_count'),
-                        apicalled,
-                        project_name
-                    ))
-                    inserted += 1
-                
-                self.conn.commit()
-                logger.info(ScriptIdentifier.DATABASE, f"Saved {inserted} records from {apicalled} and project {project_name}")
+            start_time = time.perf_counter()
+            df = dedup_frame(df.reindex(columns=columns))
+            rows = [row + (apicalled, project_name) for row in self._df_rows(df, columns + ['dedup_key'])]
+            with self.connection() as conn, conn.cursor() as cursor:
+                returned = self._bulk_insert(
+                    cursor, 'ai_schema.papers_metadata', columns + ['dedup_key', 'apicalled', 'project_name'], rows,
+                    suffix="""
+                        ON CONFLICT (project_name, dedup_key) DO UPDATE SET
+                            keywords = (SELECT string_agg(DISTINCT k, '; ') FROM unnest(string_to_array(
+                                concat_ws('; ', papers_metadata.keywords, EXCLUDED.keywords), '; ')) AS k WHERE k <> ''),
+                            apicalled = (SELECT string_agg(DISTINCT a, '; ') FROM unnest(string_to_array(
+                                concat_ws('; ', papers_metadata.apicalled, EXCLUDED.apicalled), '; ')) AS a WHERE a <> ''),
+                            cited_by_count = GREATEST(papers_metadata.cited_by_count, EXCLUDED.cited_by_count),
+                            relevance_score = GREATEST(papers_metadata.relevance_score, EXCLUDED.relevance_score),
+                            doi = COALESCE(papers_metadata.doi, EXCLUDED.doi),
+                            abstract = COALESCE(NULLIF(papers_metadata.abstract, ''), EXCLUDED.abstract),
+                            pdf_url = COALESCE(papers_metadata.pdf_url, EXCLUDED.pdf_url)
+                        RETURNING (xmax = 0)
+                    """, fetch=True)
+            inserted = sum(1 for (is_new,) in returned if is_new)
+            elapsed = time.perf_counter() - start_time
+            logger.info(ScriptIdentifier.DATABASE, f"Saved {inserted} new and merged {len(rows) - inserted} existing records "
+                        f"from {apicalled} and project {project_name} in {elapsed:.2f}s ({len(rows) / max(elapsed, 1e-6):.0f} rows/s)")
+            return inserted
                 
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error saving metadata: {e}")
-            self.conn.rollback()
+            raise
 
 
 class GetMetaData(AIDbManager):
     def __init__(self):
         super().__init__()
 
+    def iter_papers_metadata_by_title(self, project_name: str, chunk_rows: int = None):
+        """Stream the id and title of the papers metadata of a project as DataFrames of chunk_rows rows"""
+        yield from self._stream_frames("""
+            SELECT id, title FROM ai_schema.papers_metadata
+            WHERE project_name = %s
+        """, (project_name,), chunk_rows)
+
     def get_papers_metadata_by_title(self, project_name: str) -> pd.DataFrame:
         """Get papers metadata by title from database"""
         try:
-            with self.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, title FROM ai_schema.papers_metadata
-                    WHERE project_name = %s
-                """, (project_name,))
-                df = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
-                logger.info(ScriptIdentifier.DATABASE, f"Retrieved {len(df)} records from project {project_name}")
-                return df
+            df = self._concat_frames(self.iter_papers_metadata_by_title(project_name))
+            logger.info(ScriptIdentifier.DATABASE, f"Retrieved {len(df)} records from project {project_name}")
+            return df
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error getting metadata by title: {e}")
             return pd.DataFrame()
         
-    def insert_filtered_metadata(self, sql_query: str) -> pd.DataFrame:
-        """Retrieve filtered metadata from database"""
+    def insert_filtered_metadata(self, sql_query: str) -> int:
+        """Copy the records selected by the filtering query to filtered sources, returns the number of inserted records"""
+        project_name = self.project_name
         try:
             cleaned_query = sql_query.strip('"').strip("'")
-            project_name = self.project_name
-            cursor = self.conn.cursor()
-            cursor.execute(cleaned_query)
-            df = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
-            df['success_dl'] = 'NotDownloaded'
-            # Create filtered sources table
-            cursor.execute(f"""
-                CREATE TABLE IF NOT EXISTS ai_schema.filtered_sources (
-                    id SERIAL PRIMARY KEY,
-                    metadata_id INTEGER REFERENCES ai_schema.papers_metadata(id),
-                    title TEXT NOT NULL,
-                    doi VARCHAR(255),
-                    year TEXT,
-                    abstract TEXT,
-                    pdf_url TEXT,
-                    success_dl TEXT,
-                    project_name VARCHAR(255),
-                    insert_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            self.conn.commit()
-            logger.info(ScriptIdentifier.DATABASE, f"Inserting filtered data for project: {project_name}")
-            # Insert data into filtered sources table
-            for _, row in df.iterrows():
-                cursor.execute("""
-                    INSERT INTO ai_schema.filtered_sources (
-                        metadata_id, title, doi, year, abstract, pdf_url, success_dl, project_name
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    row['id'],
-                    row['title'],
-                    row['doi'],
-                    row['year'],
-                    row['abstract'],
-                    row['pdf_url'],
-                    row['success_dl'],
-                    project_name  
-                ))
-
-            self.conn.commit()
-            logger.info(ScriptIdentifier.DATABASE, f"Inserted {len(df)} records into filtered sources table for project {project_name}")
+            start_time = time.perf_counter()
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(cleaned_query)
+                df = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
+                df['success_dl'] = 'NotDownloaded'
+                df['project_name'] = project_name
+                logger.info(ScriptIdentifier.DATABASE, f"Inserting filtered data for project: {project_name}")
+                # Insert data into filtered sources table
+                df = df.rename(columns={'id': 'metadata_id'})
+                columns = ['metadata_id', 'title', 'doi', 'year', 'abstract', 'pdf_url', 'success_dl', 'project_name']
+                inserted = self._bulk_insert(cursor, 'ai_schema.filtered_sources', columns,
+                                             self._df_rows(df, columns))
+
+            elapsed = time.perf_counter() - start_time
+            logger.info(ScriptIdentifier.DATABASE, f"Inserted {inserted} records into filtered sources table for project {project_name} "
+                        f"in {elapsed:.2f}s ({inserted / max(elapsed, 1e-6):.0f} rows/s)")
+            return inserted
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error inserting filtered metadata: {e} for project {project_name}")
+            return 0
 
     def update_filtered_metadata_succeeded_dl(self, metadata_id: int) -> None:
         """Update filtered metadata with download success"""
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     UPDATE ai_schema.filtered_sources
                     SET success_dl = 'Downloaded'
                     WHERE metadata_id = %s
                 """, (metadata_id,))
-                self.conn.commit()
         except Exception as e:
-            self.conn.rollback()
             logger.error(ScriptIdentifier.DATABASE, 
                         f"Error updating filtered metadata: {e}")
             raise
         
     
+    def update_filtered_metadata_succeeded_dl_many(self, metadata_ids: list) -> int:
+        """Mark many downloaded papers with one statement, returns the number of updated records"""
+        if not metadata_ids:
+            return 0
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE ai_schema.filtered_sources
+                    SET success_dl = 'Downloaded'
+                    WHERE metadata_id = ANY(%s)
+                """, ([int(metadata_id) for metadata_id in metadata_ids],))
+                updated = cursor.rowcount
+            logger.info(ScriptIdentifier.DATABASE, f"Marked {updated} filtered sources as downloaded")
+            return updated
+        except Exception as e:
+            logger.error(ScriptIdentifier.DATABASE, 
+                        f"Error updating filtered metadata: {e}")
+            raise
+
+    def iter_filtered_metadata(self, project_name: str, chunk_rows: int = None):
+        """Stream the filtered sources of a project that are not downloaded yet as DataFrames of chunk_rows rows"""
+        yield from self._stream_frames("""
+            SELECT *
+            FROM ai_schema.filtered_sources
+            WHERE success_dl != 'Downloaded' AND project_name = %s
+            """, (project_name,), chunk_rows)
+
     def get_filtered_metadata(self, project_name: str) -> pd.DataFrame:
         """Get filtered metadata from database"""
         try:
-            with self.conn.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT *
-                    FROM ai_schema.filtered_sources
-                    WHERE success_dl != 'Downloaded' AND project_name = '{project_name}'
-                    """, (project_name,))
-                self.conn.commit()
-                if cursor.rowcount == 0:
-                    logger.info(ScriptIdentifier.DATABASE, 
-                            f"No unprocessed records found for project {project_name}")
-                    return pd.DataFrame()
-                df = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
-                logger.info(ScriptIdentifier.DATABASE, f"Retrieved {len(df)} records from project {project_name}")
+            df = self._concat_frames(self.iter_filtered_metadata(project_name))
+            if df.empty:
+                logger.info(ScriptIdentifier.DATABASE, 
+                        f"No unprocessed records found for project {project_name}")
                 return df
+            logger.info(ScriptIdentifier.DATABASE, f"Retrieved {len(df)} records from project {project_name}")
+            return df
             
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error getting filtered metadata: {e}")
@@ -322,17 +447,24 @@ class BiblioCreator(AIDbManager):
     def __init__(self):
         super().__init__()
 
+    def iter_biblio(self, project_name: str, sort: bool = False, chunk_rows: int = None):
+        """
+        Stream the citations of a project as DataFrames of chunk_rows rows. With sort the database sorts them
+        in code point order, the order of sort_values on the whole DataFrame.
+        """
+        order = 'ORDER BY citation COLLATE "C"' if sort else ''
+        yield from self._stream_frames(f"""
+            SELECT citation FROM ai_schema.summaries_history
+            WHERE projectname = %s
+            {order}
+        """, (project_name,), chunk_rows)
+
     def get_biblio(self, project_name: str) -> pd.DataFrame:
         """ Get From summaries history table ciation column based on project name"""
         try:
-            with self.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT citation FROM ai_schema.summaries_history
-                    WHERE projectname = %s
-                """, (project_name,))
-                df = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
-                logger.info(ScriptIdentifier.DATABASE, f"Retrieved {len(df)} records from project {project_name}")
-                return df
+            df = self._concat_frames(self.iter_biblio(project_name))
+            logger.info(ScriptIdentifier.DATABASE, f"Retrieved {len(df)} records from project {project_name}")
+            return df
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error getting biblio: {e}")
             return pd.DataFrame()
@@ -341,62 +473,123 @@ class BiblioCreator(AIDbManager):
 class OutlineDb (AIDbManager):
     def __init__(self):
         super().__init__()
-        cursor = self.conn.cursor()
-        cursor.execute("""
-                       CREATE TABLE IF NOT EXISTS ai_schema.outlines (
-                       id SERIAL PRIMARY KEY, 
-                       outline TEXT, 
-                       project_name VARCHAR(255),
-                       model VARCHAR(255), 
-                       model_params TEXT, batch TEXT, 
-                       insert_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP 
-                       )
-        """)
-        self.conn.commit()
-        cursor.close()
     
     def insert_outline(self, outline, project_name, model, model_params, batch):
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO ai_schema.outlines (outline, project_name, model, model_params, batch)
                     VALUES (%s, %s, %s, %s, %s)
                 """, (outline, project_name, model, model_params, batch))
-                self.conn.commit()
-                logger.info(ScriptIdentifier.DATABASE, f"Outline for {project_name} inserted successfully to db.")
+            logger.info(ScriptIdentifier.DATABASE, f"Outline for {project_name} inserted successfully to db.")
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error inserting outline to db: {e}")
-            self.conn.rollback()
 
 class ChapterDb(AIDbManager):
     def __init__(self):
         super().__init__()
-        cursor = self.conn.cursor()
-        cursor.execute("""
-                       CREATE TABLE IF NOT EXISTS ai_schema.chapters (
-                       id SERIAL PRIMARY KEY,
-                       chapter_prompt TEXT,
-                       chapter TEXT, 
-                       project_name VARCHAR(255),
-                       model VARCHAR(255), 
-                       model_params TEXT, batch TEXT, 
-                       insert_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP 
-                       )
-        """)
-        self.conn.commit()
-        cursor.close()
     
     def insert_chapter(self, chapterprompt, chapter, project_name, model, model_params, batch):
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO ai_schema.chapters (chapter_prompt, chapter, project_name, model, model_params, batch)
                     VALUES (%s, %s, %s, %s, %s, %s)
                 """, (chapterprompt, chapter, project_name, model, model_params, batch))
-                self.conn.commit()
-                logger.info(ScriptIdentifier.DATABASE, f"Chapter for {project_name} inserted successfully to db.")
+            logger.info(ScriptIdentifier.DATABASE, f"Chapter for {project_name} inserted successfully to db.")
         except Exception as e:
             logger.error(ScriptIdentifier.DATABASE, f"Error inserting chapter to db: {e}")
-            self.conn.rollback()
 
-    
\ No newline at end of file
+
+class CheckpointDb(AIDbManager):
+    """
+    Results of the finished work units of the pipeline stages, so a rerun after a failure only redoes
+    the missing ones. A checkpoint is keyed by (project, stage, input hash, batch index), the input hash
+    covers everything the result depends on (model, parameters, prompt), a changed input is never reused.
+    """
+    def __init__(self):
+        super().__init__()
+        self.enabled = SystemPars().resume_from_checkpoints
+
+    @staticmethod
+    def input_hash(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def load(self, stage: str, input_hash: str, batch_index: int = 0):
+        """Output of a finished work unit, None if it has to run"""
+        if not self.enabled:
+            return None
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT output FROM ai_schema.checkpoints
+                    WHERE project_name = %s AND stage = %s AND input_hash = %s AND batch_index = %s
+                """, (self.project_name, stage, input_hash, batch_index))
+                row = cursor.fetchone()
+            return row[0] if row and row[0] else None
+        except Exception as e:
+            logger.error(ScriptIdentifier.DATABASE, f"Error loading checkpoint {stage}/{batch_index}: {e}")
+            return None
+
+    def save(self, stage: str, input_hash: str, batch_index: int, output: str) -> None:
+        if not output:
+            return
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO ai_schema.checkpoints (project_name, stage, input_hash, batch_index, output)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (project_name, stage, input_hash, batch_index)
+                    DO UPDATE SET output = EXCLUDED.output, insert_date = CURRENT_TIMESTAMP
+                """, (self.project_name, stage, input_hash, batch_index, output))
+        except Exception as e:
+            logger.error(ScriptIdentifier.DATABASE, f"Error saving checkpoint {stage}/{batch_index}: {e}")
+
+    def clear(self, stage: str = None) -> None:
+        """Remove the checkpoints of the project (of one stage), the next run starts from the beginning"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            if stage:
+                cursor.execute("DELETE FROM ai_schema.checkpoints WHERE project_name = %s AND stage = %s",
+                               (self.project_name, stage))
+            else:
+                cursor.execute("DELETE FROM ai_schema.checkpoints WHERE project_name = %s", (self.project_name,))
+            logger.info(ScriptIdentifier.DATABASE, f"Removed {cursor.rowcount} checkpoints of {self.project_name}")
+
+
+class LlmCallsDb(AIDbManager):
+    """Telemetry of the model calls of the agents, one row per attempt (written in batches by LLMTelemetry)"""
+    columns = ['project_name', 'stage', 'provider', 'model', 'prompt_tokens', 'completion_tokens',
+               'latency_ms', 'ttft_ms', 'retries', 'cache_hit', 'success', 'error', 'estimated_cost']
+
+    def __init__(self):
+        super().__init__()
+
+    def insert_calls(self, rows: list) -> int:
+        """rows are dicts with the keys of columns"""
+        with self.connection() as conn, conn.cursor() as cursor:
+            return self._bulk_insert(cursor, 'ai_schema.llm_calls', self.columns,
+                                     [tuple(row.get(column) for column in self.columns) for row in rows])
+
+    def report(self, project_name: str = None) -> pd.DataFrame:
+        """Calls, p50/p95 latency, tokens and spend per project and stage (cache hits are not in the latencies)"""
+        query = """
+            SELECT project_name, stage, provider, model,
+                   COUNT(*) AS calls,
+                   SUM(CASE WHEN cache_hit THEN 1 ELSE 0 END) AS cache_hits,
+                   SUM(CASE WHEN success THEN 0 ELSE 1 END) AS failures,
+                   SUM(retries) FILTER (WHERE success) AS retries,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cache_hit) AS p50_latency_ms,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cache_hit) AS p95_latency_ms,
+                   SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens,
+                   SUM(estimated_cost) AS estimated_cost
+            FROM ai_schema.llm_calls
+            WHERE (%s IS NULL OR project_name = %s)
+            GROUP BY project_name, stage, provider, model
+            ORDER BY project_name, stage, provider, model
+        """
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, (project_name, project_name))
+            columns = [desc[0] for desc in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
@@ -0,0 +1,215 @@
+import sys, argparse
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Union
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import SystemPars
+from src.tools.dedup import dedup_key
+from src.tools.lazy_imports import lazy_module
+
+extras = lazy_module('psycopg2.extras')
+logger = PokoLogger()
+
+"""
+Versioned schema of ai_schema. Every migration runs once per database in its own transaction and is
+recorded in ai_schema.schema_migrations; a statement is SQL or a function that gets the cursor, for data
+changes that belong to the schema change. The database managers apply the pending migrations the first
+time one of them is created in the process (SchemaMigrations in ai_db_manager), so there is no setup step.
+Migrations are only ever added at the end of MIGRATIONS, an applied migration is never changed.
+
+Usage:
+    python src/db_ai/migrations.py              # apply the pending migrations
+    python src/db_ai/migrations.py --status
+    python src/db_ai/query_plans.py             # EXPLAIN check of the lookups of the managers
+"""
+
+# key of the advisory lock that keeps two processes from migrating at the same time
+MIGRATION_LOCK_KEY = 7240193
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: List[Union[str, Callable]]
+
+
+def _backfill_dedup_keys(cursor) -> None:
+    """Give the rows saved before deduplication their key, rows that duplicate an older row keep NULL"""
+    cursor.execute("SELECT project_name, dedup_key FROM ai_schema.papers_metadata WHERE dedup_key IS NOT NULL")
+    taken = set(cursor.fetchall())
+    cursor.execute("""
+        SELECT id, project_name, doi, title FROM ai_schema.papers_metadata
+        WHERE dedup_key IS NULL ORDER BY id
+    """)
+    updates = []
+    for row_id, project_name, doi, title in cursor.fetchall():
+        key = dedup_key(doi, title)
+        if key and (project_name, key) not in taken:
+            taken.add((project_name, key))
+            updates.append((row_id, key))
+    if updates:
+        extras.execute_values(cursor, """
+            UPDATE ai_schema.papers_metadata AS p SET dedup_key = v.dedup_key
+            FROM (VALUES %s) AS v (id, dedup_key) WHERE p.id = v.id
+        """, updates, page_size=SystemPars().db_bulk_batch_size)
+        logger.info(ScriptIdentifier.DATABASE, f"Added dedup keys to {len(updates)} existing papers_metadata records")
+
+
+MIGRATIONS = [
+    # the tables as the managers created them before the migrations, IF NOT EXISTS keeps existing databases as they are
+    Migration(1, "baseline tables", [
+        """CREATE TABLE IF NOT EXISTS ai_schema.summaries_history (
+            id SERIAL PRIMARY KEY,
+            projectname VARCHAR(255),
+            sessionid INTEGER,
+            prompt TEXT,
+            fileeditedname TEXT,
+            tokencountprompt INTEGER,
+            answer TEXT,
+            tokencountanswer INTEGER,
+            timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            model VARCHAR(255),
+            modeldetails TEXT,
+            type_of_prompt VARCHAR(255),
+            citation TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS ai_schema.papers_metadata (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            doi VARCHAR(255),
+            year TEXT,
+            authors TEXT,
+            abstract TEXT,
+            keywords TEXT,
+            relevance_score FLOAT,
+            pdf_url TEXT,
+            publisher TEXT,
+            journal TEXT,
+            type VARCHAR(50),
+            cited_by_count INTEGER,
+            apicalled VARCHAR(50),
+            project_name VARCHAR(50),
+            insert_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        "ALTER TABLE ai_schema.papers_metadata ADD COLUMN IF NOT EXISTS dedup_key TEXT",
+        _backfill_dedup_keys,
+        """CREATE UNIQUE INDEX IF NOT EXISTS papers_metadata_project_dedup_key
+           ON ai_schema.papers_metadata (project_name, dedup_key)""",
+        """CREATE TABLE IF NOT EXISTS ai_schema.filtered_sources (
+            id SERIAL PRIMARY KEY,
+            metadata_id INTEGER REFERENCES ai_schema.papers_metadata(id),
+            title TEXT NOT NULL,
+            doi VARCHAR(255),
+            year TEXT,
+            abstract TEXT,
+            pdf_url TEXT,
+            success_dl TEXT,
+            project_name VARCHAR(255),
+            insert_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS ai_schema.outlines (
+            id SERIAL PRIMARY KEY,
+            outline TEXT,
+            project_name VARCHAR(255),
+            model VARCHAR(255),
+            model_params TEXT, batch TEXT,
+            insert_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS ai_schema.chapters (
+            id SERIAL PRIMARY KEY,
+            chapter_prompt TEXT,
+            chapter TEXT,
+            project_name VARCHAR(255),
+            model VARCHAR(255),
+            model_params TEXT, batch TEXT,
+            insert_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS ai_schema.checkpoints (
+            id SERIAL PRIMARY KEY,
+            project_name VARCHAR(255) NOT NULL,
+            stage VARCHAR(100) NOT NULL,
+            input_hash CHAR(64) NOT NULL,
+            batch_index INTEGER NOT NULL,
+            output TEXT NOT NULL,
+            insert_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (project_name, stage, input_hash, batch_index)
+        )""",
+        """CREATE TABLE IF NOT EXISTS ai_schema.llm_calls (
+            id BIGSERIAL PRIMARY KEY,
+            project_name VARCHAR(255) NOT NULL,
+            stage VARCHAR(100) NOT NULL,
+            provider VARCHAR(50) NOT NULL,
+            model VARCHAR(100),
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            latency_ms INTEGER,
+            ttft_ms INTEGER,
+            retries INTEGER DEFAULT 0,
+            cache_hit BOOLEAN DEFAULT FALSE,
+            success BOOLEAN DEFAULT TRUE,
+            error TEXT,
+            estimated_cost NUMERIC(12, 6),
+            insert_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )""",
+        "CREATE INDEX IF NOT EXISTS llm_calls_project_stage ON ai_schema.llm_calls (project_name, stage)",
+    ]),
+
+    # every lookup of the managers filters by project, session, metadata id or download state.
+    # papers_metadata is already covered by the unique (project_name, dedup_key) index
+    Migration(2, "indexes of the project, session and download lookups", [
+        """CREATE INDEX IF NOT EXISTS summaries_history_project_session
+           ON ai_schema.summaries_history (projectname, sessionid)""",
+        # only the papers still to download are looked up by project, the downloaded ones stay out of the index
+        """CREATE INDEX IF NOT EXISTS filtered_sources_project_pending
+           ON ai_schema.filtered_sources (project_name) WHERE success_dl <> 'Downloaded'""",
+        "CREATE INDEX IF NOT EXISTS filtered_sources_metadata_id ON ai_schema.filtered_sources (metadata_id)",
+        "CREATE INDEX IF NOT EXISTS outlines_project ON ai_schema.outlines (project_name, id)",
+        "CREATE INDEX IF NOT EXISTS chapters_project ON ai_schema.chapters (project_name, id)",
+        "ANALYZE ai_schema.summaries_history",
+        "ANALYZE ai_schema.filtered_sources",
+        "ANALYZE ai_schema.outlines",
+        "ANALYZE ai_schema.chapters",
+    ]),
+
+    # session ids come from a sequence instead of MAX(sessionid) + 1, which read the whole history
+    # and gave two runs started at the same time the same id
+    Migration(3, "sessions table with a sequence for the session ids", [
+        "CREATE SEQUENCE IF NOT EXISTS ai_schema.session_id_seq",
+        """CREATE TABLE IF NOT EXISTS ai_schema.sessions (
+            sessionid INTEGER PRIMARY KEY DEFAULT nextval('ai_schema.session_id_seq'),
+            project_name VARCHAR(255) NOT NULL,
+            purpose VARCHAR(50),
+            started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )""",
+        "ALTER SEQUENCE ai_schema.session_id_seq OWNED BY ai_schema.sessions.sessionid",
+        "CREATE INDEX IF NOT EXISTS sessions_project ON ai_schema.sessions (project_name, sessionid)",
+        """INSERT INTO ai_schema.sessions (sessionid, project_name, purpose, started_at)
+           SELECT sessionid, MIN(projectname), 'summarization', MIN(timestamp)
+           FROM ai_schema.summaries_history
+           WHERE sessionid IS NOT NULL AND projectname IS NOT NULL
+           GROUP BY sessionid
+           ON CONFLICT (sessionid) DO NOTHING""",
+        """SELECT setval('ai_schema.session_id_seq',
+                         COALESCE((SELECT MAX(sessionid) FROM ai_schema.sessions), 0) + 1, false)""",
+    ]),
+]
+
+
+if __name__ == "__main__":
+    from src.db_ai.ai_db_manager import SchemaMigrations
+
+    parser = argparse.ArgumentParser(description="Versioned migrations of ai_schema")
+    parser.add_argument('--status', action='store_true', help="list the applied and pending migrations")
+    args = parser.parse_args()
+
+    migrations = SchemaMigrations()
+    if not args.status:
+        applied = migrations.apply()
+        print(f"Applied migrations: {', '.join(map(str, applied)) or 'none, the schema is up to date'}")
+    applied = migrations.applied()
+    for migration in MIGRATIONS:
+        state = f"applied {applied[migration.version]}" if migration.version in applied else "pending"
+        print(f"{migration.version:>4}  {migration.description:<55} {state}")
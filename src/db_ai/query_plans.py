@@ -0,0 +1,170 @@
+import sys, json, argparse
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from src.config import SystemPars
+
+"""
+EXPLAIN check of the lookups of the database managers. Every lookup runs with EXPLAIN (ANALYZE, FORMAT JSON)
+and fails when it reads its table with a sequential scan or its execution time is over --budget-ms.
+By default --rows synthetic rows over --projects projects are inserted first, so the plans are the plans of a
+large history; everything runs in one transaction that is rolled back, the database is not changed
+(the sequences are not touched either, the synthetic rows have their own ids).
+--rows 0 checks the lookups on the real data of the project of SystemPars.
+
+Usage:
+    python src/db_ai/query_plans.py
+    python src/db_ai/query_plans.py --rows 500000 --projects 1000 --budget-ms 1
+    python src/db_ai/query_plans.py --rows 0 --json
+"""
+
+PROJECT_PREFIX = 'query_plan_check_'
+
+# the queries of the managers in ai_db_manager, the parameters are filled from the checked project
+LOOKUPS = [
+    {'name': 'last_session', 'table': 'sessions',
+     'query': "SELECT MAX(sessionid) FROM ai_schema.sessions", 'params': ()},
+    {'name': 'paper_sources', 'table': 'summaries_history',
+     'query': """SELECT fileeditedname, answer FROM ai_schema.summaries_history
+                 WHERE projectname = %s AND sessionid = ANY(%s) ORDER BY sessionid, id""",
+     'params': ('project', 'session_ids')},
+    {'name': 'biblio', 'table': 'summaries_history',
+     'query': 'SELECT citation FROM ai_schema.summaries_history WHERE projectname = %s ORDER BY citation COLLATE "C"',
+     'params': ('project',)},
+    {'name': 'metadata_by_project', 'table': 'papers_metadata',
+     'query': "SELECT id, title FROM ai_schema.papers_metadata WHERE project_name = %s",
+     'params': ('project',)},
+    {'name': 'filtered_pending', 'table': 'filtered_sources',
+     'query': "SELECT * FROM ai_schema.filtered_sources WHERE success_dl != 'Downloaded' AND project_name = %s",
+     'params': ('project',)},
+    {'name': 'mark_downloaded', 'table': 'filtered_sources',
+     'query': "UPDATE ai_schema.filtered_sources SET success_dl = 'Downloaded' WHERE metadata_id = ANY(%s)",
+     'params': ('metadata_ids',)},
+    {'name': 'outlines_by_project', 'table': 'outlines',
+     'query': "SELECT outline FROM ai_schema.outlines WHERE project_name = %s ORDER BY id",
+     'params': ('project',)},
+    {'name': 'chapters_by_project', 'table': 'chapters',
+     'query': "SELECT chapter FROM ai_schema.chapters WHERE project_name = %s ORDER BY id",
+     'params': ('project',)},
+    {'name': 'checkpoint_load', 'table': 'checkpoints',
+     'query': """SELECT output FROM ai_schema.checkpoints
+                 WHERE project_name = %s AND stage = %s AND input_hash = %s AND batch_index = %s""",
+     'params': ('project', 'stage', 'input_hash', 'batch_index')},
+]
+
+# synthetic history: rows of summaries_history (20 per session), papers_metadata and filtered_sources,
+# rows / 10 outlines, chapters and checkpoints. %(rows)s and %(projects)s are filled in by psycopg2
+SEED = [
+    """INSERT INTO ai_schema.sessions (sessionid, project_name, purpose)
+       SELECT -s, %(prefix)s || (s %% %(projects)s), 'query plan check'
+       FROM generate_series(1, %(rows)s / 20) AS s""",
+    """INSERT INTO ai_schema.summaries_history (projectname, sessionid, prompt, fileeditedname, tokencountprompt,
+                                                answer, tokencountanswer, model, modeldetails, type_of_prompt, citation)
+       SELECT %(prefix)s || ((g / 20) %% %(projects)s), -(g / 20), 'prompt', 'paper_' || g || '.pdf', 1000,
+              repeat('summary ', 40), 300, 'check', 'check', 'summarization', 'Author (' || (2000 + g %% 25) || ')'
+       FROM generate_series(20, %(rows)s + 19) AS g""",
+    """INSERT INTO ai_schema.papers_metadata (title, doi, year, project_name, dedup_key, apicalled)
+       SELECT 'Paper ' || g, '10.5555/check.' || g, '2020', %(prefix)s || (g %% %(projects)s), 'check:' || g, 'check'
+       FROM generate_series(1, %(rows)s) AS g""",
+    """INSERT INTO ai_schema.filtered_sources (metadata_id, title, doi, year, success_dl, project_name)
+       SELECT id, title, doi, year, CASE WHEN id %% 4 = 0 THEN 'NotDownloaded' ELSE 'Downloaded' END, project_name
+       FROM ai_schema.papers_metadata WHERE project_name LIKE %(prefix)s || '%%'""",
+    """INSERT INTO ai_schema.outlines (outline, project_name, model, batch)
+       SELECT repeat('outline ', 40), %(prefix)s || (g %% %(projects)s), 'check', 'Batch ' || g
+       FROM generate_series(1, %(rows)s / 10) AS g""",
+    """INSERT INTO ai_schema.chapters (chapter_prompt, chapter, project_name, model, batch)
+       SELECT 'prompt', repeat('chapter ', 40), %(prefix)s || (g %% %(projects)s), 'check', 'Batch ' || g
+       FROM generate_series(1, %(rows)s / 10) AS g""",
+    """INSERT INTO ai_schema.checkpoints (project_name, stage, input_hash, batch_index, output)
+       SELECT %(prefix)s || (g %% %(projects)s), 'chapter_batch', md5(g::text) || md5(g::text), g, 'output'
+       FROM generate_series(1, %(rows)s / 10) AS g""",
+]
+
+TABLES = ['sessions', 'summaries_history', 'papers_metadata', 'filtered_sources', 'outlines', 'chapters', 'checkpoints']
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def lookup_params(cursor, project: str) -> dict:
+    """Values of the checked project for the parameters of the lookups"""
+    cursor.execute("SELECT DISTINCT sessionid FROM ai_schema.summaries_history WHERE projectname = %s LIMIT 2",
+                   (project,))
+    session_ids = [row[0] for row in cursor.fetchall()] or [0]
+    cursor.execute("SELECT metadata_id FROM ai_schema.filtered_sources WHERE project_name = %s LIMIT 20", (project,))
+    metadata_ids = [row[0] for row in cursor.fetchall() if row[0] is not None] or [0]
+    cursor.execute("SELECT stage, input_hash, batch_index FROM ai_schema.checkpoints WHERE project_name = %s LIMIT 1",
+                   (project,))
+    stage, input_hash, batch_index = cursor.fetchone() or ('chapter_batch', '0' * 64, 0)
+    return {'project': project, 'session_ids': session_ids, 'metadata_ids': metadata_ids,
+            'stage': stage, 'input_hash': input_hash, 'batch_index': batch_index}
+
+
+def check_lookup(cursor, lookup: dict, values: dict, budget_ms: float) -> dict:
+    cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {lookup['query']}",
+                   tuple(values[param] for param in lookup['params']))
+    explain = cursor.fetchone()[0]
+    explain = (json.loads(explain) if isinstance(explain, str) else explain)[0]
+    nodes = list(plan_nodes(explain['Plan']))
+    seq_scans = [node for node in nodes
+                 if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == lookup['table']]
+    scans = [f"{node['Node Type']}" + (f" using {node['Index Name']}" if node.get('Index Name') else '')
+             for node in nodes if 'Scan' in node['Node Type']]
+    execution_ms = explain.get('Execution Time', 0.0)
+    return {
+        'lookup': lookup['name'],
+        'table': lookup['table'],
+        'scans': scans,
+        'rows': explain['Plan'].get('Actual Rows'),
+        'execution_ms': round(execution_ms, 3),
+        'ok': not seq_scans and execution_ms <= budget_ms,
+    }
+
+
+def run_checks(rows: int, projects: int, budget_ms: float) -> list:
+    from src.db_ai.ai_db_manager import AIDbManager
+
+    manager = AIDbManager()
+    with manager.connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                if rows:
+                    for statement in SEED:
+                        cursor.execute(statement, {'prefix': PROJECT_PREFIX, 'rows': rows, 'projects': projects})
+                    for table in TABLES:
+                        cursor.execute(f"ANALYZE ai_schema.{table}")
+                    project = f"{PROJECT_PREFIX}7"
+                else:
+                    project = SystemPars().project_name
+                values = lookup_params(cursor, project)
+                return [check_lookup(cursor, lookup, values, budget_ms) for lookup in LOOKUPS]
+        finally:
+            # the synthetic rows and the update of mark_downloaded are never kept
+            conn.rollback()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN check of the lookups of the PokoScribe database managers")
+    parser.add_argument('--rows', type=int, default=200000, help="synthetic history rows, 0 checks the real data")
+    parser.add_argument('--projects', type=int, default=500, help="projects the synthetic rows are spread over")
+    parser.add_argument('--budget-ms', type=float, default=1.0, help="maximum execution time of a lookup")
+    parser.add_argument('--json', action='store_true', help="print the results as json")
+    args = parser.parse_args(argv)
+
+    results = run_checks(max(0, args.rows), max(1, args.projects), args.budget_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{'ok  ' if result['ok'] else 'FAIL'} {result['lookup']:<22} {result['execution_ms']:>8.3f} ms "
+                  f"{result['rows'] if result['rows'] is not None else '':>7} rows  {', '.join(result['scans'])}")
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
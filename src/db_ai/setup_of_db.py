@@ -7,6 +7,7 @@ load_dotenv('.env')
 logger = PokoLogger()
 
 def run_sql_script(script_path, dbname, user, password, host, port):
+    conn = None
     try:
         # Connect to the default database to create the new database
         conn = psycopg2.connect(dbname="postgres", user=user, password=password, host=host, port=port)
@@ -23,10 +24,11 @@ def run_sql_script(script_path, dbname, user, password, host, port):
             conn.close()
 
 
-# Connect to the new database and run the setup_of_db.sql script
-run_sql_script("db_ai/setup_of_db.sql",
-               dbname=os.getenv('postgresdb'),
-               user=os.getenv('postgresusername'),
-               password=os.getenv('postgrespassword'), 
-               host=os.getenv('postgreshost'), 
-               port=os.getenv('postgresport'))
\ No newline at end of file
+if __name__ == "__main__":
+    # Connect to the new database and run the setup_of_db.sql script
+    run_sql_script("db_ai/setup_of_db.sql",
+                   dbname=os.getenv('postgresdb'),
+                   user=os.getenv('postgresusername'),
+                   password=os.getenv('postgrespassword'), 
+                   host=os.getenv('postgreshost'), 
+                   port=os.getenv('postgresport'))
\ No newline at end of file
@@ -1,17 +1,21 @@
-import sys, os, time, functools
+import sys, os, re, time, functools
 from pathlib import Path
+from dotenv import load_dotenv
 
 # Get the project root directory
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
-from src.config import *
-from src.agents.chapter_maker import *
-from src.agents.ai_summarizer import *
-from src.agents.ai_outliner import *
-from src.tools.ahss import *
-from src.tools.sci_hub_dler import *
-from src.db_ai.ai_db_manager import *
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import span
+from src.config import (SystemPars, ChatGPTPdfSummerizerPars, DeepSeekSummerizerPars, GeminiSummerizerPars,
+                        get_keywords, get_search_queries)
+from src.agents.chapter_maker import DeepSeekChapterMaker, ChatGPTChapterMaker
+from src.agents.ai_summarizer import PDFSummarizer
+from src.agents.ai_outliner import DeepSeekOutliner, ChatGPTOutliner
+from src.db_ai.ai_db_manager import CheckpointDb, GetMetaData
+from src.tools.api_clients import ApiClients
+# the search and download tools (requests, bs4, pandas) are imported by the steps that use them
 
 logger = PokoLogger()
 load_dotenv('.env')
@@ -36,7 +40,8 @@ def ai_agent_timer(script_id):
                 else:
                     logger.info(script_id, f"Starting {func_name}...")
                 
-                result = func(*args, **kwargs)
+                with span(func_name, stage=script_id.value):
+                    result = func(*args, **kwargs)
                 execution_time = time.time() - start_time
                 
                 # Log metrics based on operation type
@@ -52,7 +57,7 @@ def ai_agent_timer(script_id):
                     logger.info(script_id, f"Total files processed: {result.totalfilesprocessed}")
                 if hasattr(result, 'completedfiles'):
                     logger.info(script_id, f"Completed files: {result.completedfiles}")
-                if isinstance(result, pd.DataFrame):
+                if 'pandas' in sys.modules and isinstance(result, sys.modules['pandas'].DataFrame):
                     logger.info(script_id, f"Processed {len(result)} records")
                     
                 return result
@@ -89,8 +94,22 @@ class GetSources:
         Get metadata from the database.
         """
         try:
+            # the search of the same keywords and queries was finished in an earlier run
+            checkpoints = CheckpointDb()
+            input_hash = checkpoints.input_hash(get_keywords(), get_search_queries())
+            if checkpoints.load('metadata', input_hash) is not None:
+                logger.info(ScriptIdentifier.MAIN, "Metadata of these keywords and queries already retrieved, loaded from checkpoint")
+                return
+
+            from src.tools.ahss import AHSSMain
             run_api_search = AHSSMain() # AHSS is a class that handles all API searches together
-            run_api_search.run_search()
+            result = run_api_search.run_search()
+            # a search with failed requests or writes runs again next time, only a complete one is checkpointed
+            if not result.complete:
+                logger.error(ScriptIdentifier.MAIN, f"Metadata search incomplete, failed sources: "
+                             f"{', '.join(result.failed_sources)}. Not checkpointed, the search runs again next time")
+                return
+            checkpoints.save('metadata', input_hash, 0, f"{len(result.metadata)} records")
             logger.info(ScriptIdentifier.MAIN, "Metadata retrieved successfully from the platforms.")
 
         except Exception as e:
@@ -111,9 +130,14 @@ class GetSources:
                 promptfile = f.read()
 
             prompt = f"{promptfile}\n\n{df_retr_json}"
+            checkpoints = CheckpointDb()
+            input_hash = checkpoints.input_hash('deepseek-chat', prompt)
+            if checkpoints.load('filter', input_hash) is not None:
+                logger.info(ScriptIdentifier.MAIN, "These sources were already filtered, loaded from checkpoint")
+                return
             load_dotenv('.env')
             api_key = os.getenv('DEEPSEEK_API_KEY')
-            client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+            client = ApiClients().openai_client('deepseek', api_key)
             
             response = client.chat.completions.create(
                 messages=[
@@ -131,7 +155,8 @@ class GetSources:
                 sql = select_statement.group()
                 # Store the filtered results
                 store_metadata = GetMetaData()
-                store_metadata.insert_filtered_metadata(sql)
+                if store_metadata.insert_filtered_metadata(sql):
+                    checkpoints.save('filter', input_hash, 0, sql)
             else:
                 logger.error(ScriptIdentifier.MAIN, "Could not find SELECT statement in AI response")
 
@@ -144,32 +169,26 @@ class GetSources:
             # Get project name and metadata
             projname = SystemPars().project_name
             retrieve_metadata = GetMetaData()
-            df_retr = retrieve_metadata.get_filtered_metadata(projname)
             
             # Initialize downloader
+            from src.tools.sci_hub_dler import SciHubDler
             dl_paper = SciHubDler()
             
-            # Process each paper
-            for index, row in df_retr.iterrows():
-                try:
+            # Collect the papers with a valid DOI, the filtered sources are read in chunks
+            # so the abstracts of the whole project are never in memory together
+            papers = []
+            for df_retr in retrieve_metadata.iter_filtered_metadata(projname):
+                for index, row in df_retr.iterrows():
                     # Clean and validate DOI
                     doi = str(row['doi']).strip()
                     if not doi or doi == 'N/A':
                         logger.warning(ScriptIdentifier.MAIN, 
                                     f"Invalid DOI for paper: {row['title']}")
                         continue
-                    
-                    # Download paper
-                    success = dl_paper.download_paper(
-                        doi=doi,
-                        title=str(row['title']),
-                        metadata_id=int(row['metadata_id'])
-                    )
-                    
-                except Exception as e:
-                    logger.error(ScriptIdentifier.MAIN, 
-                            f"Error downloading paper {row['title']}: {e}")
-                    continue
+                    papers.append({'doi': doi, 'title': str(row['title']), 'metadata_id': int(row['metadata_id'])})
+
+            # Download the papers concurrently
+            dl_paper.download_many(papers)
                     
         except Exception as e:
             logger.error(ScriptIdentifier.MAIN, 
@@ -250,15 +269,12 @@ class AIBotChapterMaker:
 
     @ai_agent_timer(ScriptIdentifier.MAIN)
     def deepseekchaptermaker(self):
-        chaptermaker = BatchChapterMaker()
+        chaptermaker = DeepSeekChapterMaker()
         chaptermaker.make_chapter()
         return chaptermaker
 
     @ai_agent_timer(ScriptIdentifier.MAIN)
     def chatgptchaptermaker(self):
-        chaptermaker = BatchChapterMaker()
+        chaptermaker = ChatGPTChapterMaker()
         chaptermaker.make_chapter()
         return chaptermaker
-
-pp = GetSources()
-pp.get_metadata()
\ No newline at end of file
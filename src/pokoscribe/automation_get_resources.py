@@ -1,17 +1,16 @@
-import sys, json, re
+import sys, os, json, re
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Add project root to Python path
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
-from src.tools.ahss import CrossRefHandler, OpenAlexHandler, CoreAPIHandler
-from src.tools.sci_hub_dler import *
-from src.db_ai.ai_db_manager import *
-from logs.pokolog import *
-from src.config import SystemPars
+from src.db_ai.ai_db_manager import CheckpointDb, GetMetaData
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import SystemPars, get_keywords, get_search_queries
+from src.tools.api_clients import ApiClients
+# the search and download tools (requests, bs4, pandas) are imported by the steps that use them
 
 logger = PokoLogger()
 
@@ -34,18 +33,23 @@ class GetSources:
         Get metadata from the database.
         """
         try:
-            # Run CrossRef search
-            handler = CrossRefHandler()
-            handler.search_resources()
+            # Run CrossRef, OpenAlex and Core API searches at the same time
+            # the search of the same keywords and queries was finished in an earlier run
+            checkpoints = CheckpointDb()
+            input_hash = checkpoints.input_hash(get_keywords(), get_search_queries())
+            if checkpoints.load('metadata', input_hash) is not None:
+                logger.info(ScriptIdentifier.MAIN, "Metadata of these keywords and queries already retrieved, loaded from checkpoint")
+                return
 
-            # Run OpenAlex search
-            alex_handler = OpenAlexHandler()
-            alex_handler.search_resources()
-
-            # Run Core API search
-            coreapi = CoreAPIHandler()
-            coreapi.search_specific_papers()
-            
+            from src.tools.ahss import AHSSMain
+            run_api_search = AHSSMain()
+            result = run_api_search.run_search()
+            # a search with failed requests or writes runs again next time, only a complete one is checkpointed
+            if not result.complete:
+                logger.error(ScriptIdentifier.MAIN, f"Metadata search incomplete, failed sources: "
+                             f"{', '.join(result.failed_sources)}. Not checkpointed, the search runs again next time")
+                return
+            checkpoints.save('metadata', input_hash, 0, f"{len(result.metadata)} records")
             logger.info(ScriptIdentifier.MAIN, "Metadata retrieved successfully from the platforms.")
         except Exception as e:
             logger.error(ScriptIdentifier.MAIN, f"Failed to get metadata in automated procedure: {e}")
@@ -64,9 +68,14 @@ class GetSources:
                 promptfile = f.read()
 
             prompt = f"{promptfile}\n\n{df_retr_json}"
+            checkpoints = CheckpointDb()
+            input_hash = checkpoints.input_hash('deepseek-chat', prompt)
+            if checkpoints.load('filter', input_hash) is not None:
+                logger.info(ScriptIdentifier.MAIN, "These sources were already filtered, loaded from checkpoint")
+                return
             load_dotenv('.env')
             api_key = os.getenv('DEEPSEEK_API_KEY')
-            client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+            client = ApiClients().openai_client('deepseek', api_key)
             
             response = client.chat.completions.create(
                 messages=[
@@ -84,7 +93,8 @@ class GetSources:
                 sql = select_statement.group()
                 # Store the filtered results
                 store_metadata = GetMetaData()
-                store_metadata.insert_filtered_metadata(sql)
+                if store_metadata.insert_filtered_metadata(sql):
+                    checkpoints.save('filter', input_hash, 0, sql)
             else:
                 logger.error(ScriptIdentifier.MAIN, "Could not find SELECT statement in AI response")
 
@@ -96,32 +106,26 @@ class GetSources:
             # Get project name and metadata
             projname = SystemPars().project_name
             retrieve_metadata = GetMetaData()
-            df_retr = retrieve_metadata.get_filtered_metadata(projname)
             
             # Initialize downloader
+            from src.tools.sci_hub_dler import SciHubDler
             dl_paper = SciHubDler()
             
-            # Process each paper
-            for index, row in df_retr.iterrows():
-                try:
+            # Collect the papers with a valid DOI, the filtered sources are read in chunks
+            # so the abstracts of the whole project are never in memory together
+            papers = []
+            for df_retr in retrieve_metadata.iter_filtered_metadata(projname):
+                for index, row in df_retr.iterrows():
                     # Clean and validate DOI
                     doi = str(row['doi']).strip()
                     if not doi or doi == 'N/A':
                         logger.warning(ScriptIdentifier.MAIN, 
                                     f"Invalid DOI for paper: {row['title']}")
                         continue
-                    
-                    # Download paper
-                    success = dl_paper.download_paper(
-                        doi=doi,
-                        title=str(row['title']),
-                        metadata_id=int(row['metadata_id'])
-                    )
-                    
-                except Exception as e:
-                    logger.error(ScriptIdentifier.MAIN, 
-                            f"Error downloading paper {row['title']}: {e}")
-                    continue
+                    papers.append({'doi': doi, 'title': str(row['title']), 'metadata_id': int(row['metadata_id'])})
+
+            # Download the papers concurrently
+            dl_paper.download_many(papers)
                     
         except Exception as e:
             logger.error(ScriptIdentifier.MAIN, 
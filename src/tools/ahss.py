@@ -1,17 +1,20 @@
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import List, Dict, NamedTuple, Optional
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import quote_plus
 from tqdm import tqdm
 from abc import ABC, abstractmethod
-import sys, requests, time, os, csv, json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys, requests, time, os, csv, json, threading
 
 # Add project root to Python path
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 from src.db_ai.ai_db_manager import *
 from src.config import *
+from src.tools.rate_limiter import RateLimiter
+from src.tools.dedup import dedup_frame
 
 
 """
@@ -26,37 +29,103 @@ Classes:
 - CrossRefHandler: Class for searching academic resources using CrossRef API
 - OpenAlexHandler: Class for searching academic resources using OpenALEX API
 - CoreAPIHandler: Class for searching academic resources using Core API
+- AHSSMain: Runs the searches of all sources at the same time
+
+A failed request or a failed database write is recorded in the errors of the handler, run_search reports
+the sources that did not complete so the caller only checkpoints a complete search.
+
+Every keyword (and every CrossRef page) is a separate request, the requests of a source run in a
+thread pool of ahss_concurrency[source] workers under the shared rate limiter of the source.
 """
 
 load_dotenv('.env')
 logger = PokoLogger()
+rate_limiter = RateLimiter()
 
 class AHSS(ABC):
-    def __init__(self):
+    # common columns of the results of all sources
+    columns = [
+        'title',
+        'doi',
+        'year',
+        'authors',
+        'abstract',
+        'keywords',
+        'relevance_score',
+        'pdf_url',
+        'publisher',
+        'journal',
+        'type',
+        'cited_by_count'
+    ]
+    _sessions = threading.local()
 
-        self.columns = [
-            'title',
-            'doi',
-            'year',
-            'authors',
-            'abstract',
-            'keywords',
-            'relevance_score',
-            'pdf_url',
-            'publisher',
-            'journal',
-            'type',
-            'cited_by_count'
-        ]
+    def __init__(self):
+        # failed requests and writes of this handler, a search with errors is not complete
+        self.errors = []
         try:
         # Load keywords and search queries from config
             self.keywords = get_keywords()
             self.search_queries = get_search_queries()
             self.projname = SystemPars().project_name
         except Exception as e:
-            logger.error(ScriptIdentifier.AHSS, f"Error loading keywords and search queries: {e}")
+            self._error(f"Error loading keywords and search queries: {e}")
+
+    def _error(self, message: str) -> None:
+        logger.error(ScriptIdentifier.AHSS, message)
+        self.errors.append(message)
+
+    def _session(self) -> requests.Session:
+        """Keep-alive session per thread, requests sessions are not shared between threads"""
+        session = getattr(AHSS._sessions, 'session', None)
+        if session is None:
+            session = requests.Session()
+            AHSS._sessions.session = session
+        return session
+
+    def _request(self, provider: str, method: str, url: str, max_throttled_retries: int = 5, **kwargs) -> requests.Response:
+        """Send a request through the shared rate limiter of the provider, throttled requests are sent again after the pause"""
+        for _ in range(max_throttled_retries + 1):
+            rate_limiter.acquire(provider)
+            response = self._session().request(method, url, **kwargs)
+            if not rate_limiter.check_response(provider, response):
+                return response
+        return response
+
+    def _run_tasks(self, provider: str, fetch, tasks: list, desc: str) -> list:
+        """
+        Run fetch(*task) for every task in a thread pool of ahss_concurrency[provider] workers.
+        Returns the results in the order of the tasks, a failed task gives an empty list.
+        """
+        workers = SystemPars().ahss_concurrency.get(provider, 1)
+        results = [[] for _ in tasks]
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"ahss-{provider}") as pool:
+            futures = {pool.submit(fetch, *task): i for i, task in enumerate(tasks)}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    self._error(f"Error in {provider} request {tasks[futures[future]]}: {e}")
+        return results
+
+    def _save_results(self, results: list, apicalled: str, source_name: str) -> pd.DataFrame:
+        """Bring the results in the common columns, remove duplicates, sort by relevance and save them"""
+        if not results:
+            logger.warning(ScriptIdentifier.AHSS, f"No results collected from {source_name}")
+            return pd.DataFrame(columns=self.columns)
+        try:
+            # the same paper found with several keywords is merged to one row with all the keywords
+            df = dedup_frame(pd.DataFrame(results).reindex(columns=self.columns))
+            df = df.sort_values('relevance_score', ascending=False)
 
-        
+            # save the results to database table metadata
+            to_db = SaveMetaData()
+            to_db.save_papers_metadata(df, apicalled, self.projname)
+            logger.info(ScriptIdentifier.AHSS, f"Saved {len(df)} results to database table metadata for {source_name}")
+            return df
+        except Exception as e:
+            self._error(f"Error saving {source_name} results: {e}")
+            return pd.DataFrame(columns=self.columns)
 
     def calculate_relevance_score(self, work: Dict) -> float:
         try:
@@ -114,168 +183,175 @@ class CrossRefHandler(AHSS):
 
         my_mail = os.getenv('MY_MAIL')
 
-        self.base_url = "https://api.crossref.org/works"
+        self.base_url = SystemPars().search_api_urls['crossref']
         self.headers = {
             "User-Agent": f"PokoScribe/1.0 (mailto:{my_mail})"  # Replace with your details
         }
         self.download_path = Path("downloads")
         self.download_path.mkdir(exist_ok=True)
         
+    def fetch_page(self, keyword: str, offset: int, rows: int, from_year: Optional[int] = None) -> List[Dict]:
+        """One page of CrossRef results of the keyword"""
+        query_parts = [
+            f'query.bibliographic="{quote_plus(keyword)}"',
+            'select=DOI,title,abstract,author,published-print,type,URL,link,is-referenced-by-count'
+        ]
+        if from_year:
+            query_parts.append(f'from-pub-date:{from_year}')
+
+        try:
+            url = f"{self.base_url}?{'+'.join(query_parts)}&rows={rows}&offset={offset}"
+            response = self._request('crossref', 'GET', url, headers=self.headers)
+            response.raise_for_status()
+            works = response.json()['message']['items']
+        except requests.exceptions.RequestException as e:
+            self._error(f"Error searching CrossRef API for keyword '{keyword}': {e}")
+            return []
+
+        results = []
+        for work in works:
+            # Get DOI URL if available
+            doi_url = next((link['URL'] for link in work.get('link', [])
+                        if link.get('content-type', '').startswith('application/pdf')), None)
+
+            results.append({
+                'title': work.get('title', [''])[0],
+                'doi': work.get('DOI', ''),
+                'year': work.get('published-print', {}).get('date-parts', [[0]])[0][0],
+                'authors': '; '.join([f"{author.get('given', '')} {author.get('family', '')}" 
+                                for author in work.get('author', [])]),
+                'abstract': work.get('abstract', ''),
+                'keywords': keyword,
+                'relevance_score': self.calculate_relevance_score(work),
+                'pdf_url': doi_url,
+                'publisher': work.get('publisher', ''),
+                'journal': work.get('container-title', [''])[0],
+                'type': work.get('type', ''),
+                'cited_by_count': work.get('is-referenced-by-count', 0)
+            })
+        return results
+
     def search_resources(self, 
                         results_per_keyword: int = 50,
                         from_year: Optional[int] = None) -> pd.DataFrame:
         """
-        Search for academic resources using CrossRef API
+        Search for academic resources using CrossRef API, all pages of all keywords are requested at the same time
         
         Args:
             results_per_keyword: Maximum number of results per keyword
             from_year: Minimum publication year
         """
-        all_results = []
-
-        keywords = self.keywords
-
         logger.info(ScriptIdentifier.AHSS, "Searching for academic resources using CrossRef API")
-        try:
-            for keyword in tqdm(keywords, desc="Processing keywords"):
-                keyword_results = []
-                offset = 0
-                rows = 20  # CrossRef recommended page size
-                
-                query_parts = [
-                f'query.bibliographic="{quote_plus(keyword)}"',
-                'select=DOI,title,abstract,author,published-print,type,URL,link,is-referenced-by-count'
-            ]
-                
-                if from_year:
-                    query_parts.append(f'from-pub-date:{from_year}')
-                    
-                while len(keyword_results) < results_per_keyword:
-                    try:
-                        url = f"{self.base_url}?{'+'.join(query_parts)}&rows={rows}&offset={offset}"
-                        response = requests.get(url, headers=self.headers)
-                        response.raise_for_status()
-                        data = response.json()
-                        
-                        works = data['message']['items']
-                        if not works:
-                            break
-                            
-                        # Process each work
-                        for work in works:
-                            if len(keyword_results) >= results_per_keyword:
-                                break
-                                
-                            # Get DOI URL if available
-                            doi_url = next((link['URL'] for link in work.get('link', [])
-                                        if link.get('content-type', '').startswith('application/pdf')), None)
-                            
-                            result = {
-                                'title': work.get('title', [''])[0],
-                                'doi': work.get('DOI', ''),
-                                'year': work.get('published-print', {}).get('date-parts', [[0]])[0][0],
-                                'authors': '; '.join([f"{author.get('given', '')} {author.get('family', '')}" 
-                                                for author in work.get('author', [])]),
-                                'abstract': work.get('abstract', ''),
-                                'keywords': keyword,
-                                'relevance_score': self.calculate_relevance_score(work),
-                                'pdf_url': doi_url,
-                                'publisher': work.get('publisher', ''),
-                                'journal': work.get('container-title', [''])[0],
-                                'type': work.get('type', ''),
-                                'cited_by_count': work.get('is-referenced-by-count', 0)
-                            }
-
-                            keyword_results.append(result)
-                        
-                        offset += rows
-                        time.sleep(1)  # Respect rate limits
-                        
-                    except requests.exceptions.RequestException as e:
-                        print(f"Error searching CrossRef API for keyword '{keyword}': {e}")
-                        break
-                
-                all_results.extend(keyword_results)
-                time.sleep(2)  # Delay between keywords
-        except Exception as e:
-            logger.error(ScriptIdentifier.AHSS, f"Error searching CrossRef API: {e}")
-
-        try:         
-            # Convert to DataFrame and remove duplicates
-            df = pd.DataFrame(all_results)
-
-            # Remove duplicates and sort by relevance
-            df = df.drop_duplicates()
-            df = df.sort_values('relevance_score', ascending=False)
-
-            # save the results to database table metadata
-            to_db_crossref = SaveMetaData()
-            to_db_crossref.save_papers_metadata(df, 'crossref', self.projname)
-            logger.info(ScriptIdentifier.AHSS, f"Saved {len(df)} results to database table metadata for CrossRef")
-
-        except Exception as e:
-            logger.error(ScriptIdentifier.AHSS, f"Error saving CrossRef results: {e}")
+        rows = 20  # CrossRef recommended page size
+        tasks = [(keyword, offset, rows, from_year)
+                 for keyword in self.keywords
+                 for offset in range(0, results_per_keyword, rows)]
+        pages = self._run_tasks('crossref', self.fetch_page, tasks, "CrossRef requests")
+
+        # pages are in the order of the tasks, keep the first results_per_keyword of every keyword
+        all_results, per_keyword = [], {}
+        for (keyword, _, _, _), page in zip(tasks, pages):
+            for result in page:
+                if per_keyword.get(keyword, 0) < results_per_keyword:
+                    per_keyword[keyword] = per_keyword.get(keyword, 0) + 1
+                    all_results.append(result)
+
+        return self._save_results(all_results, 'crossref', 'CrossRef')
     
 # OpenALEX API Handler Class so we can search for academic resources in the OpenALEX database
 class OpenAlexHandler(AHSS):
+    # only the fields that are stored are requested, the full work objects are many times larger
+    select_fields = [
+        'id', 'doi', 'title', 'publication_year', 'authorships', 'abstract_inverted_index',
+        'primary_location', 'best_oa_location', 'type', 'cited_by_count'
+    ]
+    max_per_page = 200  # OpenAlex maximum page size
+
     def __init__(self):
         super().__init__()
 
+        my_mail = os.getenv('MY_MAIL')
+
+        self.base_url = SystemPars().search_api_urls['openalex']
+        # requests with a mail address are served by the faster OpenAlex polite pool
+        self.mailto = my_mail
+        self.headers = {
+            "User-Agent": f"PokoScribe/1.0 (mailto:{my_mail})"
+        }
+
     def get_author_names(self, authorships):
         authors = []
-        for authorship in authorships:
+        for authorship in authorships or []:
             if 'author' in authorship:
                 author = authorship['author']
                 name = author.get('display_name', 'Unknown Author')
                 authors.append(name)
         return '; '.join(authors)  # Join authors with semicolon
 
-    def search_resources(self, results_per_keyword: int = 50) -> pd.DataFrame:
-            all_results = []
-            keywords = self.keywords
-
-            logger.info(ScriptIdentifier.AHSS, "Searching for academic resources using OpenALEX API")
-            
-            for keyword in tqdm(keywords, desc="Processing keywords"):
-                try:
-                    url = f"https://api.openalex.org/works?search={keyword}&per_page={results_per_keyword}"
-                    response = requests.get(url)
-                    data = response.json()
-                    
-                    for work in data.get("results", []):
-                        result = {
-                            'title': work.get('title', 'No title available'),
-                            'doi': work.get('doi', 'N/A'),
-                            'year': work.get('publication_year', 'N/A'),
-                            'authors': self.get_author_names(work.get('authorships', [])),
-                            'abstract': work.get('abstract', 'N/A'),
-                            'keywords': keyword,
-                            'relevance_score': self.calculate_relevance_score(work),
-                            'pdf_url': work.get('pdf_url', 'N/A'),
-                            'publisher': work.get('publisher', 'N/A'),
-                            'journal': work.get('journal', 'N/A'),
-                            'type': work.get('type', 'N/A'),
-                            'cited_by_count': work.get('cited_by_count', 0)
-                        }
-                        all_results.append(result)
-                        time.sleep(1)
-                except requests.exceptions.RequestException as e:
-                    print(f"Error searching OpenALEX API for keyword '{keyword}': {e}")
-                    break
-                    
+    @staticmethod
+    def rebuild_abstract(inverted_index: Optional[Dict]) -> str:
+        """OpenAlex gives the abstract as {word: [positions]}, put the words back in order"""
+        if not inverted_index:
+            return 'N/A'
+        positions = {}
+        for word, word_positions in inverted_index.items():
+            for position in word_positions:
+                positions[position] = word
+        return ' '.join(positions[position] for position in sorted(positions))
+
+    def fetch_keyword(self, keyword: str, results_per_keyword: int) -> List[Dict]:
+        """OpenAlex results of one keyword, pages are followed with the cursor until results_per_keyword"""
+        results = []
+        cursor = '*'
+        per_page = min(self.max_per_page, results_per_keyword)
+        while cursor and len(results) < results_per_keyword:
+            params = {
+                'search': keyword,
+                'select': ','.join(self.select_fields),
+                'per-page': per_page,
+                'cursor': cursor,
+            }
+            if self.mailto:
+                params['mailto'] = self.mailto
             try:
-                # Convert to DataFrame and remove duplicates
-                df = pd.DataFrame(all_results)
-                df = df.drop_duplicates()
-                df = df.sort_values('relevance_score', ascending=False)
-
-                # save the results to database table metadata
-                to_db_openalex = SaveMetaData()
-                to_db_openalex.save_papers_metadata(df, 'openalex', self.projname)
-                logger.info(ScriptIdentifier.AHSS, f"Saved {len(df)} results to database table metadata for OpenALEX")
+                response = self._request('openalex', 'GET', self.base_url, params=params, headers=self.headers)
+                response.raise_for_status()
+                data = response.json()
+            except requests.exceptions.RequestException as e:
+                self._error(f"Error searching OpenALEX API for keyword '{keyword}': {e}")
+                break
+
+            works = data.get("results", [])
+            if not works:
+                break
+            for work in works[:results_per_keyword - len(results)]:
+                abstract = self.rebuild_abstract(work.get('abstract_inverted_index'))
+                primary_location = work.get('primary_location') or {}
+                oa_location = work.get('best_oa_location') or {}
+                source = primary_location.get('source') or {}
+                results.append({
+                    'title': work.get('title') or 'No title available',
+                    'doi': work.get('doi') or 'N/A',
+                    'year': work.get('publication_year', 'N/A'),
+                    'authors': self.get_author_names(work.get('authorships', [])),
+                    'abstract': abstract,
+                    'keywords': keyword,
+                    'relevance_score': self.calculate_relevance_score({**work, 'abstract': abstract}),
+                    'pdf_url': oa_location.get('pdf_url') or primary_location.get('pdf_url') or 'N/A',
+                    'publisher': source.get('host_organization_name') or 'N/A',
+                    'journal': source.get('display_name') or 'N/A',
+                    'type': work.get('type', 'N/A'),
+                    'cited_by_count': work.get('cited_by_count', 0)
+                })
+            cursor = data.get('meta', {}).get('next_cursor')
+        return results
 
-            except Exception as e:
-                logger.error(ScriptIdentifier.AHSS, f"Error saving OpenALEX results: {e}")
+    def search_resources(self, results_per_keyword: int = 50) -> pd.DataFrame:
+        logger.info(ScriptIdentifier.AHSS, "Searching for academic resources using OpenALEX API")
+        tasks = [(keyword, results_per_keyword) for keyword in self.keywords]
+        results = self._run_tasks('openalex', self.fetch_keyword, tasks, "OpenALEX requests")
+        return self._save_results([work for keyword_results in results for work in keyword_results],
+                                  'openalex', 'OpenALEX')
 
 # Core API Handler Class so we can search for academic resources in the Core database
 class CoreAPIHandler(AHSS):
@@ -284,6 +360,7 @@ class CoreAPIHandler(AHSS):
         logger.info(ScriptIdentifier.AHSS, "Initializing Core API Handler")
         try:
             self.api_key = os.getenv('CORE_API_KEY')
+            self.base_url = SystemPars().search_api_urls['core']
 
             self.headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -291,64 +368,58 @@ class CoreAPIHandler(AHSS):
             }
             logger.info(ScriptIdentifier.AHSS, "Core API Handler initialized")
         except Exception as e:
-            logger.error(ScriptIdentifier.AHSS, f"Error initializing Core API Handler: {e}")
+            self._error(f"Error initializing Core API Handler: {e}")
         
-    def search_specific_papers(self) -> List[Dict]:
-        search_queries = self.search_queries
+    def fetch_query(self, query: str) -> List[Dict]:
+        """CORE papers of one search query that contain at least one of the required keywords"""
         required_keywords = self.keywords
-        papers = []
+        # Combine query with required keywords using OR
+        keyword_query = " OR ".join(f'"{keyword}"' for keyword in required_keywords)
+        enhanced_query = f'({query}) AND ({keyword_query})'
         
-        # Create enhanced query with required keywords
-        for query in search_queries:
-            # Combine query with required keywords using OR
-            keyword_query = " OR ".join(f'"{keyword}"' for keyword in required_keywords)
-            enhanced_query = f'({query}) AND ({keyword_query})'
-            
-            payload = {
-                "q": enhanced_query,
-                "limit": 50,
-                "filters": {
-                    "year": {"gte": 2015},
-                    "types": ["journal-article"],
-                    "lang": "en"
-                }
+        payload = {
+            "q": enhanced_query,
+            "limit": 50,
+            "filters": {
+                "year": {"gte": 2015},
+                "types": ["journal-article"],
+                "lang": "en"
             }
-            
-            try:
-                logger.debug(ScriptIdentifier.AHSS, f"Sending request with enhanced query: {enhanced_query}")
-                response = requests.post(
-                    "https://api.core.ac.uk/v3/search/works",
-                    headers=self.headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                
-                response_data = response.json()
-                
-                if 'results' in response_data:
-                    # Filter results that contain at least one required keyword
-                    filtered_results = []
-                    for result in response_data['results']:
-                        title = str(result.get('title', '')).lower()
-                        abstract = str(result.get('abstract', '')).lower()
-                        
-                        # Check if any required keyword is present
-                        if any(keyword.lower() in title or keyword.lower() in abstract 
-                            for keyword in required_keywords):
-                            filtered_results.append(result)
-                    
-                    papers.extend(filtered_results)
-                    logger.info(ScriptIdentifier.AHSS, 
-                            f"Found {len(filtered_results)} relevant papers for query: {query}")
-                else:
-                    logger.error(ScriptIdentifier.AHSS, f"Unexpected response structure for query: {query}")
-                
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(ScriptIdentifier.AHSS, f"Error searching Core API for query '{query}': {e}")
-                continue
+        }
+        
+        logger.debug(ScriptIdentifier.AHSS, f"Sending request with enhanced query: {enhanced_query}")
+        response = self._request(
+            'core', 'POST',
+            self.base_url,
+            headers=self.headers,
+            json=payload
+        )
+        response.raise_for_status()
+        
+        response_data = response.json()
+        if 'results' not in response_data:
+            self._error(f"Unexpected response structure for query: {query}")
+            return []
 
+        # Filter results that contain at least one required keyword
+        filtered_results = []
+        for result in response_data['results']:
+            title = str(result.get('title', '')).lower()
+            abstract = str(result.get('abstract', '')).lower()
+            
+            # Check if any required keyword is present
+            if any(keyword.lower() in title or keyword.lower() in abstract 
+                for keyword in required_keywords):
+                filtered_results.append(result)
+        
+        logger.info(ScriptIdentifier.AHSS, 
+                f"Found {len(filtered_results)} relevant papers for query: {query}")
+        return filtered_results
+
+    def search_specific_papers(self) -> pd.DataFrame:
+        tasks = [(query,) for query in self.search_queries]
+        papers = [paper for query_papers in self._run_tasks('core', self.fetch_query, tasks, "CORE requests")
+                  for paper in query_papers]
             
         logger.info(ScriptIdentifier.AHSS, f"Total papers found: {len(papers)}")
         metadata = []
@@ -376,41 +447,62 @@ class CoreAPIHandler(AHSS):
                 }
                 metadata.append(metadata_entry)
             except Exception as e:
-                logger.error(ScriptIdentifier.AHSS, f"Error processing paper metadata: {e}")
+                self._error(f"Error processing paper metadata: {e}")
                 continue
         
-        if not metadata:
-            logger.warning(ScriptIdentifier.AHSS, "No metadata collected from papers")
-            return []
-            
-        try:
-            df = pd.DataFrame(metadata)
-            df = df.drop_duplicates()
-            df = df.sort_values('relevance_score', ascending=False)
+        return self._save_results(metadata, 'coreapi', 'Core API')
+
+class SearchResult(NamedTuple):
+    metadata: pd.DataFrame
+    # sources with a failed request or a failed database write
+    failed_sources: list
+
+    @property
+    def complete(self) -> bool:
+        """Every source answered all its requests and its results are saved in the database"""
+        return not self.failed_sources
 
-            # save the results to database table metadata
-            to_db_coreapi = SaveMetaData()
-            to_db_coreapi.save_papers_metadata(df, 'coreapi', self.projname)
-            logger.info(ScriptIdentifier.AHSS, f"Saved {len(df)} results to database table metadata for Core API")
-            
-        except Exception as e:
-            logger.error(ScriptIdentifier.AHSS, f"Error saving Core API results: {e}")
-            return []
 
 # Main class for running the AHSS search and all classes together
 class AHSSMain:
-    def __int__(self):
-        pass
-
-    def run_search(self):
-    # Run CrossRef search
-        handler = CrossRefHandler()
-        handler.search_resources()
+    def __init__(self):
+        self.columns = list(AHSS.columns)
 
-        # Run OpenAlex search
-        alex_handler = OpenAlexHandler()
-        alex_handler.search_resources()
+    @staticmethod
+    def _search(handler_class, method: str) -> tuple:
+        handler = handler_class()
+        return getattr(handler, method)(), handler.errors
 
-        # Run Core API search
-        coreapi = CoreAPIHandler()
-        coreapi.search_specific_papers()
+    def run_search(self) -> SearchResult:
+        """
+        Run the searches of all sources at the same time, so collecting the metadata takes about as long
+        as the slowest source. Returns the deduplicated results of all sources in the common columns and
+        the sources that did not complete.
+        """
+        searches = {
+            'crossref': (CrossRefHandler, 'search_resources'),
+            'openalex': (OpenAlexHandler, 'search_resources'),
+            'coreapi': (CoreAPIHandler, 'search_specific_papers'),
+        }
+        frames, failed_sources = [], []
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(searches), thread_name_prefix="ahss") as pool:
+            futures = {pool.submit(self._search, *search): source for source, search in searches.items()}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    df, errors = future.result()
+                    frames.append(df.assign(apicalled=source))
+                    if errors:
+                        failed_sources.append(source)
+                    logger.info(ScriptIdentifier.AHSS, f"{source} search finished with {len(df)} results and "
+                                f"{len(errors)} errors after {time.perf_counter() - start_time:.1f}s")
+                except Exception as e:
+                    failed_sources.append(source)
+                    logger.error(ScriptIdentifier.AHSS, f"Error in {source} search: {e}")
+
+        if not frames:
+            return SearchResult(pd.DataFrame(columns=self.columns + ['apicalled']), failed_sources)
+        # the same paper found in several sources is one row, as in papers_metadata
+        merged = pd.concat(frames, ignore_index=True)[self.columns + ['apicalled']]
+        return SearchResult(dedup_frame(merged), failed_sources)
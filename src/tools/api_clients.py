@@ -0,0 +1,93 @@
+import sys, json, threading
+from pathlib import Path
+from typing import Optional
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import SystemPars
+
+logger = PokoLogger()
+
+"""
+Registry of API clients shared by all agents and tools.
+Every new OpenAI() client opens its own HTTP connection pool, so a client per call means a new TLS
+handshake per call. The registry keeps one keep-alive client per (provider, api_key, base_url) for the
+whole process, and for Gemini configures the SDK once per api key and reuses the GenerativeModel.
+
+Usage:
+    api_clients = ApiClients()
+    client = api_clients.openai_client('deepseek', os.getenv('DEEPSEEK_API_KEY'))
+    model = api_clients.gemini_model(api_key, 'gemini-1.5-pro', generation_config)
+"""
+
+
+class ApiClients:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(ApiClients, cls).__new__(cls)
+                sys_params = SystemPars()
+                cls._instance.base_urls = sys_params.api_base_urls
+                cls._instance.max_connections = sys_params.http_max_connections
+                cls._instance.max_keepalive_connections = sys_params.http_max_keepalive_connections
+                cls._instance.timeout = sys_params.http_timeout
+                cls._instance.clients = {}
+                cls._instance.gemini_models = {}
+                cls._instance.gemini_api_key = None
+        return cls._instance
+
+    def openai_client(self, provider: str, api_key: str, base_url: Optional[str] = None):
+        """OpenAI compatible client (openai, deepseek) with a pooled keep-alive HTTP connection"""
+        base_url = base_url or self.base_urls.get(provider)
+        key = (provider, api_key, base_url)
+        client = self.clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self.clients.get(key)
+                if client is None:
+                    import httpx
+                    from openai import OpenAI, DefaultHttpxClient
+
+                    http_client = DefaultHttpxClient(
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_keepalive_connections),
+                        timeout=self.timeout
+                    )
+                    client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+                    self.clients[key] = client
+                    logger.info(ScriptIdentifier.APICLIENTS, f"Created {provider} client ({base_url or 'default url'})")
+        return client
+
+    def gemini_model(self, api_key: str, model_name: str, generation_config: dict):
+        """GenerativeModel reused for the same api key, model and generation config"""
+        key = (api_key, model_name, json.dumps(generation_config, sort_keys=True, default=str))
+        model = self.gemini_models.get(key)
+        if model is None:
+            with self._lock:
+                model = self.gemini_models.get(key)
+                if model is None:
+                    import google.generativeai as genai
+
+                    # configure is global in the SDK, only call it when the key changes
+                    if self.gemini_api_key != api_key:
+                        genai.configure(api_key=api_key)
+                        self.gemini_api_key = api_key
+                    model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+                    self.gemini_models[key] = model
+                    logger.info(ScriptIdentifier.APICLIENTS, f"Created Gemini model {model_name}")
+        return model
+
+    def close(self) -> None:
+        """Close the HTTP connection pools of all clients"""
+        with self._lock:
+            for client in self.clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(ScriptIdentifier.APICLIENTS, f"Error closing client: {e}")
+            self.clients = {}
@@ -1,20 +1,32 @@
 #create bibliography file from a db
-import sys
+import os, sys
 from pathlib import Path
 # Add project root to Python path
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
-from src.config import *
-from src.db_ai.ai_db_manager import AIDbManager, BiblioCreator
+from src.config import SystemPars
+from src.db_ai.ai_db_manager import BiblioCreator
 
-projname = SystemPars().project_name
 
-get_cits = BiblioCreator()
-df = get_cits.get_biblio(projname)
+def create_biblio(project_name: str = None) -> Path:
+    """
+    Write the citations of the project, sorted, to resources/bibliography.txt. The citations are sorted by the
+    database and written chunk by chunk, the memory used does not grow with the size of the project.
+    """
+    projname = project_name or SystemPars().project_name
 
-df = df.sort_values(['citation'], ascending=[True])
+    get_cits = BiblioCreator()
+    outfile = project_root / 'resources' / 'bibliography.txt'
+    with open(outfile, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for df in get_cits.iter_biblio(projname, sort=True):
+            df.to_csv(f, sep='\t', index=False, header=header)
+            header = False
+        if header:
+            f.write('citation' + os.linesep)
+    return outfile
 
 
-outfile = project_root / 'resources' / 'bibliography.txt'
-df.to_csv(outfile, sep='\t', index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    create_biblio()
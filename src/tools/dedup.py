@@ -0,0 +1,133 @@
+from __future__ import annotations
+import sys, re, hashlib, threading, unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from src.tools.lazy_imports import lazy_module
+
+pd = lazy_module('pandas')
+
+"""
+Deduplication of paper metadata across keywords, sources and runs of a project.
+A paper is identified by its normalized DOI, or by a hash of its normalized title when it has no DOI.
+DedupIndex merges the rows of the same paper in memory before they are saved, the unique index
+(project_name, dedup_key) of papers_metadata merges them with the rows of the earlier runs.
+Merged rows keep the union of the keywords and the highest citation count and relevance score.
+
+Usage:
+    index = DedupIndex()
+    index.add_many(rows)
+    rows = index.rows()
+"""
+
+DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.I)
+MISSING_VALUES = {'', 'n/a', 'na', 'none', 'nan', 'no title available'}
+KEYWORD_SEPARATOR = '; '
+
+
+def _is_missing(value) -> bool:
+    # value != value is only true for NaN (float nan, numpy nan), without loading pandas for it
+    return value is None or (isinstance(value, float) and value != value) or str(value).strip().lower() in MISSING_VALUES
+
+
+def normalize_doi(doi) -> Optional[str]:
+    """10.1000/ABC, https://doi.org/10.1000/abc and doi:10.1000/abc are the same DOI"""
+    if _is_missing(doi):
+        return None
+    doi = DOI_PREFIX.sub('', str(doi).strip()).strip().lower()
+    return doi if doi.startswith('10.') else None
+
+
+def normalize_title(title) -> Optional[str]:
+    """Lowercase title without accents, punctuation and repeated spaces"""
+    if _is_missing(title):
+        return None
+    title = unicodedata.normalize('NFKD', str(title))
+    title = ''.join(c for c in title if not unicodedata.combining(c)).lower()
+    title = re.sub(r'<[^>]+>', ' ', title)  # CrossRef titles can contain markup
+    title = re.sub(r'[^0-9a-z]+', ' ', title).strip()
+    return title or None
+
+
+def dedup_key(doi, title) -> Optional[str]:
+    normalized_doi = normalize_doi(doi)
+    if normalized_doi:
+        return f"doi:{normalized_doi}"
+    normalized_title = normalize_title(title)
+    if normalized_title:
+        return f"title:{hashlib.sha1(normalized_title.encode('utf-8')).hexdigest()}"
+    return None
+
+
+def merge_keywords(*values) -> str:
+    """Union of keyword strings/lists in order of first appearance"""
+    keywords = []
+    for value in values:
+        if isinstance(value, (list, tuple, set)):
+            parts = value
+        elif _is_missing(value):
+            parts = []
+        else:
+            parts = str(value).split(KEYWORD_SEPARATOR.strip())
+        for part in parts:
+            part = str(part).strip()
+            if part and part not in keywords:
+                keywords.append(part)
+    return KEYWORD_SEPARATOR.join(keywords)
+
+
+def _max(a, b):
+    values = [v for v in (a, b) if not _is_missing(v)]
+    return max(values) if values else a
+
+
+class DedupIndex:
+    """In memory index of the papers of one ingestion, safe to share between threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.papers: Dict[str, dict] = {}
+        self.unkeyed: List[dict] = []
+        self.duplicates = 0
+
+    def add(self, row: dict) -> bool:
+        """Add a paper, returns False if it was merged into a paper that was already in the index"""
+        row = dict(row)
+        row['keywords'] = merge_keywords(row.get('keywords'))
+        row['dedup_key'] = dedup_key(row.get('doi'), row.get('title'))
+        with self.lock:
+            if row['dedup_key'] is None:
+                self.unkeyed.append(row)
+                return True
+            existing = self.papers.get(row['dedup_key'])
+            if existing is None:
+                self.papers[row['dedup_key']] = row
+                return True
+
+            self.duplicates += 1
+            existing['keywords'] = merge_keywords(existing.get('keywords'), row.get('keywords'))
+            existing['cited_by_count'] = _max(existing.get('cited_by_count'), row.get('cited_by_count'))
+            existing['relevance_score'] = _max(existing.get('relevance_score'), row.get('relevance_score'))
+            # fill the fields the first source did not have
+            for column, value in row.items():
+                if _is_missing(existing.get(column)) and not _is_missing(value):
+                    existing[column] = value
+            return False
+
+    def add_many(self, rows: List[dict]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def rows(self) -> List[dict]:
+        with self.lock:
+            return list(self.papers.values()) + list(self.unkeyed)
+
+
+def dedup_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Merge the duplicate papers of a DataFrame and add the dedup_key column"""
+    index = DedupIndex()
+    index.add_many(df.to_dict('records'))
+    return pd.DataFrame(index.rows(), columns=list(df.columns) + ['dedup_key'])
@@ -0,0 +1,109 @@
+import sys, json, argparse, statistics, subprocess
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+"""
+Import-time benchmark of the PokoScribe modules. Every module is imported in a fresh interpreter
+(cold import, repeated --runs times) with the network and the database blocked: a socket connect,
+a sqlite connect or an opened database pool during the import is reported as a side effect.
+It also lists the heavy dependencies that the import loaded, these should only load when they are used.
+Exits with 1 when an import has side effects or its median is over --budget-ms.
+
+Usage:
+    python src/tools/import_benchmark.py
+    python src/tools/import_benchmark.py --runs 10 --budget-ms 150 --json
+    python src/tools/import_benchmark.py src.agents.ai_outliner
+"""
+
+DEFAULT_MODULES = [
+    'src',
+    'src.config',
+    'src.pokoscribe.PokoScribe',
+    'src.agents.ai_summarizer',
+    'src.agents.ai_outliner',
+    'src.agents.chapter_maker',
+    'src.tools.create_biblio',
+    'src.db_ai.setup_of_db',
+]
+
+HEAVY_MODULES = ['pandas', 'numpy', 'tiktoken', 'psycopg2', 'requests', 'tqdm', 'bs4',
+                 'openai', 'httpx', 'google.generativeai', 'PyPDF2']
+
+# runs in the child interpreter, prints one json line. Postgres is reached through libpq and not through
+# python sockets, an opened connection pool of the db managers is reported instead
+PROBE = r'''
+import sys, json, time, socket, sqlite3, importlib
+sys.path.insert(0, {root!r})
+effects = []
+def blocked(kind):
+    def guard(*args, **kwargs):
+        effects.append(kind)
+        raise OSError(kind + " blocked during the import benchmark")
+    return guard
+socket.socket.connect = blocked("network")
+sqlite3.connect = blocked("sqlite")
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = (time.perf_counter() - start) * 1000
+db = sys.modules.get("src.db_ai.ai_db_manager")
+if db is not None and db.AIDbManager._pool is not None:
+    effects.append("postgres")
+print(json.dumps({{"ms": elapsed, "effects": effects, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module: str, runs: int) -> dict:
+    times, effects, heavy = [], set(), set()
+    for _ in range(runs):
+        code = PROBE.format(root=str(project_root), module=module, heavy=HEAVY_MODULES)
+        result = subprocess.run([sys.executable, '-c', code], cwd=str(project_root),
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return {'module': module, 'error': result.stderr.strip().splitlines()[-1:]}
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(probe['ms'])
+        effects.update(probe['effects'])
+        heavy.update(probe['heavy'])
+    return {
+        'module': module,
+        'median_ms': round(statistics.median(times), 1),
+        'max_ms': round(max(times), 1),
+        'side_effects': sorted(effects),
+        'heavy_loaded': sorted(heavy),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cold import time and import side effects of the PokoScribe modules")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None, help="fail when a median is over this budget")
+    parser.add_argument('--json', action='store_true', help="print the results as json")
+    args = parser.parse_args(argv)
+
+    results = [measure(module, max(1, args.runs)) for module in args.modules]
+    failed = False
+    for result in results:
+        if 'error' in result or result['side_effects']:
+            failed = True
+        elif args.budget_ms is not None and result['median_ms'] > args.budget_ms:
+            failed = True
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            if 'error' in result:
+                print(f"{result['module']:<32} ERROR {' '.join(result['error'])}")
+                continue
+            print(f"{result['module']:<32} median {result['median_ms']:>7.1f} ms  max {result['max_ms']:>7.1f} ms  "
+                  f"side effects: {', '.join(result['side_effects']) or 'none'}  "
+                  f"heavy: {', '.join(result['heavy_loaded']) or 'none'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
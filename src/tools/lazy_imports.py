@@ -0,0 +1,43 @@
+import importlib, threading
+
+"""
+Lazy loading of the heavy dependencies (pandas, requests, psycopg2, tqdm, tiktoken).
+lazy_module returns a stand-in for the module that imports it the first time one of its attributes is used,
+so importing PokoScribe or one agent does not pay for the libraries that the run never touches.
+Modules that use a lazy module in annotations need `from __future__ import annotations`.
+
+Usage:
+    pd = lazy_module('pandas')
+    df = pd.DataFrame(rows)    # pandas is imported here
+"""
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with self.__dict__['_lock']:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = importlib.import_module(self.__dict__['_name'])
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
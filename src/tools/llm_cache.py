@@ -0,0 +1,155 @@
+import sys, json, time, sqlite3, hashlib, threading
+from pathlib import Path
+from typing import Optional
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import SystemPars
+
+logger = PokoLogger()
+
+"""
+Persistent cache of AI model responses shared by all agents.
+The key is a sha256 hash of (provider, model, parameters, messages), so a rerun with byte identical
+prompts, model and parameters is answered from the local SQLite file instead of the API.
+Entries older than llm_cache_max_age_days are removed and the least recently used entries are removed
+when the cache grows over llm_cache_max_entries. Set llm_cache_enabled = False in config.py to opt out.
+
+Usage:
+    llm_cache = LLMCache()
+    key = llm_cache.make_key('deepseek', 'deepseek-chat', params, messages)
+    answer = llm_cache.get(key)
+    if answer is None:
+        answer = call_the_api()
+        llm_cache.put(key, answer)
+"""
+
+
+class LLMCache:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(LLMCache, cls).__new__(cls)
+                cls._instance._setup()
+        return cls._instance
+
+    def _setup(self):
+        sys_params = SystemPars()
+        self.enabled = sys_params.llm_cache_enabled
+        self.path = Path(sys_params.llm_cache_path)
+        self.max_entries = sys_params.llm_cache_max_entries
+        self.max_age = sys_params.llm_cache_max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        self.db_lock = threading.Lock()
+        if not self.enabled:
+            logger.info(ScriptIdentifier.LLMCACHE, "LLM response cache disabled")
+
+    def _connect(self) -> bool:
+        """Open the cache file on first use (not on import of the agents), called with db_lock held"""
+        if self.conn is not None:
+            return True
+        if not self.enabled:
+            return False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.conn.commit()
+            self._evict()
+            logger.info(ScriptIdentifier.LLMCACHE, f"LLM response cache ready at {self.path}")
+            return True
+        except Exception as e:
+            logger.error(ScriptIdentifier.LLMCACHE, f"Error opening LLM response cache, caching disabled: {e}")
+            self.enabled = False
+            self.conn = None
+            return False
+
+    @staticmethod
+    def make_key(provider: str, model: str, params, messages) -> str:
+        """Hash of everything that determines the answer of the model"""
+        payload = json.dumps({'provider': provider, 'model': model, 'params': params, 'messages': messages},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            with self.db_lock:
+                if not self._connect():
+                    return None
+                row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                if row and now - row[1] <= self.max_age:
+                    self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self.conn.commit()
+                    self.hits += 1
+                    return row[0]
+                self.misses += 1
+                return None
+        except Exception as e:
+            logger.warning(ScriptIdentifier.LLMCACHE, f"Error reading LLM response cache: {e}")
+            return None
+
+    def put(self, key: str, response: str, provider: str = None, model: str = None) -> None:
+        if not self.enabled or not response:
+            return
+        try:
+            with self.db_lock:
+                if not self._connect():
+                    return
+                now = time.time()
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO responses (key, provider, model, response, created, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (key, provider, model, response, now, now))
+                self.conn.commit()
+        except Exception as e:
+            logger.warning(ScriptIdentifier.LLMCACHE, f"Error writing LLM response cache: {e}")
+
+    def evict(self) -> None:
+        """Remove expired entries and keep only the max_entries most recently used"""
+        with self.db_lock:
+            if self._connect():
+                self._evict()
+
+    def _evict(self) -> None:
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+        self.conn.execute("""
+            DELETE FROM responses WHERE key NOT IN (
+                SELECT key FROM responses ORDER BY last_used DESC LIMIT ?
+            )
+        """, (self.max_entries,))
+        self.conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+    def log_stats(self, script_id: ScriptIdentifier) -> None:
+        if self.enabled:
+            stats = self.stats()
+            logger.info(script_id, f"LLM cache hits: {stats['hits']} | misses: {stats['misses']} | hit rate: {stats['hit_rate']:.0%}")
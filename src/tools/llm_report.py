@@ -0,0 +1,43 @@
+import sys, argparse
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+import pandas as pd
+from src.db_ai.ai_db_manager import LlmCallsDb
+
+"""
+Report of the model calls recorded in ai_schema.llm_calls: calls, cache hits, failures, retries,
+p50/p95 latency, tokens and estimated spend per project, stage, provider and model.
+
+Usage:
+    python src/tools/llm_report.py                       # all projects
+    python src/tools/llm_report.py --project TestProject999
+    python src/tools/llm_report.py --project TestProject999 --csv report.csv
+"""
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Latency and spend of the model calls per project and stage")
+    parser.add_argument('--project', help="only this project (default: all projects)")
+    parser.add_argument('--csv', help="also write the report to this csv file")
+    args = parser.parse_args(argv)
+
+    report = LlmCallsDb().report(args.project)
+    if report.empty:
+        print("No model calls recorded")
+        return
+
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(report.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    totals = report.groupby('project_name')[['calls', 'prompt_tokens', 'completion_tokens', 'estimated_cost']].sum()
+    print("\nTotals per project:")
+    print(totals.to_string(float_format=lambda value: f"{value:.4f}"))
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+        print(f"\nReport written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os, sys, re, time, hashlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.tools.token_counter import TokenCounter
+
+logger = PokoLogger()
+
+"""
+Streaming of the answers of the AI providers (opt-in with stream_responses in config.py).
+The tokens of every call are written as they arrive to a .part file next to the output file of the agent
+(outline.txt, chapters.txt, summary_total.txt), so a long answer can be followed while it is generated
+and a timeout or a crash leaves the partial answer on disk instead of losing it.
+When the answer is complete the .part file is removed and the agent writes the answer to the output file
+in the usual order, a failed call keeps its .part file.
+Time to first token and tokens per second are logged for every call and returned with the answer.
+
+Usage:
+    content, stats = stream_chat(client, params, part_file_path(output_file, "batch 3", prompt), ScriptIdentifier.CHAPTER)
+    content, stats = stream_gemini(chat_session, prompt, part_file_path(output_file, pdf_file, prompt), ScriptIdentifier.SUMMARIZER)
+"""
+
+
+def part_file_path(output_file: str, label: str, prompt: str = "") -> str:
+    """Part file of one call, the hash of the prompt keeps the calls running at the same time apart"""
+    name = re.sub(r'[^0-9A-Za-z_-]+', '_', label).strip('_') or 'call'
+    digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]
+    return f"{output_file}.{name}.{digest}.part"
+
+
+class PartFile:
+    """Tokens of one streamed answer, flushed to disk as they arrive"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def write(self, text: str) -> None:
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # a retry of the same call starts the file again
+            self.file = open(self.path, 'w', encoding='utf-8')
+        self.file.write(text)
+        self.file.flush()
+
+    def close(self, keep: bool) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            if not keep:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+
+
+def _stats(start: float, first_token: Optional[float], content: str, output_tokens: Optional[int],
+           prompt_tokens: Optional[int]) -> Dict:
+    elapsed = time.perf_counter() - start
+    if not output_tokens:
+        output_tokens = TokenCounter().count_tokens(content) if content else 0
+    generation = elapsed - (first_token - start) if first_token is not None else elapsed
+    return {
+        'ttft': round(first_token - start, 3) if first_token is not None else None,
+        'seconds': round(elapsed, 3),
+        'prompt_tokens': prompt_tokens,
+        'output_tokens': output_tokens,
+        'tokens_per_second': round(output_tokens / generation, 1) if generation > 0 else None,
+    }
+
+
+def _log_stats(script_id: ScriptIdentifier, stats: Dict) -> None:
+    ttft = f"{stats['ttft']:.2f}s" if stats['ttft'] is not None else "n/a"
+    logger.info(script_id, f"Streamed answer: first token after {ttft}, {stats['output_tokens']} tokens "
+                f"in {stats['seconds']:.1f}s ({stats['tokens_per_second']} tokens/s)")
+
+
+def stream_chat(client, params: Dict, part_file: str, script_id: ScriptIdentifier) -> Tuple[str, Dict]:
+    """Streamed chat completion of an OpenAI compatible client (openai, deepseek), returns (content, stats)"""
+    sink = PartFile(part_file)
+    start = time.perf_counter()
+    first_token = None
+    pieces = []
+    usage = None
+    try:
+        stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **params)
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                pieces.append(text)
+                sink.write(text)
+    except Exception:
+        sink.close(keep=True)
+        if pieces:
+            logger.warning(script_id, f"Stream interrupted, partial answer kept in {part_file}")
+        raise
+    sink.close(keep=False)
+
+    content = ''.join(pieces)
+    stats = _stats(start, first_token, content, getattr(usage, 'completion_tokens', None),
+                   getattr(usage, 'prompt_tokens', None))
+    _log_stats(script_id, stats)
+    return content, stats
+
+
+def stream_gemini(chat_session, prompt: str, part_file: str, script_id: ScriptIdentifier) -> Tuple[str, Dict]:
+    """Streamed message of a Gemini chat session, returns (content, stats)"""
+    sink = PartFile(part_file)
+    start = time.perf_counter()
+    first_token = None
+    pieces = []
+    try:
+        response = chat_session.send_message(prompt, stream=True)
+        for chunk in response:
+            text = getattr(chunk, 'text', '')
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                pieces.append(text)
+                sink.write(text)
+    except Exception:
+        sink.close(keep=True)
+        if pieces:
+            logger.warning(script_id, f"Stream interrupted, partial answer kept in {part_file}")
+        raise
+    sink.close(keep=False)
+
+    content = ''.join(pieces)
+    usage = getattr(response, 'usage_metadata', None)
+    stats = _stats(start, first_token, content, getattr(usage, 'candidates_token_count', None),
+                   getattr(usage, 'prompt_token_count', None))
+    _log_stats(script_id, stats)
+    return content, stats
@@ -0,0 +1,144 @@
+import sys, time, queue, atexit, threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import current_span
+from src.config import SystemPars, TelemetryPars
+from src.tools.retry_policy import current_attempt
+
+logger = PokoLogger()
+
+"""
+Telemetry of the model calls of all agents, stored in ai_schema.llm_calls.
+Every attempt of a call is one row: stage, provider, model, prompt/completion tokens as reported by the API,
+latency, time to first token of streamed answers, retries before the attempt, cache hit, error and the
+estimated cost from the prices of TelemetryPars.
+record() only puts the row in a queue, a background thread writes the rows in batches so the database is
+never on the path of the model calls. The rows left in the queue are written when the process exits.
+The report of the table is printed with: python src/tools/llm_report.py --project <name>
+
+Usage:
+    telemetry = LLMTelemetry()
+    started = time.perf_counter()
+    response = client.chat.completions.create(...)
+    telemetry.record('chapter_batch', 'deepseek', 'deepseek-chat', started, usage_tokens(response))
+"""
+
+
+def usage_tokens(response) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt, completion) tokens of an OpenAI compatible or Gemini response, None if it has no usage"""
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        return getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        return getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None)
+    return None, None
+
+
+class LLMTelemetry:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(LLMTelemetry, cls).__new__(cls)
+                cls._instance._setup()
+        return cls._instance
+
+    def _setup(self):
+        pars = TelemetryPars()
+        self.enabled = pars.enabled
+        self.batch_size = pars.batch_size
+        self.flush_seconds = pars.flush_seconds
+        self.prices = pars.prices
+        self.project_name = SystemPars().project_name
+        self.queue = queue.Queue()
+        self.writer = None
+        self.stopped = threading.Event()
+
+    def estimate_cost(self, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+        price = self.prices.get(model)
+        if price is None or (prompt_tokens is None and completion_tokens is None):
+            return None
+        return round(((prompt_tokens or 0) * price['input'] + (completion_tokens or 0) * price['output']) / 1_000_000, 6)
+
+    def record(self, stage: str, provider: str, model: str, started: Optional[float] = None,
+               tokens: Tuple[Optional[int], Optional[int]] = (None, None), ttft: Optional[float] = None,
+               cache_hit: bool = False, error: Optional[Exception] = None) -> None:
+        """
+        Queue the row of one attempt. started is the time.perf_counter() before the call,
+        ttft the seconds to the first token of a streamed answer
+        """
+        prompt_tokens, completion_tokens = tokens
+        current_span().add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if not self.enabled:
+            return
+        self.queue.put({
+            'project_name': self.project_name,
+            'stage': stage,
+            'provider': provider,
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency_ms': int((time.perf_counter() - started) * 1000) if started is not None else 0,
+            'ttft_ms': int(ttft * 1000) if ttft is not None else None,
+            'retries': current_attempt(),
+            'cache_hit': cache_hit,
+            'success': error is None,
+            'error': str(error)[:1000] if error is not None else None,
+            'estimated_cost': 0.0 if cache_hit else self.estimate_cost(model, prompt_tokens, completion_tokens),
+        })
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        if self.writer is not None:
+            return
+        with self._lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._run, name="llm-telemetry", daemon=True)
+                self.writer.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            rows = self._take(self.flush_seconds)
+            if rows:
+                self._write(rows)
+
+    def _take(self, timeout: float) -> list:
+        """Up to batch_size rows, waits at most timeout seconds for the first one"""
+        rows = []
+        try:
+            rows.append(self.queue.get(timeout=timeout))
+            while len(rows) < self.batch_size:
+                rows.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return rows
+
+    def _write(self, rows: list) -> None:
+        try:
+            from src.db_ai.ai_db_manager import LlmCallsDb
+            LlmCallsDb().insert_calls(rows)
+        except Exception as e:
+            # telemetry must never stop the pipeline, the rows are dropped
+            logger.error(ScriptIdentifier.TELEMETRY, f"Error writing {len(rows)} llm call rows: {e}")
+
+    def flush(self) -> None:
+        """Write the queued rows now (from the calling thread)"""
+        rows = self._take(0)
+        while rows:
+            self._write(rows)
+            rows = self._take(0)
+
+    def close(self) -> None:
+        self.stopped.set()
+        if self.writer is not None:
+            self.writer.join(timeout=self.flush_seconds + 5)
+        self.flush()
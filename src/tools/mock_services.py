@@ -0,0 +1,296 @@
+import re, json, time, random, hashlib, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+"""
+Local stand-in for the external services of PokoScribe, used by the pipeline benchmark.
+One HTTP server answers the OpenAI compatible chat completions API (also streamed) and the search APIs of
+CrossRef, OpenAlex and CORE with synthetic but deterministic data. Every answer waits the configured latency
+(plus a random jitter) and error_rate of the requests get a 429, 500 or 503 with a short Retry-After,
+so the retry, rate limit and circuit breaker paths run as they do against the real services.
+
+Paths:
+    POST /v1/chat/completions       openai      (api_base_urls['openai'] = <url>/v1)
+    POST /chat/completions          deepseek    (api_base_urls['deepseek'] = <url>)
+    GET  /crossref/works            crossref
+    GET  /openalex/works            openalex
+    POST /core/search/works         core
+
+Usage:
+    with MockServices(llm_latency_ms=300, error_rate=0.05) as services:
+        services.api_base_urls()      # {'openai': 'http://127.0.0.1:PORT/v1', 'deepseek': ...}
+        services.search_api_urls()    # {'crossref': ..., 'openalex': ..., 'core': ...}
+        ...
+        services.stats()              # requests, errors and bytes per service
+"""
+
+WORDS = ('employee satisfaction productivity organizational performance engagement turnover workplace psychology '
+         'motivation wellbeing leadership culture outcome analysis evidence survey sample regression effect model '
+         'study results data method theory framework research findings significant relationship business').split()
+
+ERROR_STATUSES = (429, 500, 503)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.services.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.services.handle(self, 'POST')
+
+
+class MockServices:
+    def __init__(self, llm_latency_ms: float = 200.0, search_latency_ms: float = 50.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, answer_words: int = 300, results_per_query: int = 100,
+                 seed: int = 0, host: str = '127.0.0.1', port: int = 0):
+        self.llm_latency_ms = llm_latency_ms
+        self.search_latency_ms = search_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.answer_words = answer_words
+        self.results_per_query = results_per_query
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.services = self
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def api_base_urls(self) -> dict:
+        return {'openai': f"{self.url}/v1", 'deepseek': self.url}
+
+    def search_api_urls(self) -> dict:
+        return {
+            'crossref': f"{self.url}/crossref/works",
+            'openalex': f"{self.url}/openalex/works",
+            'core': f"{self.url}/core/search/works",
+        }
+
+    def start(self) -> 'MockServices':
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-services", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {service: dict(counter) for service, counter in self.counters.items()}
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.counters = {}
+
+    def _count(self, service: str, error: bool, size: int) -> None:
+        with self.lock:
+            counter = self.counters.setdefault(service, {'requests': 0, 'errors': 0, 'bytes': 0})
+            counter['requests'] += 1
+            counter['errors'] += error
+            counter['bytes'] += size
+
+    def _wait(self, latency_ms: float) -> None:
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep(max(0.0, latency_ms + jitter) / 1000)
+
+    def _fails(self):
+        """Status of an injected error, or None"""
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.random.choice(ERROR_STATUSES)
+        return None
+
+    # ---------------------------------------------------------
+    # request handling
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        url = urlparse(request.path)
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        routes = {
+            ('POST', '/v1/chat/completions'): ('openai', self._chat),
+            ('POST', '/chat/completions'): ('deepseek', self._chat),
+            ('GET', '/crossref/works'): ('crossref', self._crossref),
+            ('GET', '/openalex/works'): ('openalex', self._openalex),
+            ('POST', '/core/search/works'): ('core', self._core),
+        }
+        service, answer = routes.get((method, url.path), (None, None))
+        if service is None:
+            self._send_json(request, 404, {'error': {'message': f"unknown path {url.path}"}})
+            return
+
+        self._wait(self.llm_latency_ms if answer == self._chat else self.search_latency_ms)
+        status = self._fails()
+        if status is not None:
+            size = self._send_json(request, status, {'error': {'message': f"injected error {status}",
+                                                               'type': 'mock_error'}},
+                                   headers={'Retry-After': '0.1'})
+            self._count(service, True, size)
+            return
+        try:
+            payload = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            payload = {}
+        size = answer(request, parse_qs(url.query), payload)
+        self._count(service, False, size)
+
+    def _send_json(self, request, status: int, data: dict, headers: dict = None) -> int:
+        raw = json.dumps(data).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(raw)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(raw)
+        return len(raw)
+
+    # ---------------------------------------------------------
+    # chat completions
+
+    def _answer(self, prompt: str) -> str:
+        """Deterministic answer of answer_words words for the prompt, with a citation marker for the summarizer"""
+        rng = random.Random(hashlib.sha1(prompt.encode('utf-8')).hexdigest())
+        words = [rng.choice(WORDS) for _ in range(self.answer_words)]
+        lines = [' '.join(words[i:i + 15]) for i in range(0, len(words), 15)]
+        return f"-!Author et al. ({rng.randint(2000, 2024)})-!\n" + '\n'.join(lines)
+
+    def _chat(self, request, query: dict, payload: dict) -> int:
+        prompt = '\n'.join(str(message.get('content', '')) for message in payload.get('messages', []))
+        content = self._answer(prompt)
+        model = payload.get('model', 'mock')
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': self.answer_words,
+                 'total_tokens': len(prompt) // 4 + self.answer_words}
+        created = int(time.time())
+        if not payload.get('stream'):
+            return self._send_json(request, 200, {
+                'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+        # server-sent events, the answer is sent in pieces of a few words, the connection is closed at the end
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+        request.close_connection = True
+        size = 0
+        words = content.split(' ')
+        for i in range(0, len(words), 8):
+            piece = ' '.join(words[i:i + 8]) + (' ' if i + 8 < len(words) else '')
+            size += self._event(request, {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk',
+                                          'created': created, 'model': model,
+                                          'choices': [{'index': 0, 'delta': {'content': piece},
+                                                       'finish_reason': None}]})
+        size += self._event(request, {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': created,
+                                      'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            size += self._event(request, {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk',
+                                          'created': created, 'model': model, 'choices': [], 'usage': usage})
+        request.wfile.write(b"data: [DONE]\n\n")
+        request.wfile.flush()
+        return size
+
+    @staticmethod
+    def _event(request, data: dict) -> int:
+        raw = f"data: {json.dumps(data)}\n\n".encode('utf-8')
+        request.wfile.write(raw)
+        request.wfile.flush()
+        return len(raw)
+
+    # ---------------------------------------------------------
+    # search APIs, the n-th work of a keyword is the same paper in every source so the dedup has work to do
+
+    def _work(self, keyword: str, n: int) -> dict:
+        slug = re.sub(r'[^a-z0-9]+', '-', keyword.lower()).strip('-')
+        rng = random.Random(f"{self.seed}:{slug}:{n}")
+        return {
+            'doi': f"10.5555/{slug}.{n}",
+            'title': f"{keyword.title()} and {rng.choice(WORDS)} {rng.choice(WORDS)}: study {n}",
+            'abstract': ' '.join(rng.choice(WORDS) for _ in range(60)) + f" {keyword}",
+            'year': rng.randint(2005, 2024),
+            'authors': [(rng.choice(['Anna', 'Jan', 'Maria', 'Piotr', 'Eva']),
+                         rng.choice(['Kowalski', 'Smith', 'Novak', 'Meyer', 'Rossi'])) for _ in range(3)],
+            'citations': rng.randint(0, 400),
+            'pdf_url': f"{self.url}/pdf/{slug}.{n}.pdf",
+        }
+
+    def _crossref(self, request, query: dict, payload: dict) -> int:
+        # the select list is glued to the query with a '+', which the query string decodes to a space
+        keyword = (query.get('query.bibliographic') or [''])[0].split('select=')[0].strip().strip('"')
+        rows = int((query.get('rows') or ['20'])[0])
+        offset = int((query.get('offset') or ['0'])[0])
+        items = []
+        for n in range(offset, min(offset + rows, self.results_per_query)):
+            work = self._work(keyword, n)
+            items.append({
+                'DOI': work['doi'], 'title': [work['title']], 'abstract': work['abstract'],
+                'author': [{'given': given, 'family': family} for given, family in work['authors']],
+                'published-print': {'date-parts': [[work['year']]]}, 'type': 'journal-article',
+                'URL': f"https://doi.org/{work['doi']}", 'is-referenced-by-count': work['citations'],
+                'link': [{'URL': work['pdf_url'], 'content-type': 'application/pdf'}],
+            })
+        return self._send_json(request, 200, {'status': 'ok', 'message': {'items': items}})
+
+    def _openalex(self, request, query: dict, payload: dict) -> int:
+        keyword = (query.get('search') or [''])[0]
+        per_page = int((query.get('per-page') or ['25'])[0])
+        cursor = (query.get('cursor') or ['*'])[0]
+        page = 0 if cursor == '*' else int(cursor)
+        start = page * per_page
+        results = []
+        for n in range(start, min(start + per_page, self.results_per_query)):
+            work = self._work(keyword, n)
+            words = work['abstract'].split()
+            inverted = {}
+            for position, word in enumerate(words):
+                inverted.setdefault(word, []).append(position)
+            location = {'pdf_url': work['pdf_url'], 'source': {'display_name': 'Journal of Mock Studies',
+                                                              'host_organization_name': 'Mock Press'}}
+            results.append({
+                'id': f"https://openalex.org/W{int(hashlib.sha1(work['doi'].encode()).hexdigest()[:8], 16)}",
+                'doi': f"https://doi.org/{work['doi']}", 'title': work['title'],
+                'publication_year': work['year'], 'type': 'article', 'cited_by_count': work['citations'],
+                'authorships': [{'author': {'display_name': f"{given} {family}"}} for given, family in work['authors']],
+                'abstract_inverted_index': inverted, 'primary_location': location, 'best_oa_location': location,
+            })
+        next_cursor = str(page + 1) if start + per_page < self.results_per_query else None
+        return self._send_json(request, 200, {'meta': {'count': self.results_per_query, 'next_cursor': next_cursor},
+                                              'results': results})
+
+    def _core(self, request, query: dict, payload: dict) -> int:
+        # the query is '(search query) AND ("keyword" OR ...)', the works are made for the first keyword
+        keywords = re.findall(r'"([^"]+)"', payload.get('q', ''))
+        keyword = keywords[0] if keywords else payload.get('q', '')
+        results = []
+        for n in range(min(int(payload.get('limit', 10)), self.results_per_query)):
+            work = self._work(keyword, n)
+            results.append({
+                'title': work['title'], 'doi': work['doi'], 'yearPublished': work['year'],
+                'authors': [{'name': f"{family}, {given}"} for given, family in work['authors']],
+                'abstract': work['abstract'], 'downloadUrl': work['pdf_url'], 'publisher': 'Mock Press',
+                'journal': 'Journal of Mock Studies', 'type': 'journal-article', 'citations': work['citations'],
+            })
+        return self._send_json(request, 200, {'totalHits': len(results), 'results': results})
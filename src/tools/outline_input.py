@@ -0,0 +1,61 @@
+import os, sys, argparse
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import SystemPars
+from src.db_ai.ai_db_manager import SaveSummary
+
+logger = PokoLogger()
+
+"""
+Rebuild the input of the outliner (big_text_file) from the summaries saved in the database, in the format the
+summarizer appends them, e.g. after the file was lost or to outline only some sessions.
+The summaries are streamed from the database and written one by one, the memory used does not depend on the
+number of summaries. The file is written next to the old one and replaces it at the end.
+
+Usage:
+    python src/tools/outline_input.py                     # all sessions of the project of SystemPars
+    python src/tools/outline_input.py --sessions 3 4
+    python src/tools/outline_input.py --project other_project --output resources/output_of_ai/other.txt
+"""
+
+
+def write_outline_input(project_name: str = None, session_ids: list = None, output_file: str = None) -> int:
+    """Write the summaries of the project (of the sessions) to output_file, returns the number of summaries"""
+    sys_params = SystemPars()
+    project_name = project_name or sys_params.project_name
+    output_file = output_file or sys_params.big_text_file
+    part_file = f"{output_file}.part"
+
+    written = 0
+    try:
+        with open(part_file, 'w', encoding='utf-8') as file:
+            for pdf_file, summary in SaveSummary().iter_paper_sources(project_name, session_ids):
+                file.write(f"Summary of {pdf_file}:\n")
+                clean_summary = (summary or '').encode('utf-8', errors='ignore').decode('utf-8')
+                clean_summary = clean_summary.replace('\u2192', '->')
+                file.write(clean_summary + '\n\n')
+                file.write('----------------------------------------\n\n')
+                written += 1
+    except Exception as e:
+        logger.error(ScriptIdentifier.DATABASE, f"Error writing the summaries of project {project_name}: {e}")
+        if os.path.exists(part_file):
+            os.remove(part_file)
+        raise
+    os.replace(part_file, output_file)
+    logger.info(ScriptIdentifier.DATABASE, f"Wrote {written} summaries of project {project_name} to {output_file}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the input of the outliner from the summaries in the database")
+    parser.add_argument('--project', help="project name, default SystemPars().project_name")
+    parser.add_argument('--sessions', type=int, nargs='+', help="only the summaries of these sessions")
+    parser.add_argument('--output', help="output file, default SystemPars().big_text_file")
+    args = parser.parse_args()
+
+    count = write_outline_input(args.project, args.sessions, args.output)
+    print(f"{count} summaries written")
@@ -0,0 +1,181 @@
+import sys, os, time, zlib, sqlite3, hashlib, threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import span
+from src.config import SystemPars
+
+logger = PokoLogger()
+
+"""
+Text extraction of PDF files shared by the summarizer and the token counter.
+PyPDF2 parses pages in pure python, so documents with many pages are split in page ranges that are
+extracted in a pool of processes and the pages are joined once at the end.
+The extracted text is kept in a local SQLite cache. A file is found again by (path, size, mtime) without
+reading it, or by the sha256 of its content after it was moved or copied, so a rerun does not parse it again.
+
+Usage:
+    pdf_extractor = PDFExtractor()
+    result = pdf_extractor.extract('resources/summary_agent/input/book.pdf')
+    result['text'], result['pages']
+"""
+
+
+def _extract_pages(file_path: str, start: int, end: int) -> list:
+    """Text of the pages start..end-1, runs in the worker processes"""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(file_path)
+    pages = []
+    for page in reader.pages[start:end]:
+        extracted_text = page.extract_text()
+        if extracted_text:
+            # Clean and normalize text
+            pages.append(extracted_text.encode('utf-8', errors='ignore').decode('utf-8'))
+    return pages
+
+
+def file_sha256(file_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class PDFExtractor:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(PDFExtractor, cls).__new__(cls)
+                cls._instance._setup()
+        return cls._instance
+
+    def _setup(self):
+        sys_params = SystemPars()
+        self.workers = sys_params.pdf_extract_workers
+        self.pages_per_task = sys_params.pdf_pages_per_task
+        self.parallel_min_pages = sys_params.pdf_parallel_min_pages
+        self.cache_enabled = sys_params.pdf_cache_enabled
+        self.cache_path = Path(sys_params.pdf_cache_path)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.conn = None
+        self.db_lock = threading.Lock()
+        if not self.cache_enabled:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.cache_path), check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS texts (
+                    sha256 TEXT PRIMARY KEY,
+                    pages INTEGER NOT NULL,
+                    text BLOB NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            self.conn.commit()
+        except Exception as e:
+            logger.error(ScriptIdentifier.PDFEXTRACTOR, f"Error opening PDF text cache, caching disabled: {e}")
+            self.cache_enabled = False
+            self.conn = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self.pool
+
+    def _cached(self, file_path: str, stat) -> tuple:
+        """Look up the cache, returns (result or None, sha256 or None)"""
+        with self.db_lock:
+            row = self.conn.execute("SELECT size, mtime, sha256 FROM files WHERE path = ?", (file_path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            sha = row[2]
+        else:
+            sha = file_sha256(file_path)
+        with self.db_lock:
+            text_row = self.conn.execute("SELECT pages, text FROM texts WHERE sha256 = ?", (sha,)).fetchone()
+            if text_row:
+                self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                                  (file_path, stat.st_size, stat.st_mtime, sha))
+                self.conn.commit()
+                return {'text': zlib.decompress(text_row[1]).decode('utf-8'), 'pages': text_row[0]}, sha
+        return None, sha
+
+    def _store(self, file_path: str, stat, sha: str, result: dict) -> None:
+        with self.db_lock:
+            self.conn.execute("INSERT OR REPLACE INTO texts (sha256, pages, text, created) VALUES (?, ?, ?, ?)",
+                              (sha, result['pages'], zlib.compress(result['text'].encode('utf-8')), time.time()))
+            self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                              (file_path, stat.st_size, stat.st_mtime, sha))
+            self.conn.commit()
+
+    def _parse(self, file_path: str) -> dict:
+        from PyPDF2 import PdfReader
+
+        page_count = len(PdfReader(file_path).pages)
+        if self.workers <= 1 or page_count < self.parallel_min_pages:
+            pages = _extract_pages(file_path, 0, page_count)
+        else:
+            ranges = [(start, min(start + self.pages_per_task, page_count))
+                      for start in range(0, page_count, self.pages_per_task)]
+            pool = self._get_pool()
+            futures = [pool.submit(_extract_pages, file_path, start, end) for start, end in ranges]
+            pages = [page for future in futures for page in future.result()]
+        return {'text': ''.join(pages), 'pages': page_count}
+
+    def extract(self, file_path: str) -> dict:
+        """Text and page count of the PDF, from the cache when the file was extracted before"""
+        with span('extract', file=os.path.basename(file_path)) as trace:
+            result = self._extract(os.path.abspath(file_path))
+            trace.set(pages=result['pages'], bytes=len(result['text']), cached=result.get('cached', False))
+        return result
+
+    def _extract(self, file_path: str) -> dict:
+        stat = os.stat(file_path)
+        sha = None
+        if self.cache_enabled:
+            try:
+                result, sha = self._cached(file_path, stat)
+                if result is not None:
+                    logger.info(ScriptIdentifier.PDFEXTRACTOR, f"Text of {os.path.basename(file_path)} found in cache")
+                    return dict(result, cached=True)
+            except Exception as e:
+                logger.warning(ScriptIdentifier.PDFEXTRACTOR, f"Error reading PDF text cache: {e}")
+
+        start_time = time.perf_counter()
+        result = self._parse(file_path)
+        logger.info(ScriptIdentifier.PDFEXTRACTOR,
+                    f"Extracted {result['pages']} pages of {os.path.basename(file_path)} in {time.perf_counter() - start_time:.2f}s")
+
+        if self.cache_enabled and result['text'].strip():
+            try:
+                self._store(file_path, stat, sha or file_sha256(file_path), result)
+            except Exception as e:
+                logger.warning(ScriptIdentifier.PDFEXTRACTOR, f"Error writing PDF text cache: {e}")
+        return result
+
+    def close(self) -> None:
+        """Shut down the worker processes"""
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
@@ -0,0 +1,420 @@
+import os, sys, json, time, random, shutil, argparse, platform, tempfile, textwrap, statistics, subprocess
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from src.config import SystemPars, RateLimitPars, RetryPars, LoggingPars
+from src.tools.mock_services import MockServices, WORDS
+
+"""
+Offline benchmark of the PokoScribe pipeline. The stages run against MockServices (local stand-in of the
+chat completions API and of CrossRef, OpenAlex and CORE) on a synthetic corpus in a temporary workspace,
+with a null database in place of Postgres, so no API key, network or database is needed.
+
+Stages:
+    summarizer  PDFSummarizer over --pdfs generated PDF files
+    outliner    DeepSeekOutliner / ChatGPTOutliner over a generated summary file of --summary-words words
+    chapter     DeepSeekChapterMaker / ChatGPTChapterMaker over the same file
+    ahss        AHSSMain over the keywords and search queries of the config
+
+For every stage the JSON result has the wall time, throughput, latency percentiles of the model calls
+(llm_call spans of the trace), the requests and injected errors per mocked service and the span counts
+(db operations, file appends...). The configured rate limits are replaced by high limits and the retry
+delays are shortened unless --real-limits is given, so the benchmark measures the pipeline and not the budgets.
+The tiktoken encoding must be in the local tiktoken cache (it is after one normal run).
+
+Usage:
+    python src/tools/pipeline_benchmark.py --output baseline.json
+    python src/tools/pipeline_benchmark.py --stages summarizer,ahss --llm-latency-ms 500 --error-rate 0.05
+    python src/tools/pipeline_benchmark.py --compare baseline.json
+"""
+
+STAGES = ['summarizer', 'outliner', 'chapter', 'ahss']
+
+
+# ---------------------------------------------------------
+# null database, the managers get a pool whose connections accept every statement and return no rows
+
+class NullCursor:
+    def __init__(self, counters: dict):
+        self.counters = counters
+        self.query = ''
+        self.description = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.query = str(query)
+        self.counters['statements'] += 1
+
+    def fetchone(self):
+        # a new session id (INSERT ... RETURNING) is the only single row read that needs a value
+        return (1,) if 'RETURNING' in self.query.upper() else None
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size=None):
+        return []
+
+    def close(self):
+        pass
+
+
+class NullConnection:
+    closed = False
+
+    def __init__(self, counters: dict):
+        self.counters = counters
+
+    def cursor(self, *args, **kwargs):
+        return NullCursor(self.counters)
+
+    def commit(self):
+        self.counters['commits'] += 1
+
+    def rollback(self):
+        pass
+
+
+class NullPool:
+    def __init__(self):
+        self.counters = {'connections': 0, 'statements': 0, 'rows': 0, 'commits': 0}
+
+    def getconn(self):
+        self.counters['connections'] += 1
+        return NullConnection(self.counters)
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+
+def install_null_db() -> NullPool:
+    from src.db_ai.ai_db_manager import AIDbManager
+    pool = NullPool()
+
+    def bulk_insert(self, cursor, table, columns, rows, suffix='', fetch=False):
+        # the real one needs a psycopg2 cursor to build the statement, the rows are only counted
+        pool.counters['statements'] += 1
+        pool.counters['rows'] += len(rows)
+        return [(True,)] * len(rows) if fetch else len(rows)
+
+    AIDbManager._pool = pool
+    AIDbManager._bulk_insert = bulk_insert
+    return pool
+
+
+# ---------------------------------------------------------
+# configuration of the run
+
+def override_pars(pars_class, **values) -> None:
+    """Every new instance of the config class gets the values, dicts are merged into the configured ones"""
+    init = pars_class.__init__
+
+    def patched_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        for key, value in values.items():
+            current = getattr(self, key, None)
+            if isinstance(current, dict) and isinstance(value, dict):
+                value = {**current, **value}
+            setattr(self, key, value)
+    pars_class.__init__ = patched_init
+
+
+def configure(services: MockServices, args) -> None:
+    override_pars(SystemPars,
+                  project_name='PokoBenchmark',
+                  api_base_urls=services.api_base_urls(),
+                  search_api_urls=services.search_api_urls(),
+                  llm_cache_enabled=False,
+                  pdf_cache_enabled=False,
+                  resume_from_checkpoints=False,
+                  stream_responses=args.stream)
+    override_pars(LoggingPars, trace_enabled=True, trace_file='logs/pokoscribe_trace.jsonl')
+    if not args.real_limits:
+        unlimited = {'requests_per_second': 1000.0, 'tokens_per_minute': None}
+        override_pars(RateLimitPars, limits={provider: unlimited for provider in RateLimitPars().limits},
+                      default_limit=unlimited)
+        override_pars(RetryPars, base_delay=0.05, max_delay=0.5, circuit_reset_timeout=1.0)
+    for key in ('DEEPSEEK_API_KEY', 'OPENAI_API_KEY', 'CORE_API_KEY'):
+        os.environ[key] = 'benchmark'
+    os.environ.setdefault('MY_MAIL', 'benchmark@example.org')
+
+
+# ---------------------------------------------------------
+# synthetic corpus
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(' '.join(rng.choice(WORDS) for _ in range(length)).capitalize() + '.')
+        words -= length
+    return ' '.join(sentences)
+
+
+def write_pdf(path: str, pages: list) -> None:
+    """Minimal PDF with one Helvetica text page per item of pages"""
+    def escape(line):
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] "
+               f"/Count {len(pages)} >>".encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        stream = ("BT /F1 9 Tf 11 TL 40 800 Td " +
+                  ' '.join(f"({escape(line)}) Tj T*" for line in textwrap.wrap(text, 100)) + " ET").encode('latin-1')
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def write_text(path: str, text: str) -> None:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def prepare_workspace(args) -> dict:
+    """Prompt files at the configured paths, the PDF corpus and the summary file, relative to the workspace"""
+    rng = random.Random(args.seed)
+    pars = SystemPars()
+    for path in (pars.prompts_summarization, pars.role_of_bot_summarization, pars.citation_sum,
+                 pars.role_of_bot_outliner, pars.prompts_single_batch, pars.prompts_final_synthesis,
+                 pars.prompts_chapter, pars.role_of_bot_chapter, pars.prompts_synthesis_chapter):
+        write_text(path, f"Benchmark instruction for {os.path.basename(path)}. " + synthetic_text(rng, 80))
+    os.makedirs('resources/output_of_ai', exist_ok=True)
+
+    folders = {name: os.path.join('benchmark', name) for name in ('input', 'completed', 'incompleted')}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    for n in range(args.pdfs):
+        write_pdf(os.path.join(folders['input'], f"paper_{n:04d}.pdf"),
+                  [synthetic_text(rng, args.pdf_words_per_page) for _ in range(args.pdf_pages)])
+    write_text(pars.big_text_file, '\n\n'.join(synthetic_text(rng, 500) for _ in range(max(1, args.summary_words // 500))))
+    return folders
+
+
+# ---------------------------------------------------------
+# stages
+
+def run_summarizer(args, folders: dict) -> int:
+    from src.agents.ai_summarizer import PDFSummarizer
+    summarizer = PDFSummarizer(folders['input'], os.path.join('benchmark', 'summaries.txt'), 'benchmark',
+                               folders['completed'], folders['incompleted'], args.provider)
+    summarizer.process_pdfs(args.provider)
+    return summarizer.completedfiles
+
+
+def run_outliner(args, folders: dict) -> int:
+    from src.agents.ai_outliner import DeepSeekOutliner, ChatGPTOutliner
+    outliner = DeepSeekOutliner() if args.provider == 'deepseek' else ChatGPTOutliner()
+    outliner.outline_it()
+    return len(outliner.cached_responses)
+
+
+def run_chapter(args, folders: dict) -> int:
+    from src.agents.chapter_maker import DeepSeekChapterMaker, ChatGPTChapterMaker
+    maker = DeepSeekChapterMaker() if args.provider == 'deepseek' else ChatGPTChapterMaker()
+    maker.make_chapter()
+    return len(maker.cached_responses)
+
+
+def run_ahss(args, folders: dict) -> int:
+    from src.tools.ahss import AHSSMain
+    return len(AHSSMain().run_search().metadata)
+
+
+RUNNERS = {'summarizer': run_summarizer, 'outliner': run_outliner, 'chapter': run_chapter, 'ahss': run_ahss}
+UNITS = {'summarizer': 'pdfs', 'outliner': 'batches', 'chapter': 'batches', 'ahss': 'papers'}
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))], 1)
+    return {'p50': pick(50), 'p90': pick(90), 'p95': pick(95), 'p99': pick(99),
+            'max': round(ordered[-1], 1), 'mean': round(statistics.fmean(ordered), 1)}
+
+
+def new_spans(trace_file: str, offset: int) -> tuple:
+    """Spans written after offset and the new offset of the trace file"""
+    from logs.pokotrace import TraceWriter
+    TraceWriter().close()
+    if not os.path.exists(trace_file):
+        return [], offset
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        f.seek(offset)
+        lines = f.read()
+        offset = f.tell()
+    spans = []
+    for line in lines.splitlines():
+        try:
+            spans.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return spans, offset
+
+
+def run_stage(stage: str, args, folders: dict, services: MockServices, db: NullPool, trace_offset: int) -> tuple:
+    services.reset_stats()
+    db_before = dict(db.counters) if db else {}
+    started = time.perf_counter()
+    error = None
+    try:
+        items = RUNNERS[stage](args, folders)
+    except Exception as e:
+        items, error = 0, f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - started
+
+    spans, trace_offset = new_spans(LoggingPars().trace_file, trace_offset)
+    span_counts = {}
+    for s in spans:
+        span_counts[s['name']] = span_counts.get(s['name'], 0) + 1
+    calls = [s['duration_ms'] for s in spans if s['name'] == 'llm_call']
+    result = {
+        'seconds': round(seconds, 3),
+        'items': items,
+        'unit': UNITS[stage],
+        'items_per_second': round(items / seconds, 3) if seconds else None,
+        'llm_call_latency_ms': percentiles(calls),
+        'llm_call_attempts': sum(s.get('attempts', 1) for s in spans if s['name'] == 'llm_call'),
+        'services': services.stats(),
+        'spans': dict(sorted(span_counts.items())),
+    }
+    if db:
+        result['db'] = {key: db.counters[key] - db_before.get(key, 0) for key in db.counters}
+    if error:
+        result['error'] = error
+    return result, trace_offset
+
+
+def git_version() -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=str(project_root), capture_output=True,
+                                  text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ''
+    return {'commit': git('rev-parse', '--short', 'HEAD') or None, 'dirty': bool(git('status', '--porcelain', '-uno'))}
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"\n{'stage':<12} {'baseline s':>11} {'now s':>9} {'change':>8}   {'baseline/s':>11} {'now/s':>9}")
+    for stage, now in results['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before:
+            continue
+        change = (now['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0.0
+        print(f"{stage:<12} {before['seconds']:>11.2f} {now['seconds']:>9.2f} {change:>+7.1f}%   "
+              f"{before.get('items_per_second') or 0:>11.2f} {now.get('items_per_second') or 0:>9.2f}")
+
+
+def print_results(results: dict) -> None:
+    print(f"{'stage':<12} {'seconds':>9} {'items':>7} {'items/s':>9} {'calls':>6} {'errors':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage, result in results['stages'].items():
+        requests = sum(service['requests'] for service in result['services'].values())
+        errors = sum(service['errors'] for service in result['services'].values())
+        latency = result['llm_call_latency_ms']
+        print(f"{stage:<12} {result['seconds']:>9.2f} {result['items']:>7} {result['items_per_second'] or 0:>9.2f} "
+              f"{requests:>6} {errors:>7} {latency.get('p50', 0):>8.1f} {latency.get('p95', 0):>8.1f} "
+              f"{latency.get('p99', 0):>8.1f}" + (f"  ERROR {result['error']}" if 'error' in result else ''))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the PokoScribe pipeline against local mock services")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"comma separated, from {', '.join(STAGES)}")
+    parser.add_argument('--provider', choices=['deepseek', 'openai'], default='deepseek')
+    parser.add_argument('--pdfs', type=int, default=20, help="number of generated PDF files")
+    parser.add_argument('--pdf-pages', type=int, default=5)
+    parser.add_argument('--pdf-words-per-page', type=int, default=400)
+    parser.add_argument('--summary-words', type=int, default=60000, help="size of the summary file of outliner and chapter")
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0)
+    parser.add_argument('--search-latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="random extra latency up to this value")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with 429/500/503")
+    parser.add_argument('--answer-words', type=int, default=300)
+    parser.add_argument('--stream', action='store_true', help="run with stream_responses")
+    parser.add_argument('--real-limits', action='store_true', help="keep the configured rate limits and retry delays")
+    parser.add_argument('--real-db', action='store_true', help="write to the configured Postgres instead of the null db")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="write the JSON results to this file")
+    parser.add_argument('--compare', default=None, help="JSON results of an earlier run to compare with")
+    parser.add_argument('--keep-workspace', action='store_true')
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    output = Path(args.output).resolve() if args.output else None
+    baseline = json.loads(Path(args.compare).read_text(encoding='utf-8')) if args.compare else None
+
+    cwd = os.getcwd()
+    workspace = tempfile.mkdtemp(prefix='pokobench-')
+    services = MockServices(args.llm_latency_ms, args.search_latency_ms, args.jitter_ms, args.error_rate,
+                            args.answer_words, seed=args.seed).start()
+    try:
+        # every relative path of the config (prompts, outputs, logs, trace, caches) points into the workspace
+        os.chdir(workspace)
+        configure(services, args)
+        folders = prepare_workspace(args)
+        db = None if args.real_db else install_null_db()
+
+        results = {
+            'version': git_version(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {key: value for key, value in vars(args).items()
+                         if key not in ('output', 'compare', 'keep_workspace')},
+            'stages': {},
+        }
+        trace_offset = 0
+        for stage in stages:
+            results['stages'][stage], trace_offset = run_stage(stage, args, folders, services, db, trace_offset)
+    finally:
+        services.stop()
+        os.chdir(cwd)
+        if args.keep_workspace:
+            print(f"Workspace kept in {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    print_results(results)
+    if baseline:
+        compare(results, baseline)
+    if output:
+        output.write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"\nResults written to {output}")
+    return 1 if any('error' in result for result in results['stages'].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import sys, time, threading
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import RateLimitPars
+
+logger = PokoLogger()
+
+"""
+Shared rate limiter for every external API the system calls (AI models and academic sources).
+Each provider has a token bucket for requests per second and optionally one for tokens per minute.
+When a provider answers with 429 or a Retry-After header the provider is paused and its rates are
+lowered, every successful call slowly gives the configured rate back.
+
+Usage:
+    rate_limiter = RateLimiter()
+    rate_limiter.acquire('crossref')             # blocks until a request is allowed
+    rate_limiter.acquire('openai', tokens=3000)  # request plus tokens budget
+    rate_limiter.report_success('openai')
+    rate_limiter.report_error('openai', e)       # adapts on 429 / Retry-After
+"""
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not headers:
+        return None
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+        return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str, max_output_tokens: int = 0) -> int:
+    """Cheap token estimate (about 4 characters per token) for the tokens per minute budget"""
+    return len(text) // 4 + max_output_tokens
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # units added per second
+        self.capacity = capacity
+        self.available = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket and return the seconds to wait until it is covered"""
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        self.available -= amount
+        if self.available >= 0:
+            return 0.0
+        return -self.available / self.rate
+
+
+class ProviderLimiter:
+    def __init__(self, provider: str, requests_per_second: float, tokens_per_minute: Optional[float],
+                 pars: RateLimitPars):
+        self.provider = provider
+        self.base_rps = requests_per_second
+        self.base_tpm = tokens_per_minute
+        self.pars = pars
+        self.factor = 1.0
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+
+    def _apply_factor(self):
+        self.requests.rate = self.base_rps * self.factor
+        if self.tokens:
+            self.tokens.rate = self.base_tpm / 60 * self.factor
+
+    def acquire(self, tokens: int = 0) -> float:
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, retry_after: Optional[float] = None):
+        with self.lock:
+            self.factor = max(self.pars.min_rate_factor, self.factor * self.pars.backoff_factor)
+            self._apply_factor()
+            pause = retry_after if retry_after is not None else 1 / self.requests.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        logger.warning(ScriptIdentifier.RATELIMITER,
+                       f"{self.provider} throttled, pausing {pause:.1f}s and lowering rate to {self.factor:.0%} of budget")
+
+    def success(self):
+        if self.factor >= 1.0:
+            return
+        with self.lock:
+            self.factor = min(1.0, self.factor + self.pars.recovery_step)
+            self._apply_factor()
+
+
+class RateLimiter:
+    """Process wide registry of rate limiters keyed per provider"""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(RateLimiter, cls).__new__(cls)
+                cls._instance.pars = RateLimitPars()
+                cls._instance.providers = {}
+        return cls._instance
+
+    def _get(self, provider: str) -> ProviderLimiter:
+        limiter = self.providers.get(provider)
+        if limiter is None:
+            with self._lock:
+                limiter = self.providers.get(provider)
+                if limiter is None:
+                    limit = self.pars.limits.get(provider, self.pars.default_limit)
+                    limiter = ProviderLimiter(provider, limit['requests_per_second'],
+                                              limit.get('tokens_per_minute'), self.pars)
+                    self.providers[provider] = limiter
+        return limiter
+
+    def acquire(self, provider: str, tokens: int = 0) -> float:
+        """Block until the provider allows one more request (and the given tokens), returns the seconds waited"""
+        return self._get(provider).acquire(tokens)
+
+    def report_success(self, provider: str):
+        self._get(provider).success()
+
+    def report_throttled(self, provider: str, retry_after: Optional[float] = None):
+        self._get(provider).throttled(retry_after)
+
+    def check_response(self, provider: str, response) -> bool:
+        """Adapt to a requests response, returns True if the provider throttled the request"""
+        if response.status_code == 429 or (response.status_code == 503 and 'Retry-After' in response.headers):
+            self.report_throttled(provider, retry_after_seconds(response.headers))
+            return True
+        self.report_success(provider)
+        return False
+
+    def report_error(self, provider: str, error: Exception) -> bool:
+        """Adapt to an exception of an API client, returns True if it was a throttling error"""
+        response = getattr(error, 'response', None)
+        status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+        if status == 429 or 'ResourceExhausted' in type(error).__name__:
+            self.report_throttled(provider, retry_after_seconds(getattr(response, 'headers', None)))
+            return True
+        return False
@@ -0,0 +1,172 @@
+import sys, time, random, threading
+from pathlib import Path
+from typing import Callable, Optional
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import span
+from src.config import RetryPars
+from src.tools.rate_limiter import retry_after_seconds
+
+logger = PokoLogger()
+
+"""
+Retry policy shared by the agents for calls to the AI providers.
+Only transient errors are retried (timeouts, connection errors, 408/409/425/429/5xx answers),
+with exponential backoff and full jitter, or the Retry-After of the answer when it has one.
+Every provider has a circuit breaker: after circuit_failure_threshold transient failures in a row the
+provider is not called for circuit_reset_timeout seconds, then one trial call decides if it is closed again.
+
+Usage:
+    retry_policy = RetryPolicy()
+    content = retry_policy.call('deepseek', lambda: client.chat.completions.create(...), ScriptIdentifier.CHAPTER, "batch 3")
+"""
+
+
+_attempts = threading.local()
+
+
+def current_attempt() -> int:
+    """Retries made before the attempt running in this thread, 0 outside of RetryPolicy.call"""
+    return getattr(_attempts, 'value', 0)
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker of the provider is open, the call was not sent"""
+
+
+class CircuitBreaker:
+    def __init__(self, provider: str, failure_threshold: int, reset_timeout: float):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Raises CircuitOpenError when the call must not be sent, returns True when it is the trial call"""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_running:
+                raise CircuitOpenError(f"Circuit of {self.provider} is open after {self.failures} failures")
+            # half open, let one trial call through
+            self.trial_running = True
+            return True
+
+    def end_trial(self) -> None:
+        with self.lock:
+            self.trial_running = False
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(ScriptIdentifier.RETRYPOLICY, f"Circuit of {self.provider} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                logger.error(ScriptIdentifier.RETRYPOLICY, f"Circuit of {self.provider} opened for "
+                             f"{self.reset_timeout:.0f}s after {self.failures} failures")
+            self.trial_running = False
+
+
+class CircuitBreakers:
+    """Process wide registry of circuit breakers keyed per provider"""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(CircuitBreakers, cls).__new__(cls)
+                cls._instance.pars = RetryPars()
+                cls._instance.breakers = {}
+        return cls._instance
+
+    def get(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(provider)
+            if breaker is None:
+                breaker = CircuitBreaker(provider, self.pars.circuit_failure_threshold, self.pars.circuit_reset_timeout)
+                self.breakers[provider] = breaker
+            return breaker
+
+
+class RetryPolicy:
+    TRANSIENT_NAMES = ('Timeout', 'APIConnectionError', 'ConnectionError', 'ServiceUnavailable',
+                       'InternalServerError', 'ResourceExhausted', 'DeadlineExceeded')
+
+    def __init__(self, extra_retryable: tuple = ()):
+        pars = RetryPars()
+        self.max_retries = pars.max_retries
+        self.base_delay = pars.base_delay
+        self.max_delay = pars.max_delay
+        self.retryable_status_codes = set(pars.retryable_status_codes)
+        self.extra_retryable = extra_retryable
+        self.breakers = CircuitBreakers()
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Transient errors that can succeed when the same call is sent again"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, (TimeoutError, ConnectionError) + tuple(self.extra_retryable)):
+            return True
+        response = getattr(error, 'response', None)
+        status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+        if status is not None:
+            return status in self.retryable_status_codes
+        return any(name in type(error).__name__ for name in self.TRANSIENT_NAMES)
+
+    def delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Retry-After of the answer if given, otherwise exponential backoff with full jitter"""
+        response = getattr(error, 'response', None)
+        retry_after = retry_after_seconds(getattr(response, 'headers', None))
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, provider: str, func: Callable, script_id: ScriptIdentifier, description: str = "call"):
+        breaker = self.breakers.get(provider)
+        with span('llm_call', provider=provider, call=description) as trace:
+            return self._call(breaker, provider, func, script_id, description, trace)
+
+    def _call(self, breaker: CircuitBreaker, provider: str, func: Callable, script_id: ScriptIdentifier,
+              description: str, trace):
+        try:
+            for attempt in range(self.max_retries + 1):
+                trial = breaker.before_call()
+                _attempts.value = attempt
+                trace.set(attempts=attempt + 1)
+                try:
+                    result = func()
+                except Exception as e:
+                    retryable = self.is_retryable(e)
+                    # a trial call that fails for any reason keeps the circuit open
+                    if retryable or trial:
+                        breaker.record_failure()
+                    if not retryable or attempt == self.max_retries:
+                        raise
+                    error = e
+                else:
+                    breaker.record_success()
+                    return result
+                finally:
+                    # on every way out of the trial (also KeyboardInterrupt), so the next call can be a trial again
+                    if trial:
+                        breaker.end_trial()
+                wait = self.delay(attempt, error)
+                logger.warning(script_id, f"Retry {attempt + 1}/{self.max_retries} of {description} "
+                               f"to {provider} in {wait:.1f}s: {error}")
+                time.sleep(wait)
+        finally:
+            _attempts.value = 0
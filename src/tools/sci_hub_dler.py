@@ -1,8 +1,9 @@
 import re
 import sys
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 
 import requests
@@ -16,9 +17,11 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 from logs.pokolog import *
 from src.db_ai.ai_db_manager import *
+from src.tools.rate_limiter import RateLimiter
 
 load_dotenv('.env')
 logger = PokoLogger()
+rate_limiter = RateLimiter()
 
 class SciHubDler:
     PDF_SELECTORS = [
@@ -36,9 +39,19 @@ class SciHubDler:
         allowed_methods=["GET", "POST"]
     )
 
+    PDF_MAGIC = b'%PDF'
+
     def __init__(self):
+        sys_params = SystemPars()
+        self.workers = sys_params.scihub_workers
+        self.chunk_size = sys_params.scihub_chunk_size
+        self.resume_attempts = sys_params.scihub_resume_attempts
+        self.db_batch_size = sys_params.scihub_db_batch_size
+        # one session shared by all download threads, its connection pool is sized for the workers
         self.session = requests.Session()
-        self.session.mount('https://', HTTPAdapter(max_retries=self.RETRY_STRATEGY))
+        adapter = HTTPAdapter(max_retries=self.RETRY_STRATEGY, pool_maxsize=max(10, self.workers))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
@@ -76,21 +89,61 @@ class SciHubDler:
         clean_title = self.sanitize_filename(title)
         return self.DEFAULT_DOWNLOAD_DIR / f"{metadata_id}_{clean_title}.pdf"
 
-    def download_paper(
-        self,
-        doi: str,
-        title: str,
-        metadata_id: int,
-        scihub_url: str = DEFAULT_SCIHUB_URL,
-        throttle_delay: int = 3
-    ) -> bool:
-        """Download a paper from Sci-Hub with retry logic and proper resource management."""
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """GET request paced by the shared rate limiter of Sci-Hub"""
+        rate_limiter.acquire('scihub')
+        response = self.session.get(url, **kwargs)
+        rate_limiter.check_response('scihub', response)
+        return response
+
+    def _stream_to_file(self, pdf_url: str, file_path: Path) -> bool:
+        """
+        Stream the PDF to a .part file in chunks and rename it when complete.
+        An existing .part file is continued with a Range request, also after a broken connection.
+        """
+        part_path = file_path.with_name(file_path.name + '.part')
+        for attempt in range(self.resume_attempts + 1):
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with self._get(pdf_url, timeout=60, stream=True, headers=headers) as pdf_response:
+                    if pdf_response.status_code == 416:
+                        # the part file already has the whole body
+                        break
+                    pdf_response.raise_for_status()
+                    # 206 continues the part file, 200 means the server sent the whole file again
+                    mode = 'ab' if offset and pdf_response.status_code == 206 else 'wb'
+                    with open(part_path, mode) as f:
+                        for chunk in pdf_response.iter_content(chunk_size=self.chunk_size):
+                            if chunk:
+                                f.write(chunk)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.resume_attempts:
+                    raise
+                self.logger.warning(ScriptIdentifier.SCIHUB, f"Download of {pdf_url} interrupted, resuming: {e}")
+
+        with open(part_path, 'rb') as f:
+            if f.read(len(self.PDF_MAGIC)) != self.PDF_MAGIC:
+                part_path.unlink()
+                self.logger.error(ScriptIdentifier.SCIHUB, f"Downloaded file from {pdf_url} is not a PDF")
+                return False
+        part_path.replace(file_path)
+        return True
+
+    def _fetch_paper(self, doi: str, title: str, metadata_id: int, scihub_url: str) -> bool:
+        """Find the PDF of the DOI on Sci-Hub and stream it to the download folder"""
         doi = doi.strip()
         if not doi:
             self.logger.error(ScriptIdentifier.SCIHUB, "Empty DOI provided")
             return False
 
         try:
+            file_path = self._construct_filename(metadata_id, title)
+            if file_path.exists():
+                self.logger.info(ScriptIdentifier.SCIHUB, f"Already downloaded: {file_path}")
+                return True
+
             # Normalize Sci-Hub URL
             scihub_url = scihub_url.strip('/')
             if not scihub_url.startswith(('http://', 'https://')):
@@ -100,7 +153,7 @@ class SciHubDler:
             search_url = f"{scihub_url}/{doi}"
             self.logger.info(ScriptIdentifier.SCIHUB, f"Searching: {search_url}")
 
-            response = self.session.get(search_url, timeout=30)
+            response = self._get(search_url, timeout=30)
             response.raise_for_status()
 
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -118,19 +171,9 @@ class SciHubDler:
             self.logger.info(ScriptIdentifier.SCIHUB, f"Found PDF URL: {pdf_url}")
 
             # Download PDF
-            pdf_response = self.session.get(pdf_url, timeout=60)
-            pdf_response.raise_for_status()
-
-            # Save file
-            file_path = self._construct_filename(metadata_id, title)
-            file_path.write_bytes(pdf_response.content)
+            if not self._stream_to_file(pdf_url, file_path):
+                return False
             self.logger.info(ScriptIdentifier.SCIHUB, f"Saved: {file_path}")
-
-            # Update database
-            self.db_manager.update_filtered_metadata_succeeded_dl(metadata_id)
-            self.logger.info(ScriptIdentifier.SCIHUB, f"Updated metadata for {title}")
-            
-            time.sleep(throttle_delay)
             return True
 
         except requests.exceptions.RequestException as e:
@@ -138,4 +181,60 @@ class SciHubDler:
             return False
         except Exception as e:
             self.logger.error(ScriptIdentifier.SCIHUB, f"Unexpected error: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    def download_paper(
+        self,
+        doi: str,
+        title: str,
+        metadata_id: int,
+        scihub_url: str = DEFAULT_SCIHUB_URL
+    ) -> bool:
+        """Download a paper from Sci-Hub with retry logic and proper resource management."""
+        if not self._fetch_paper(doi, title, metadata_id, scihub_url):
+            return False
+        try:
+            # Update database
+            self.db_manager.update_filtered_metadata_succeeded_dl(metadata_id)
+            self.logger.info(ScriptIdentifier.SCIHUB, f"Updated metadata for {title}")
+            return True
+        except Exception as e:
+            self.logger.error(ScriptIdentifier.SCIHUB, f"Unexpected error: {str(e)}")
+            return False
+
+    def download_many(self, papers: List[Dict], scihub_url: str = DEFAULT_SCIHUB_URL) -> List[int]:
+        """
+        Download papers ({'doi', 'title', 'metadata_id'}) with scihub_workers concurrent downloads.
+        The downloaded papers are marked in filtered_sources in batches of scihub_db_batch_size.
+        Returns the metadata ids of the downloaded papers.
+        """
+        downloaded, pending = [], []
+        pending_lock = threading.Lock()
+
+        def flush(force: bool = False):
+            with pending_lock:
+                if not pending or (len(pending) < self.db_batch_size and not force):
+                    return
+                batch = pending[:]
+                pending.clear()
+            try:
+                self.db_manager.update_filtered_metadata_succeeded_dl_many(batch)
+            except Exception as e:
+                self.logger.error(ScriptIdentifier.SCIHUB, f"Error updating metadata of {len(batch)} papers: {e}")
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="scihub") as pool:
+            futures = {
+                pool.submit(self._fetch_paper, paper['doi'], paper['title'], paper['metadata_id'], scihub_url): paper
+                for paper in papers
+            }
+            for future in as_completed(futures):
+                paper = futures[future]
+                if future.result():
+                    downloaded.append(paper['metadata_id'])
+                    with pending_lock:
+                        pending.append(paper['metadata_id'])
+                    flush()
+        flush(force=True)
+
+        self.logger.info(ScriptIdentifier.SCIHUB, f"Downloaded {len(downloaded)} of {len(papers)} papers")
+        return downloaded
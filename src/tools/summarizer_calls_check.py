@@ -0,0 +1,111 @@
+import os, sys, math, random, shutil, argparse, tempfile, threading
+from collections import Counter
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from src.config import SystemPars
+from src.tools.pipeline_benchmark import install_null_db, override_pars, synthetic_text, write_pdf, write_text
+
+"""
+Regression check of the chunked summarization: every chunk of a document is summarized exactly once,
+so PDFSummarizer.calls_per_document must equal the number of chunks of the document (one more call when
+reduce_chunk_summaries merges the chunk summaries). AISummarizer.summarize is replaced by a stub that counts
+the calls per document, the PDFs are generated in a temporary workspace and the database is the null
+database of the pipeline benchmark, so no API key, network or database is needed.
+The tiktoken encoding must be in the local tiktoken cache (it is after one normal run).
+
+Usage:
+    python src/tools/summarizer_calls_check.py
+    python src/tools/summarizer_calls_check.py --chunk-tokens 500 --pages 1 2 7 --workers 1
+"""
+
+
+def expected_calls(pdf_file: str, chunk_tokens: int, reduce: bool) -> int:
+    """Calls the summarizer must make for the document, counted from the same text and encoding it uses"""
+    from src.tools.pdf_extractor import PDFExtractor
+    from src.tools.token_counter import get_encoding
+
+    tokens = len(get_encoding().encode(PDFExtractor().extract(pdf_file)['text']))
+    if tokens < chunk_tokens:
+        return 1
+    chunks = math.ceil(tokens / chunk_tokens)
+    return chunks + 1 if reduce and chunks > 1 else chunks
+
+
+def run_check(args, reduce: bool) -> list:
+    from src.agents.ai_summarizer import PDFSummarizer, AISummarizer
+
+    folders = {name: os.path.join('check', f"{name}_{int(reduce)}") for name in ('input', 'completed', 'incompleted')}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    rng = random.Random(args.seed)
+    for pages in args.pages:
+        write_pdf(os.path.join(folders['input'], f"paper_{pages:03d}_pages.pdf"),
+                  [synthetic_text(rng, args.words_per_page) for _ in range(pages)])
+    pdf_files = {f: os.path.join(folders['input'], f) for f in os.listdir(folders['input'])}
+    expected = {f: expected_calls(path, args.chunk_tokens, reduce) for f, path in pdf_files.items()}
+
+    calls = Counter()
+    lock = threading.Lock()
+
+    def summarize(self, text, worked_model, stream_file=None, label='summary'):
+        with lock:
+            calls[label] += 1
+        return f"-!Author ({label})-! Summary of {len(text)} characters."
+
+    original = AISummarizer.summarize
+    AISummarizer.summarize = summarize
+    try:
+        summarizer = PDFSummarizer(folders['input'], os.path.join('check', 'summaries.txt'), 'check',
+                                   folders['completed'], folders['incompleted'], args.provider)
+        summarizer.limittokens = args.chunk_tokens
+        summarizer.reduce_chunk_summaries = reduce
+        summarizer.workers = args.workers
+        summarizer.process_pdfs(args.provider)
+    finally:
+        AISummarizer.summarize = original
+
+    results = []
+    for f, path in sorted(pdf_files.items()):
+        counted = summarizer.calls_per_document.get(path, 0)
+        results.append({'file': f, 'reduce': reduce, 'expected': expected[f], 'calls_per_document': counted,
+                        'stub_calls': calls[f], 'ok': expected[f] == counted == calls[f]})
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that chunked documents make one summarizer call per chunk")
+    parser.add_argument('--provider', choices=['deepseek', 'openai'], default='deepseek')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 3, 8], help="pages of the generated PDFs")
+    parser.add_argument('--words-per-page', type=int, default=400)
+    parser.add_argument('--chunk-tokens', type=int, default=1000, help="token limit per call of the check")
+    parser.add_argument('--workers', type=int, default=4, help="documents summarized at the same time")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    workspace = tempfile.mkdtemp(prefix='pokocheck-')
+    try:
+        # the prompt files and outputs of the config are relative paths, they point into the workspace
+        os.chdir(workspace)
+        override_pars(SystemPars, project_name='PokoCheck', llm_cache_enabled=False, pdf_cache_enabled=False)
+        install_null_db()
+        pars = SystemPars()
+        for path in (pars.prompts_summarization, pars.role_of_bot_summarization, pars.citation_sum):
+            write_text(path, f"Check instruction for {os.path.basename(path)}.")
+        results = run_check(args, False) + run_check(args, True)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"{'file':<26} {'reduce':>6} {'expected':>8} {'counted':>8} {'stub':>6}")
+    for result in results:
+        print(f"{result['file']:<26} {str(result['reduce']):>6} {result['expected']:>8} "
+              f"{result['calls_per_document']:>8} {result['stub_calls']:>6}  {'ok' if result['ok'] else 'FAIL'}")
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,76 @@
-import tiktoken
-import pandas as pd
 import json
 from pathlib import Path
-from PyPDF2 import PdfReader
-import os
+import os, threading
 from logs.pokolog import PokoLogger, ScriptIdentifier
+from src.config import SystemPars
+from src.tools.pdf_extractor import PDFExtractor
+from src.tools.lazy_imports import lazy_module
+
+tiktoken = lazy_module('tiktoken')
+pd = lazy_module('pandas')
 
 logger = PokoLogger()
 
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    """tiktoken encoding of the model, loaded once per process and shared by all TokenCounter instances"""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(model)
+            if encoding is None:
+                encoding = tiktoken.encoding_for_model(model)
+                _encodings[model] = encoding
+    return encoding
+
 class TokenCounter:
     def __init__(self, model="gpt-3.5-turbo"):
-        self.encoding = tiktoken.encoding_for_model(model)
+        self.encoding = get_encoding(model)
+        self.threads = SystemPars().tokenizer_threads
         self.summary_file = "resources/output_of_ai/summary_total.txt"
         
     def count_tokens(self, text: str) -> int:
         """Count tokens in a text string"""
         return len(self.encoding.encode(text))
+
+    def count_many(self, texts: list) -> list:
+        """Count tokens of many strings at once, tiktoken encodes them in parallel threads"""
+        if not texts:
+            return []
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, num_threads=self.threads)]
+
+    def split_with_counts(self, text: str, limit: int, separator: str = '\n\n') -> list:
+        """
+        Split the text on the separator (paragraphs) and pack the parts in batches of at most limit tokens.
+        A part longer than the limit becomes a batch on its own. Returns a list of (batch, tokens).
+        """
+        paragraphs = text.split(separator)
+        batches, current_batch, current_tokens = [], [], 0
+        for paragraph, para_tokens in zip(paragraphs, self.count_many(paragraphs)):
+            if current_batch and current_tokens + para_tokens > limit:
+                batches.append((separator.join(current_batch), current_tokens))
+                current_batch, current_tokens = [], 0
+            current_batch.append(paragraph)
+            current_tokens += para_tokens
+        if current_batch:
+            batches.append((separator.join(current_batch), current_tokens))
+        return batches
+
+    def split_into_batches(self, text: str, limit: int, separator: str = '\n\n') -> list:
+        """Split the text in batches of paragraphs of at most limit tokens"""
+        return [batch for batch, _ in self.split_with_counts(text, limit, separator)]
     
     def count_pdf(self, file_path: str) -> dict:
         """Count tokens in a PDF file"""
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        
-        tokens = self.count_tokens(text)
+        extracted = PDFExtractor().extract(file_path)
+        tokens = self.count_tokens(extracted['text'])
         return {
             'file': os.path.basename(file_path),
             'tokens': tokens,
-            'pages': len(reader.pages),
-            'tokens_per_page': tokens / len(reader.pages)
+            'pages': extracted['pages'],
+            'tokens_per_page': tokens / extracted['pages']
         }
     
     def count_csv(self, file_path: str) -> dict:
@@ -0,0 +1,146 @@
+import sys, json, argparse
+from pathlib import Path
+from collections import defaultdict
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from src.config import LoggingPars
+
+"""
+Flame-style breakdown of one run of the trace file written by logs/pokotrace.py.
+The spans are grouped by their path of names (summarize_pdf > llm_call) and every line shows the total and the
+self time (time not spent in child spans), the count, the share of the run and the bytes and tokens of the spans.
+Spans of concurrent workers overlap, so the children of a stage can add up to more than the stage itself.
+
+Usage:
+    python src/tools/trace_report.py                  # latest run
+    python src/tools/trace_report.py --list
+    python src/tools/trace_report.py --run 20250101-120000-a1b2c3 --min-percent 1
+"""
+
+BAR_WIDTH = 30
+
+
+def trace_files(path: Path) -> list:
+    """The trace file and its rotated backups (trace_file.1, .2 ...), oldest first"""
+    backups = sorted((p for p in path.parent.glob(f"{path.name}.*") if p.suffix[1:].isdigit()),
+                     key=lambda p: int(p.suffix[1:]), reverse=True)
+    return backups + ([path] if path.exists() else [])
+
+
+def read_spans(path: str) -> list:
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                # a line cut by a killed process
+                continue
+    return spans
+
+
+def list_runs(spans: list) -> list:
+    runs = {}
+    for s in spans:
+        run = runs.setdefault(s['run_id'], {'run_id': s['run_id'], 'start': s['start'], 'end': 0.0, 'spans': 0})
+        run['start'] = min(run['start'], s['start'])
+        run['end'] = max(run['end'], s['start'] + s['duration_ms'] / 1000)
+        run['spans'] += 1
+    return sorted(runs.values(), key=lambda r: r['start'])
+
+
+def aggregate(spans: list) -> tuple:
+    """Totals per name path, and the wall time of the run in ms"""
+    by_id = {s['span_id']: s for s in spans}
+    child_ms = defaultdict(float)
+    for s in spans:
+        if s['parent_id'] in by_id:
+            child_ms[s['parent_id']] += s['duration_ms']
+
+    def path_of(s):
+        names = [s['name']]
+        while s['parent_id'] in by_id:
+            s = by_id[s['parent_id']]
+            names.append(s['name'])
+        return tuple(reversed(names))
+
+    totals = defaultdict(lambda: {'ms': 0.0, 'self_ms': 0.0, 'count': 0, 'errors': 0, 'bytes': 0,
+                                  'tokens': 0})
+    for s in spans:
+        node = totals[path_of(s)]
+        node['ms'] += s['duration_ms']
+        node['self_ms'] += max(0.0, s['duration_ms'] - child_ms[s['span_id']])
+        node['count'] += 1
+        node['errors'] += 'error' in s
+        node['bytes'] += s.get('bytes') or 0
+        node['tokens'] += (s.get('tokens') or 0) + (s.get('prompt_tokens') or 0) + (s.get('completion_tokens') or 0)
+
+    start = min(s['start'] for s in spans)
+    end = max(s['start'] + s['duration_ms'] / 1000 for s in spans)
+    return totals, (end - start) * 1000
+
+
+def print_report(totals: dict, run_ms: float, min_percent: float) -> None:
+    print(f"{'stage':<44} {'total ms':>11} {'self ms':>11} {'count':>6} {'% run':>6} {'bytes':>11} {'tokens':>9}")
+
+    def children(path):
+        return sorted((p for p in totals if len(p) == len(path) + 1 and p[:len(path)] == path),
+                      key=lambda p: totals[p]['ms'], reverse=True)
+
+    def show(path):
+        node = totals[path]
+        percent = node['ms'] / run_ms * 100 if run_ms else 0.0
+        if percent < min_percent:
+            return
+        label = '  ' * (len(path) - 1) + path[-1] + (f" ({node['errors']} errors)" if node['errors'] else '')
+        bar = '#' * min(BAR_WIDTH, round(percent / 100 * BAR_WIDTH))
+        print(f"{label:<44} {node['ms']:>11.1f} {node['self_ms']:>11.1f} {node['count']:>6} {percent:>5.1f}% "
+              f"{node['bytes'] or '':>11} {node['tokens'] or '':>9} {bar}")
+        for child in children(path):
+            show(child)
+
+    for root in children(()):
+        show(root)
+    print(f"\nwall time of the run: {run_ms:.1f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Flame-style breakdown of a PokoScribe trace")
+    parser.add_argument('--file', default=LoggingPars().trace_file, help="trace file (JSON lines)")
+    parser.add_argument('--run', default=None, help="run id, the latest run by default")
+    parser.add_argument('--list', action='store_true', help="list the runs in the trace file")
+    parser.add_argument('--min-percent', type=float, default=0.0, help="hide stages under this share of the run")
+    args = parser.parse_args(argv)
+
+    path = Path(args.file)
+    files = trace_files(path)
+    if not files:
+        print(f"No trace file at {path}")
+        return 1
+    # a run can continue over a rotation of the trace file
+    spans = [s for file in files for s in read_spans(str(file))]
+    runs = list_runs(spans)
+    if not runs:
+        print(f"No spans in {path}")
+        return 1
+
+    if args.list:
+        for run in runs:
+            print(f"{run['run_id']}  {run['spans']:>7} spans  {(run['end'] - run['start']):>9.1f} s")
+        return 0
+
+    run_id = args.run or runs[-1]['run_id']
+    spans = [s for s in spans if s['run_id'] == run_id]
+    if not spans:
+        print(f"Run {run_id} not found, use --list")
+        return 1
+    print(f"Run {run_id}: {len(spans)} spans\n")
+    totals, run_ms = aggregate(spans)
+    print_report(totals, run_ms, args.min_percent)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import PokoLogger, ScriptIdentifier
+from logs.pokotrace import span, in_current_span
+from src.tools.token_counter import TokenCounter
+
+logger = PokoLogger()
+
+"""
+Token aware hierarchical reduce of partial AI outputs (batch outlines, batch chapters).
+The parts are grouped in order so that the synthesis prompt of every group stays under the token limit,
+every group of two or more parts is synthesized (the groups of a level in parallel) and the results are
+reduced again until everything fits in one prompt, whose synthesis is the final result.
+A part that fits in no group with its neighbours goes to the next level unchanged, without a model call.
+Only when no two neighbouring parts fit together any more are the parts paired over the limit, which is logged.
+
+Usage:
+    final = tree_reduce(parts, synthesize, token_limit, prompt_tokens, workers, ScriptIdentifier.OUTLINER)
+    where synthesize(list_of_parts) -> str builds the synthesis prompt and calls the model
+"""
+
+
+def group_parts(part_tokens: List[int], budget: int) -> List[List[int]]:
+    """
+    Indexes of the parts in consecutive groups of at most budget tokens, a group is closed as soon as the
+    next part would go over the budget. A part over the budget is a group of its own.
+    """
+    groups, current, current_tokens = [], [], 0
+    for i, tokens in enumerate(part_tokens):
+        if current and current_tokens + tokens > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def pair_parts(count: int) -> List[List[int]]:
+    """Indexes of the parts in pairs of neighbours, the last part alone when the count is odd"""
+    return [list(range(i, min(i + 2, count))) for i in range(0, count, 2)]
+
+
+def tree_reduce(parts: List[str], synthesize: Callable[[List[str]], str], token_limit: int,
+                prompt_tokens: int, workers: int, script_id: ScriptIdentifier) -> str:
+    token_counter = TokenCounter()
+    budget = max(1, token_limit - prompt_tokens)
+    level = 1
+    while True:
+        part_tokens = token_counter.count_many(parts)
+        index_groups = group_parts(part_tokens, budget)
+        if len(index_groups) == 1:
+            # everything fits in one prompt (or a single part at the first level), this is the final synthesis
+            logger.info(script_id, f"Final synthesis of {len(parts)} parts ({sum(part_tokens)} tokens)")
+            return synthesize(parts)
+        if all(len(group) == 1 for group in index_groups):
+            # no two neighbours fit together, pairing them is the only way to make the next level smaller
+            index_groups = pair_parts(len(parts))
+            logger.warning(script_id, f"Synthesis level {level}: no two neighbouring parts fit in the limit of "
+                           f"{budget} tokens, {len(parts)} parts ({sum(part_tokens)} tokens) are paired over the limit")
+            if len(index_groups) == 1:
+                return synthesize(parts)
+
+        groups = [[parts[i] for i in group] for group in index_groups]
+        merged = [group for group in groups if len(group) > 1]
+        logger.info(script_id, f"Synthesis level {level}: {len(parts)} parts ({sum(part_tokens)} tokens) "
+                    f"over the limit of {budget}, reducing them in {len(merged)} groups, "
+                    f"{len(groups) - len(merged)} parts go to the next level unchanged")
+        with span('synthesis_level', level=level, groups=len(merged), tokens=sum(part_tokens)), \
+                ThreadPoolExecutor(max_workers=max(1, min(workers, len(merged))), thread_name_prefix="reduce") as pool:
+            # map keeps the order of the groups, an exception of any group stops the reduce
+            outputs = iter(list(pool.map(in_current_span(synthesize), merged)))
+        # a level has at least two groups, so the next level has at least two parts
+        parts = [next(outputs) if len(group) > 1 else group[0] for group in groups]
+        level += 1
@@ -0,0 +1,82 @@
+import sys, argparse, threading
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+from logs.pokolog import ScriptIdentifier
+from src.tools import tree_reduce as reduce_module
+
+"""
+Regression check of the hierarchical synthesis (src/tools/tree_reduce.py): the number of synthesis calls,
+no synthesis prompt over the budget unless the parts can only be paired over it, and no second synthesis of
+an already final result. The token counter is replaced by a stub (1 token = 1 character) and synthesize by a
+stub that records the tokens of every group and answers with --answer-tokens tokens, so no model, API key
+or tiktoken encoding is needed.
+
+Usage:
+    python src/tools/tree_reduce_check.py
+"""
+
+
+class CharCounter:
+    """Stand-in of TokenCounter, one token per character"""
+    def count_many(self, texts: list) -> list:
+        return [len(text) for text in texts]
+
+
+# parts (tokens), budget, expected calls, groups allowed over the budget (paired when nothing else fits)
+CASES = [
+    {'parts': [30, 30, 30], 'budget': 150, 'calls': 1, 'over_budget': 0},
+    {'parts': [100], 'budget': 150, 'calls': 1, 'over_budget': 0},
+    {'parts': [100, 100], 'budget': 150, 'calls': 1, 'over_budget': 1},
+    {'parts': [100, 100, 100], 'budget': 150, 'calls': 2, 'over_budget': 1},
+    {'parts': [40] * 10, 'budget': 150, 'calls': 4, 'over_budget': 0},
+    {'parts': [70, 70, 70, 70, 70, 70], 'budget': 150, 'calls': 4, 'over_budget': 0},
+    {'parts': [120, 20, 120, 20, 120], 'budget': 150, 'calls': 3, 'over_budget': 0},
+    {'parts': [200, 50, 50, 200], 'budget': 150, 'calls': 3, 'over_budget': 2},
+]
+
+
+def run_case(case: dict, answer_tokens: int) -> dict:
+    calls = []
+    lock = threading.Lock()
+
+    def synthesize(group: list) -> str:
+        with lock:
+            calls.append([len(part) for part in group])
+        return 's' * answer_tokens
+
+    parts = ['p' * tokens for tokens in case['parts']]
+    result = reduce_module.tree_reduce(parts, synthesize, case['budget'], 0, 4, ScriptIdentifier.MAIN)
+    over_budget = [group for group in calls if sum(group) > case['budget']]
+    # only the first synthesis of a single input part has one part, a finished synthesis is never synthesized again
+    single = [group for group in calls if len(group) == 1 and len(case['parts']) > 1]
+    return {
+        'parts': case['parts'], 'budget': case['budget'], 'calls': calls,
+        'ok': (len(calls) == case['calls'] and len(over_budget) == case['over_budget']
+               and all(len(group) == 2 for group in over_budget) and not single
+               and result == 's' * answer_tokens),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the call count and group sizes of tree_reduce")
+    parser.add_argument('--answer-tokens', type=int, default=10, help="tokens of every stub synthesis")
+    args = parser.parse_args(argv)
+
+    counter = reduce_module.TokenCounter
+    reduce_module.TokenCounter = CharCounter
+    try:
+        results = [run_case(case, args.answer_tokens) for case in CASES]
+    finally:
+        reduce_module.TokenCounter = counter
+
+    for result in results:
+        print(f"{'ok  ' if result['ok'] else 'FAIL'} parts {result['parts']} budget {result['budget']}: "
+              f"{len(result['calls'])} calls {result['calls']}")
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())